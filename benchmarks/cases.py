@@ -0,0 +1,439 @@
+"""Benchmark case registry.
+
+Each case receives the fixture image and a scratch directory, performs any
+setup outside the timed region and returns a zero-argument callable that is
+timed by the runner.
+"""
+
+import asyncio
+import atexit
+import http.client
+import io
+import json
+import os
+import threading
+from collections import namedtuple
+from urllib.parse import urlencode
+
+import numpy as np
+from PIL import Image, ImageCms
+
+from photopy_pro.filters import artistic, basic, blur, transforms
+from photopy_pro.utils.blend_modes import BLEND_MODES, blend_images
+from photopy_pro.core.commands import EditCommand, CommandProcessor
+from photopy_pro.core.histogram import HistogramService
+from photopy_pro.core.file_index import FileIndex
+from photopy_pro.core.macros import Macro
+from photopy_pro.core.autosave import Autosave
+from photopy_pro.core.snapshots import SnapshotStore, SnapshotTracker
+from photopy_pro.service.server import RenderService
+from photopy_pro.tools.text import GlyphCache, TextLayer
+from photopy_pro.utils.color_management import get_transform, srgb_profile
+from photopy_pro.utils.precision import PRECISIONS, PRECISION_UINT8, PRECISION_MAX, image_size, precision_of
+
+Case = namedtuple("Case", "name group setup max_megapixels needs_qt precisions")
+
+CASES = []
+
+# Pure-Python per-pixel filters are benchmarked on a centre crop of this size.
+SLOW_FILTER_MAX_MEGAPIXELS = 0.01
+
+IO_FORMATS = ["png", "jpg", "bmp", "tif"]
+INDEX_BENCH_FILES = 16
+
+
+def case(name, group, max_megapixels=None, needs_qt=False, precisions=(PRECISION_UINT8,)):
+    """Register a benchmark case.
+
+    Cases listing more than one precision also receive the fixture as a
+    16-bit or float document array.
+    """
+    def register(setup):
+        CASES.append(Case(name, group, setup, max_megapixels, needs_qt, precisions))
+        return setup
+    return register
+
+
+def _filter_case(name, fn, *args, max_megapixels=None, precisions=(PRECISION_UINT8,)):
+    """Register a case calling ``fn(image, *args)``."""
+    case(name, "filters", max_megapixels, precisions=precisions)(lambda img, workdir: lambda: fn(img, *args))
+
+
+def _inverted(img):
+    """Inverted copy of a fixture image or document array."""
+    if isinstance(img, Image.Image):
+        return basic.apply_invert(img)
+    out = PRECISION_MAX[precision_of(img)] - img
+    out[..., 3] = img[..., 3]
+    return out
+
+
+def _mirrored(img):
+    """Horizontally flipped copy of a fixture image or document array."""
+    if isinstance(img, Image.Image):
+        return img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    return np.ascontiguousarray(img[:, ::-1])
+
+
+# Filters ---------------------------------------------------------------------
+
+_inverse = np.arange(255, -1, -1, dtype=np.uint8)
+
+_filter_case("basic.apply_lut_to_pil", basic.apply_lut_to_pil, _inverse, _inverse, _inverse)
+
+
+@case("basic.apply_lut_to_array", "filters", precisions=PRECISIONS)
+def _lut_to_array(img, workdir):
+    """Inverting tables sized for the fixture's precision, applied to its array."""
+    arr = np.asarray(img) if isinstance(img, Image.Image) else img
+    lut = np.ascontiguousarray(basic.identity_lut(precision_of(arr))[::-1])
+    return lambda: basic.apply_lut_to_array(arr, lut, lut, lut)
+
+
+_filter_case("basic.apply_brightness_contrast", basic.apply_brightness_contrast, 20, 30,
+             precisions=PRECISIONS)
+_filter_case("basic.apply_saturation", basic.apply_saturation, 40)
+_filter_case("basic.apply_levels", basic.apply_levels, 20, 235, 1.2, precisions=PRECISIONS)
+_filter_case("basic.apply_curves", basic.apply_curves, [(0, 0), (64, 48), (192, 210), (255, 255)],
+             precisions=PRECISIONS)
+_filter_case("basic.apply_blur[r=2]", basic.apply_blur, 2, precisions=PRECISIONS)
+_filter_case("basic.apply_blur[r=12]", basic.apply_blur, 12, precisions=PRECISIONS)
+_filter_case("basic.apply_blur[r=60]", basic.apply_blur, 60, precisions=PRECISIONS)
+_filter_case("basic.apply_sharpen", basic.apply_sharpen, 150)
+_filter_case("basic.edge_detection", basic.edge_detection)
+_filter_case("basic.apply_sepia", basic.apply_sepia)
+_filter_case("basic.apply_posterize", basic.apply_posterize, 4)
+_filter_case("basic.remove_background", basic.remove_background)
+_filter_case("basic.apply_grayscale", basic.apply_grayscale)
+_filter_case("basic.apply_invert", basic.apply_invert)
+_filter_case("basic.apply_emboss", basic.apply_emboss)
+_filter_case("basic.apply_sketch", basic.apply_sketch)
+_filter_case("artistic.apply_oil_painting", artistic.apply_oil_painting,
+             max_megapixels=SLOW_FILTER_MAX_MEGAPIXELS)
+_filter_case("artistic.apply_watercolor", artistic.apply_watercolor)
+for _radius in (3, 50):
+    _filter_case(f"artistic.apply_median[r={_radius}]", artistic.apply_median, _radius)
+    _filter_case(f"artistic.apply_bilateral[r={_radius}]", artistic.apply_bilateral, _radius)
+    _filter_case(f"artistic.apply_kuwahara[r={_radius}]", artistic.apply_kuwahara, _radius)
+_filter_case("transforms.warp_image", transforms.warp_image, 10, 0.05)
+
+
+@case("transforms.perspective_transform", "filters")
+def _perspective(img, workdir):
+    w, h = img.size
+    src = [(0, 0), (w, 0), (w, h), (0, h)]
+    dst = [(w * 0.05, h * 0.1), (w * 0.95, 0), (w, h), (0, h * 0.9)]
+    return lambda: transforms.perspective_transform(img, src, dst)
+
+
+@case("transforms.seam_carve[-10% width]", "filters", precisions=PRECISIONS)
+def _seam_carve(img, workdir):
+    width, height = image_size(img)
+    return lambda: transforms.seam_carve(img, width - width // 10, height)
+
+
+@case("transforms.seam_carve[-10% width, exact]", "filters", max_megapixels=0.25)
+def _seam_carve_exact(img, workdir):
+    width, height = img.size
+    return lambda: transforms.seam_carve(img, width - width // 10, height, multires=False)
+
+
+@case("blur.gaussian_blur[sigma=40]", "filters", precisions=PRECISIONS)
+def _gaussian_blur(img, workdir):
+    arr = np.array(img)
+    return lambda: blur.gaussian_blur(arr, 40)
+
+
+# Macros ----------------------------------------------------------------------
+
+_TONE_MACRO = Macro([
+    ("brightness_contrast", {"brightness": 10, "contrast": 20}),
+    ("levels", {"black": 20, "white": 235, "gamma": 1.2}),
+    ("curves", {"points": [[0, 0], [64, 48], [192, 210], [255, 255]]}),
+])
+
+
+@case("Macro.apply[3 tone steps, fused]", "macros", precisions=PRECISIONS)
+def _macro_fused(img, workdir):
+    return lambda: _TONE_MACRO.apply(img)
+
+
+@case("Macro.apply[3 tone steps, unfused]", "macros", precisions=PRECISIONS)
+def _macro_unfused(img, workdir):
+    steps = [Macro([step]) for step in _TONE_MACRO.steps]
+
+    def run():
+        result = img
+        for macro in steps:
+            result = macro.apply(result)
+        return result
+    return run
+
+
+# Histogram -------------------------------------------------------------------
+
+@case("HistogramService.reset", "histogram")
+def _histogram_reset(img, workdir):
+    service = HistogramService()
+    return lambda: service.reset(img)
+
+
+@case("HistogramService.update[512x512 region]", "histogram")
+def _histogram_update(img, workdir):
+    service = HistogramService()
+    service.reset(img)
+    bounds = (0, 0, min(512, img.width), min(512, img.height))
+    return lambda: service.update(img, bounds)
+
+
+# Colour management -----------------------------------------------------------
+
+@case("color_management.display_transform", "color")
+def _display_transform(img, workdir):
+    transform = get_transform(srgb_profile(), srgb_profile())
+    return lambda: ImageCms.applyTransform(img, transform)
+
+
+# Blending --------------------------------------------------------------------
+
+def _blend_case(mode):
+    @case(f"blend_images[{mode}]", "blending", precisions=PRECISIONS)
+    def _blend(img, workdir):
+        top = _mirrored(img)
+        return lambda: blend_images(img, top, mode)
+
+
+for _mode in BLEND_MODES:
+    _blend_case(_mode)
+
+
+# History ---------------------------------------------------------------------
+
+@case("EditCommand[full frame]", "history", precisions=PRECISIONS)
+def _command_full(img, workdir):
+    after = _inverted(img)
+    return lambda: EditCommand(0, "invert", img, after)
+
+
+@case("EditCommand[512x512 region]", "history", precisions=PRECISIONS)
+def _command_region(img, workdir):
+    after = _inverted(img)
+    width, height = image_size(after)
+    bounds = (0, 0, min(512, width), min(512, height))
+    return lambda: EditCommand(0, "invert", img, after, bounds)
+
+
+@case("CommandProcessor.undo[full frame]", "history", precisions=PRECISIONS)
+def _undo(img, workdir):
+    after = _inverted(img)
+    command = EditCommand(0, "invert", img, after)
+
+    def run():
+        processor = CommandProcessor()
+        processor.execute(command)
+        return processor.undo(after)
+    return run
+
+
+# Selection -------------------------------------------------------------------
+
+@case("SelectionManager.magic_wand_selection", "selection", needs_qt=True)
+def _magic_wand(img, workdir):
+    from types import SimpleNamespace
+    from PyQt6.QtCore import QPointF
+    from PyQt6.QtWidgets import QGraphicsScene
+    from photopy_pro.tools.selection import SelectionManager
+
+    canvas = SimpleNamespace(scene=QGraphicsScene(), pil_image=img, record_action=lambda operation, params=None: None)
+    manager = SelectionManager(canvas)
+    point = QPointF(img.width / 2, img.height / 2)
+
+    def run():
+        manager.clear_selection()
+        manager.magic_wand_selection(point)
+    return run
+
+
+@case("flood_fill[contiguous]", "selection")
+def _flood_fill(img, workdir):
+    from photopy_pro.utils.flood_fill import flood_fill
+    arr = np.asarray(img)
+    seed = [(img.width // 2, img.height // 2)]
+    return lambda: flood_fill(arr, seed, (255, 0, 0, 255), 24)
+
+
+@case("flood_fill[global]", "selection")
+def _flood_fill_global(img, workdir):
+    from photopy_pro.utils.flood_fill import flood_fill, FILL_GLOBAL
+    arr = np.asarray(img)
+    seed = [(img.width // 2, img.height // 2)]
+    return lambda: flood_fill(arr, seed, (255, 0, 0, 255), 24, FILL_GLOBAL)
+
+
+
+# Text ------------------------------------------------------------------------
+
+@case("TextLayer.overlay[keystroke, 40 chars]", "text")
+def _text_keystroke(img, workdir):
+    cache = GlyphCache()
+    layer = TextLayer((img.width // 4, img.height // 4), "The quick brown fox jumps over the lazy")
+    layer.overlay(cache, layer.bounds(cache, caret=True))
+
+    def run():
+        # What one typed character costs: layout, bounds and the bbox-sized overlay.
+        layer.text = layer.text[:39] + "g"
+        return layer.overlay(cache, layer.bounds(cache, caret=True))
+    return run
+
+
+# I/O -------------------------------------------------------------------------
+
+def _io_cases(fmt):
+    @case(f"ImageCanvas.save_image[{fmt}]", "io", needs_qt=True)
+    def _save(img, workdir):
+        from photopy_pro.ui.canvas import ImageCanvas
+        canvas = ImageCanvas()
+        canvas.pil_image = img
+        path = os.path.join(workdir, f"bench.{fmt}")
+        return lambda: canvas.save_image(path)
+
+    @case(f"ImageCanvas.load_image[{fmt}]", "io", needs_qt=True)
+    def _load(img, workdir):
+        from photopy_pro.ui.canvas import ImageCanvas
+        canvas = ImageCanvas()
+        canvas.pil_image = img
+        path = os.path.join(workdir, f"bench.{fmt}")
+        canvas.save_image(path)
+        return lambda: canvas.load_image(path)
+
+
+for _fmt in IO_FORMATS:
+    _io_cases(_fmt)
+
+
+def _index_folder(img, workdir):
+    """Folder of JPEG copies of the fixture for the file index cases."""
+    folder = os.path.join(workdir, "index")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, "0.jpg")
+    img.convert("RGB").save(path, quality=90)
+    with open(path, "rb") as fh:
+        data = fh.read()
+    for i in range(1, INDEX_BENCH_FILES):
+        with open(os.path.join(folder, f"{i}.jpg"), "wb") as fh:
+            fh.write(data)
+    return folder
+
+
+@case(f"FileIndex.scan[cold, {INDEX_BENCH_FILES} files]", "io")
+def _index_cold(img, workdir):
+    folder = _index_folder(img, workdir)
+    return lambda: FileIndex(":memory:").scan(folder)
+
+
+@case(f"FileIndex.scan[warm, {INDEX_BENCH_FILES} files]", "io")
+def _index_warm(img, workdir):
+    folder = _index_folder(img, workdir)
+    index = FileIndex(":memory:")
+    index.scan(folder)
+    return lambda: index.scan(folder)
+
+
+@case("Autosave.flush[512x512 edit]", "io", precisions=PRECISIONS)
+def _autosave_incremental(img, workdir):
+    autosave = Autosave(os.path.join(workdir, "recovery"))
+    processor = CommandProcessor()
+    autosave.flush(img, [img], processor, {})
+    autosave._pending.result()
+    width, height = image_size(img)
+    bounds = (0, 0, min(512, width), min(512, height))
+
+    def run():
+        autosave.dirty.mark(autosave.image_ids[0], bounds)
+        autosave.flush(img, [img], processor, {})
+        autosave._pending.result()
+    return run
+
+
+def _snapshot_tracker(img, workdir):
+    """Tracker holding one snapshot of the fixture, and an edit of its top-left 512x512."""
+    tracker = SnapshotTracker(SnapshotStore(os.path.join(workdir, "snapshots")))
+    snapshot_id = tracker.take("base", img, [], {})
+    width, height = image_size(img)
+    bounds = (0, 0, min(512, width), min(512, height))
+    # Layer index -1 marks only the document, the one image tracked here.
+    return tracker, snapshot_id, EditCommand(-1, "invert", img, _inverted(img), bounds)
+
+
+@case("SnapshotTracker.take[512x512 edit]", "io", precisions=PRECISIONS)
+def _snapshot_take(img, workdir):
+    tracker, _, command = _snapshot_tracker(img, workdir)
+
+    def run():
+        tracker.on_history("execute", command)
+        return tracker.take("edit", img, [], {})
+    return run
+
+
+@case("SnapshotTracker.restore[512x512 edit]", "io", precisions=PRECISIONS)
+def _snapshot_restore(img, workdir):
+    tracker, snapshot_id, command = _snapshot_tracker(img, workdir)
+
+    def run():
+        tracker.on_history("execute", command)
+        return tracker.restore(snapshot_id, img, [])
+    return run
+
+
+# Render service ----------------------------------------------------------------
+
+_service = None
+
+
+def _local_service():
+    """A render service on a free localhost port, shared by the service cases."""
+    global _service
+    if _service is None:
+        service = RenderService("127.0.0.1", 0, max_workers=1)
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(service.start(), loop).result()
+        atexit.register(lambda: asyncio.run_coroutine_threadsafe(service.close(), loop).result())
+        _service = service
+    return _service
+
+
+@case("RenderService /render[invert, png, localhost]", "service")
+def _service_render(img, workdir):
+    service = _local_service()
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    body = buffer.getvalue()
+    target = "/render?" + urlencode({"operations": json.dumps([{"operation": "invert"}])})
+
+    def run():
+        connection = http.client.HTTPConnection("127.0.0.1", service.port, timeout=service.timeout)
+        try:
+            connection.request("POST", target, body, {"Content-Type": "image/png"})
+            response = connection.getresponse()
+            content = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {content[:200]!r}")
+        return content
+    return run
+
+
+def uncovered_filters():
+    """Instrumented filter entry points in ``filters/*`` without a benchmark case."""
+    covered = {c.name.split("[")[0] for c in CASES}
+    missing = []
+    for module in (basic, artistic, transforms, blur):
+        short = module.__name__.rsplit(".", 1)[-1]
+        for attr, value in vars(module).items():
+            is_filter = hasattr(value, "metric_name") and value.__module__ == module.__name__
+            if is_filter and f"{short}.{attr}" not in covered:
+                missing.append(f"{short}.{attr}")
+    return missing
+
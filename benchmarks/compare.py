@@ -0,0 +1,62 @@
+"""Compare two benchmark result files.
+
+Usage::
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.15
+
+Exits with status 1 when any case present in both files got slower by more
+than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.10
+
+
+def _index(document):
+    """Map (name, fixture, size, precision) to successful result records."""
+    return {
+        (r["name"], r["fixture"], r["fixture_megapixels"], r.get("precision", "uint8")): r
+        for r in document["results"]
+        if r["status"] == "ok"
+    }
+
+
+def compare(baseline, candidate, threshold=DEFAULT_THRESHOLD):
+    """Return rows of (key, base seconds, new seconds, ratio, regressed)."""
+    base, new = _index(baseline), _index(candidate)
+    rows = []
+    for key in sorted(base.keys() & new.keys(), key=lambda k: (k[2], k[1], k[0])):
+        before = base[key]["median_seconds"]
+        after = new[key]["median_seconds"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((key, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown reported as a regression.")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    with open(args.candidate, encoding="utf-8") as fh:
+        candidate = json.load(fh)
+
+    rows = compare(baseline, candidate, args.threshold)
+    for (name, fixture, size, precision), before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{size:>4} MP {fixture:<9} {precision:<7} {name:<45} {before * 1000:10.1f} -> {after * 1000:10.1f} ms "
+              f"x{ratio:5.2f}{flag}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
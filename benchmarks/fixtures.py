@@ -0,0 +1,83 @@
+"""Deterministic benchmark images at fixed resolutions."""
+
+import math
+import os
+
+import numpy as np
+import cv2
+from PIL import Image
+
+FIXTURE_KINDS = ["synthetic", "photo"]
+PHOTO_ENV_VAR = "PHOTOPY_BENCH_PHOTO"
+SEED = 1234
+
+
+def fixture_size(megapixels):
+    """Width and height of a 4:3 image with the given pixel count."""
+    height = int(math.sqrt(megapixels * 1e6 * 3 / 4))
+    width = int(megapixels * 1e6 / height)
+    return width, height
+
+
+def make_fixture(kind, megapixels):
+    """Build an RGBA fixture image of the given kind and size."""
+    width, height = fixture_size(megapixels)
+    if kind == "synthetic":
+        arr = _synthetic(width, height)
+    elif kind == "photo":
+        arr = _photographic(width, height)
+    else:
+        raise ValueError(f"Unknown fixture kind: {kind}")
+    return Image.fromarray(arr, "RGBA")
+
+
+def _synthetic(width, height):
+    """Gradients, flat blocks and uniform noise; highly compressible."""
+    rng = np.random.default_rng(SEED)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    arr = np.empty((height, width, 4), dtype=np.uint8)
+    arr[..., 0] = x[np.newaxis, :]
+    arr[..., 1] = y[:, np.newaxis]
+    arr[..., 2] = 128
+    arr[..., 3] = 255
+
+    block = max(1, min(width, height) // 8)
+    arr[block:2 * block, block:2 * block, :3] = (255, 255, 255)
+    arr[-2 * block:-block, -2 * block:-block, :3] = (20, 40, 200)
+
+    noise_rows = slice(height // 2, height // 2 + block)
+    arr[noise_rows, :, :3] = rng.integers(0, 256, (arr[noise_rows].shape[0], width, 3), dtype=np.uint8)
+    return arr
+
+
+def _photographic(width, height):
+    """A photo from PHOTOPY_BENCH_PHOTO, or procedural content with photo-like statistics."""
+    photo_path = os.environ.get(PHOTO_ENV_VAR)
+    if photo_path:
+        with Image.open(photo_path) as photo:
+            return np.array(photo.convert("RGBA").resize((width, height), Image.Resampling.LANCZOS))
+
+    rng = np.random.default_rng(SEED)
+    # Low-frequency colour field, mid-frequency texture and shot noise.
+    field = cv2.resize(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8), (width, height),
+                       interpolation=cv2.INTER_CUBIC)
+    texture = cv2.resize(rng.integers(0, 64, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8),
+                         (width, height), interpolation=cv2.INTER_LINEAR)
+    rgb = cv2.add(field, texture)
+
+    # Hard-edged objects give edge-sensitive filters something to find.
+    scale = min(width, height)
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(scale // 40 + 1, scale // 6 + 2))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(rgb, center, radius, color, -1, lineType=cv2.LINE_AA)
+
+    noise = rng.normal(0, 4, (height, width, 3)).astype(np.int16)
+    rgb = np.clip(rgb.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    arr = np.empty((height, width, 4), dtype=np.uint8)
+    arr[..., :3] = rgb
+    arr[..., 3] = 255
+    return arr
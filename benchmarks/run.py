@@ -0,0 +1,176 @@
+"""Headless benchmark runner.
+
+Usage::
+
+    python -m benchmarks.run --sizes 1 12 --output results.json
+    python -m benchmarks.run --sizes 1 --match blend --repeat 5
+    python -m benchmarks.run --sizes 12 --precisions uint8 uint16 float32
+
+Each case is timed ``--repeat`` times after one warm-up call, then run once
+more under ``tracemalloc`` to record the peak of Python/NumPy allocations
+(native OpenCV and Pillow buffers are not traced). Cases that support deep
+documents are repeated for every requested precision.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np  # noqa: E402
+import cv2  # noqa: E402
+import PIL  # noqa: E402
+
+from .cases import CASES, uncovered_filters  # noqa: E402
+from .fixtures import FIXTURE_KINDS, make_fixture  # noqa: E402
+from photopy_pro.utils.precision import (  # noqa: E402
+    PRECISIONS, PRECISION_UINT8, image_size, to_document
+)
+
+DEFAULT_SIZES = [1, 12, 48, 100]
+DEFAULT_REPEAT = 3
+
+
+def _git_revision():
+    """Current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    """Metadata stored alongside results so runs can be compared."""
+    return {
+        "commit": _git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+    }
+
+
+def _crop_to(img, megapixels):
+    """Centre crop with at most the given pixel count."""
+    width, height = image_size(img)
+    if width * height <= megapixels * 1e6:
+        return img
+    scale = (megapixels * 1e6 / (width * height)) ** 0.5
+    w, h = max(1, int(width * scale)), max(1, int(height * scale))
+    left, top = (width - w) // 2, (height - h) // 2
+    if isinstance(img, np.ndarray):
+        return img[top:top + h, left:left + w]
+    return img.crop((left, top, left + w, top + h))
+
+
+def run_case(bench_case, img, workdir, repeat):
+    """Time one case on one fixture and return its result record."""
+    if bench_case.max_megapixels is not None:
+        img = _crop_to(img, bench_case.max_megapixels)
+
+    width, height = image_size(img)
+    record = {
+        "name": bench_case.name,
+        "group": bench_case.group,
+        "megapixels": width * height / 1e6,
+    }
+    try:
+        fn = bench_case.setup(img, workdir)
+        fn()
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {str(e).strip()}")
+        return record
+
+    record.update(
+        status="ok",
+        times=times,
+        median_seconds=statistics.median(times),
+        min_seconds=min(times),
+        peak_bytes=peak,
+    )
+    return record
+
+
+def run(sizes, kinds, repeat, pattern=None, precisions=(PRECISION_UINT8,), log=sys.stderr):
+    """Run all matching cases over every fixture and return the results document."""
+    cases = [c for c in CASES if pattern is None or re.search(pattern, c.name)]
+    if any(c.needs_qt for c in cases):
+        from PyQt6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication([])  # noqa: F841
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="photopy-bench-") as workdir:
+        for size in sizes:
+            for kind in kinds:
+                fixture = make_fixture(kind, size)
+                for precision in precisions:
+                    img = to_document(fixture, precision)
+                    for bench_case in cases:
+                        if precision not in bench_case.precisions:
+                            continue
+                        record = run_case(bench_case, img, workdir, repeat)
+                        record.update(fixture=kind, fixture_megapixels=size, precision=precision)
+                        results.append(record)
+                        if record["status"] == "ok":
+                            summary = f"{record['median_seconds'] * 1000:10.1f} ms {record['peak_bytes'] / 1e6:9.1f} MB"
+                        else:
+                            summary = record["error"]
+                        print(f"{size:>4} MP {kind:<9} {precision:<7} {bench_case.name:<45} {summary}", file=log)
+                    del img
+                del fixture
+
+    return {"environment": _environment(), "results": results}
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Run PhotoPy Pro benchmarks.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES,
+                        help="Fixture sizes in megapixels.")
+    parser.add_argument("--fixtures", nargs="+", choices=FIXTURE_KINDS, default=FIXTURE_KINDS)
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=[PRECISION_UINT8],
+                        help="Document precisions to run deep-capable cases at.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--match", help="Only run cases whose name matches this regex.")
+    parser.add_argument("--output", help="Write results as JSON to this path.")
+    args = parser.parse_args(argv)
+
+    for name in uncovered_filters():
+        print(f"warning: no benchmark case for {name}", file=sys.stderr)
+
+    document = run(args.sizes, args.fixtures, args.repeat, args.match, args.precisions)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(document, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""Crash-recovery autosave.
+
+Each running editor owns a session directory under the recovery root. The
+canvas document and the layers are saved as tiled images. Edits mark the
+tiles they touch as dirty (through ``CommandProcessor`` listeners),
+and a periodic flush copies only those tiles, then compresses and appends
+them on a background thread. A flush writes three append-only logs:
+
+* ``tiles.N.log``: zlib-compressed image tiles,
+* ``history.N.log``: pickled history commands, each written once,
+* ``journal.N.log``: one JSON checkpoint per flush, listing the images,
+  where their newest tiles are and which commands form the undo and redo
+  stacks.
+
+The data logs are synced with one fsync each before the checkpoint is
+appended and synced, so a checkpoint never refers to data that is not on
+disk, however many tiles the flush wrote. When the logs grow well past the
+size of the live data, the next flush starts generation N + 1 with a full
+copy and deletes the old generation once it has a checkpoint.
+
+A clean exit deletes the session. The editor holds an OS lock on the
+session's ``lock`` file while it runs, and the OS drops it when the process
+exits, however it exits. A session whose lock can be taken is therefore
+offered for recovery on the next start.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+import numpy as np
+from PIL import Image
+
+from .file_index import cache_dir
+from .metrics import instrument
+from ..utils.tiles import DirtyTiles, image_info, pack_tile, tile_bytes, tile_rect, unpack_tile
+
+AUTOSAVE_INTERVAL_MS = 15000
+# Flushes wait until the document has been left alone this long.
+AUTOSAVE_IDLE_SECONDS = 2.0
+AUTOSAVE_TILE_SIZE = 256
+AUTOSAVE_ZLIB_LEVEL = 1
+# The logs are rewritten once they exceed this multiple of the live data...
+COMPACT_RATIO = 3
+# ...and this many bytes.
+COMPACT_MIN_BYTES = 64 * 1024 * 1024
+LOCK_FILE_NAME = "lock"
+
+# ``document`` and ``layers`` are PIL images or arrays; ``meta`` holds the
+# document path, ICC profile, layer opacities, blend modes and active layer.
+RecoveredSession = namedtuple("RecoveredSession", "path saved_at document layers meta undo_stack redo_stack")
+
+
+def default_recovery_dir():
+    """Root directory holding autosave sessions."""
+    return os.path.join(cache_dir(), "recovery")
+
+
+def _try_lock(fh):
+    """Take an exclusive lock on an open file; raises OSError if it is held."""
+    fh.seek(0)
+    if os.name == "nt":
+        msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _release_lock(fh):
+    fh.seek(0)
+    if os.name == "nt":
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _session_in_use(session_dir):
+    """Whether a running editor holds the session's lock."""
+    try:
+        with open(os.path.join(session_dir, LOCK_FILE_NAME), "r+b") as fh:
+            try:
+                _try_lock(fh)
+            except OSError:
+                return True
+            _release_lock(fh)
+            return False
+    except OSError:
+        # No lock file yet: the session is still being created.
+        return True
+
+
+def _append(fh, records):
+    """Append byte records and return their (offset, length) pairs."""
+    fh.seek(0, os.SEEK_END)
+    offset = fh.tell()
+    spans = []
+    for record in records:
+        fh.write(record)
+        spans.append((offset, len(record)))
+        offset += len(record)
+    return spans
+
+
+def _sync(fh):
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+class Autosave:
+    """Writes the changed parts of a document to a recovery session."""
+
+    def __init__(self, root=None, tile_size=AUTOSAVE_TILE_SIZE):
+        self.root = root or default_recovery_dir()
+        self.session_dir = os.path.join(self.root, uuid.uuid4().hex)
+        self.tile_size = tile_size
+        self.dirty = DirtyTiles(tile_size)
+        self.last_change = 0.0
+
+        # Stable ids of the saved images: the canvas document, then the layers
+        self.image_ids = []
+        self._image_infos = {}
+        self._next_image_id = 0
+        # Newest (offset, length) of each (image id, tx, ty) and of each command
+        self._tiles = {}
+        self._commands = weakref.WeakKeyDictionary()
+        self._meta = None
+        self._generation = 0
+        self._log_bytes = 0
+        self._compact = False
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._files = None
+        self._lock_file = None
+
+    # Change tracking ------------------------------------------------------
+
+    def on_history(self, event, command):
+        """``CommandProcessor`` listener marking the tiles a command changed."""
+        self.last_change = time.monotonic()
+        if command is None or command.layer_index + 1 >= len(self.image_ids):
+            return
+        # Edits change the canvas document and, when sizes match, the layer.
+        for image_id in (self.image_ids[0], self.image_ids[command.layer_index + 1]):
+            if command.resizes:
+                # The image gets a new id and is written in full at its new size.
+                self._image_infos.pop(image_id, None)
+            else:
+                self.dirty.mark(image_id, command.bounds)
+
+    def document_replaced(self):
+        """The document and layers were replaced (opened, converted or cleared)."""
+        self.image_ids = []
+        self.last_change = time.monotonic()
+
+    def layer_inserted(self, index):
+        """A layer was inserted at ``index``."""
+        if self.image_ids:
+            self.image_ids.insert(index + 1, self._new_image_id())
+        self.last_change = time.monotonic()
+
+    def layer_removed(self, index):
+        """The layer at ``index`` was removed."""
+        if index + 1 < len(self.image_ids):
+            image_id = self.image_ids.pop(index + 1)
+            self.dirty.discard(image_id)
+            self._image_infos.pop(image_id, None)
+        self.last_change = time.monotonic()
+
+    def _new_image_id(self):
+        self._next_image_id += 1
+        return self._next_image_id
+
+    @property
+    def busy(self):
+        """Whether a flush is still being written."""
+        return self._pending is not None and not self._pending.done()
+
+    # Flushing -------------------------------------------------------------
+
+    @instrument("autosave.flush")
+    def flush(self, document, layers, command_processor, meta):
+        """Capture what changed since the last flush and write it in the background.
+
+        Only dirty tiles are copied here, on the caller's thread; compression
+        and disk writes happen on the autosave thread. Returns False if the
+        previous flush is still running.
+        """
+        if self.busy:
+            return False
+        if self._compact:
+            self._compact = False
+            self._generation += 1
+            self._tiles = {}
+            self._commands = weakref.WeakKeyDictionary()
+            self._meta = None
+            self._image_infos = {}
+
+        images = [document, *layers]
+        if len(self.image_ids) != len(images):
+            self.image_ids = [self._new_image_id() for _ in images]
+        image_entries = []
+        for index, image in enumerate(images):
+            info = image_info(image)
+            image_id = self.image_ids[index]
+            if self._image_infos.get(image_id) != info:
+                if image_id in self._image_infos or any(key[0] == image_id for key in self._tiles):
+                    image_id = self.image_ids[index] = self._new_image_id()
+                self._image_infos[image_id] = info
+                self.dirty.mark_all(image_id, info[0], info[1])
+            image_entries.append((image_id, *info))
+
+        by_id = dict(zip(self.image_ids, images))
+        tiles = []
+        for image_id, coords in self.dirty.take().items():
+            image = by_id.get(image_id)
+            if image is None:
+                continue
+            width, height, _ = self._image_infos[image_id]
+            for tx, ty in sorted(coords):
+                rect = tile_rect(tx, ty, width, height, self.tile_size)
+                tiles.append(((image_id, tx, ty), tile_bytes(image, rect)))
+
+        commands = list(command_processor.undo_stack) + list(command_processor.redo_stack)
+        new_commands = [command for command in commands if command not in self._commands]
+        meta = dict(meta, images=image_entries)
+        meta_changed = meta != self._meta
+        self._meta = meta
+        undo, redo = list(command_processor.undo_stack), list(command_processor.redo_stack)
+
+        self._pending = self._executor.submit(self._write, self._generation, tiles, new_commands,
+                                              undo, redo, meta if meta_changed else None)
+        return True
+
+    def _write(self, generation, tiles, new_commands, undo, redo, meta):
+        """Append one flush to the logs (autosave thread)."""
+        with self._lock:
+            files = self._open(generation)
+            tile_spans = _append(files["tiles"], [pack_tile(data, AUTOSAVE_ZLIB_LEVEL) for _, data in tiles])
+            command_spans = _append(files["history"], [pickle.dumps(c, pickle.HIGHEST_PROTOCOL)
+                                                       for c in new_commands])
+            # One sync per log for the whole batch, before the checkpoint refers to it
+            _sync(files["tiles"])
+            _sync(files["history"])
+
+            for (key, _), span in zip(tiles, tile_spans):
+                self._tiles[key] = span
+            for command, span in zip(new_commands, command_spans):
+                self._commands[command] = span
+
+            live_ids = {entry[0] for entry in self._meta["images"]}
+            checkpoint = {
+                "saved_at": time.time(),
+                "tiles": [[*key, *span] for (key, _), span in zip(tiles, tile_spans)],
+                "undo": [self._commands[c] for c in undo],
+                "redo": [self._commands[c] for c in redo],
+            }
+            if meta is not None:
+                checkpoint["meta"] = dict(meta, icc_profile=(meta.get("icc_profile") or b"").hex())
+            files["journal"].write((json.dumps(checkpoint) + "\n").encode("utf-8"))
+            _sync(files["journal"])
+            if generation > 0:
+                self._remove_generation(generation - 1)
+
+            # Drop tiles of removed images and check whether it is time to compact
+            self._tiles = {key: span for key, span in self._tiles.items() if key[0] in live_ids}
+            live_bytes = sum(span[1] for span in self._tiles.values())
+            self._log_bytes = files["tiles"].tell()
+            self._compact = self._log_bytes > max(COMPACT_MIN_BYTES, COMPACT_RATIO * live_bytes)
+
+    def _open(self, generation):
+        """The log files of ``generation``, opened for appending."""
+        if self._files is not None and self._files["generation"] == generation:
+            return self._files
+        self._close_files()
+        os.makedirs(self.session_dir, exist_ok=True)
+        if self._lock_file is None:
+            # Held until close; the pid is only informative.
+            self._lock_file = open(os.path.join(self.session_dir, LOCK_FILE_NAME), "w+b")
+            self._lock_file.write(str(os.getpid()).encode("ascii"))
+            self._lock_file.flush()
+            _try_lock(self._lock_file)
+        self._files = {"generation": generation}
+        for name in ("tiles", "history", "journal"):
+            self._files[name] = open(os.path.join(self.session_dir, f"{name}.{generation}.log"), "ab")
+        return self._files
+
+    def _remove_generation(self, generation):
+        for name in ("tiles", "history", "journal"):
+            path = os.path.join(self.session_dir, f"{name}.{generation}.log")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _close_files(self):
+        if self._files is not None:
+            for name in ("tiles", "history", "journal"):
+                self._files[name].close()
+            self._files = None
+
+    def close(self, discard=True):
+        """Finish pending writes; a clean exit also deletes the session."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._close_files()
+            if self._lock_file is not None:
+                _release_lock(self._lock_file)
+                self._lock_file.close()
+                self._lock_file = None
+        if discard:
+            shutil.rmtree(self.session_dir, ignore_errors=True)
+
+
+# Recovery ---------------------------------------------------------------------
+
+def _latest_generation(session_dir):
+    """Newest generation of a session with at least one checkpoint, or None."""
+    generations = []
+    for name in os.listdir(session_dir):
+        if name.startswith("journal.") and name.endswith(".log"):
+            if os.path.getsize(os.path.join(session_dir, name)) > 0:
+                generations.append(int(name.split(".")[1]))
+    return max(generations) if generations else None
+
+
+def _read_checkpoints(path):
+    """Parsed journal lines, ignoring a last line cut short by a crash."""
+    checkpoints = []
+    with open(path, "rb") as fh:
+        for line in fh:
+            try:
+                checkpoints.append(json.loads(line))
+            except ValueError:
+                break
+    return checkpoints
+
+
+def find_sessions(root=None):
+    """Session directories left behind by editors that are no longer running."""
+    root = root or default_recovery_dir()
+    if not os.path.isdir(root):
+        return []
+    sessions = []
+    for name in os.listdir(root):
+        session_dir = os.path.join(root, name)
+        if not os.path.isdir(session_dir) or _session_in_use(session_dir):
+            continue
+        if _latest_generation(session_dir) is not None:
+            sessions.append(session_dir)
+    sessions.sort(key=os.path.getmtime, reverse=True)
+    return sessions
+
+
+def _read_span(fh, span):
+    fh.seek(span[0])
+    return fh.read(span[1])
+
+
+@instrument("autosave.load_session")
+def load_session(session_dir):
+    """Rebuild the document and history saved in ``session_dir``."""
+    generation = _latest_generation(session_dir)
+    if generation is None:
+        raise ValueError(f"No checkpoint in {session_dir}")
+    checkpoints = _read_checkpoints(os.path.join(session_dir, f"journal.{generation}.log"))
+    if not checkpoints:
+        raise ValueError(f"No checkpoint in {session_dir}")
+
+    tiles, meta = {}, None
+    for checkpoint in checkpoints:
+        for image_id, tx, ty, offset, length in checkpoint["tiles"]:
+            tiles[image_id, tx, ty] = (offset, length)
+        meta = checkpoint.get("meta", meta)
+    last = checkpoints[-1]
+
+    images = []
+    with open(os.path.join(session_dir, f"tiles.{generation}.log"), "rb") as fh:
+        for image_id, width, height, dtype in meta["images"]:
+            arr = np.zeros((height, width, 4), dtype=dtype)
+            for (tile_image, tx, ty), span in tiles.items():
+                if tile_image == image_id:
+                    rect = tile_rect(tx, ty, width, height, AUTOSAVE_TILE_SIZE)
+                    x0, y0, x1, y1 = rect
+                    arr[y0:y1, x0:x1] = unpack_tile(_read_span(fh, span), rect, dtype)
+            images.append(Image.fromarray(arr, "RGBA") if dtype == "uint8" else arr)
+
+    with open(os.path.join(session_dir, f"history.{generation}.log"), "rb") as fh:
+        undo_stack = [pickle.loads(_read_span(fh, span)) for span in last["undo"]]
+        redo_stack = [pickle.loads(_read_span(fh, span)) for span in last["redo"]]
+
+    meta = dict(meta)
+    meta["icc_profile"] = bytes.fromhex(meta.get("icc_profile") or "") or None
+    del meta["images"]
+    return RecoveredSession(meta.get("path"), last["saved_at"], images[0], images[1:], meta,
+                            undo_stack, redo_stack)
+
+
+def discard_session(session_dir):
+    """Delete a recovery session."""
+    shutil.rmtree(session_dir, ignore_errors=True)
@@ -1,8 +1,23 @@
 """Command pattern implementation for undo/redo functionality."""
 
 import io
+import zlib
+
+import numpy as np
 from PIL import Image
 from .constants import MAX_HISTORY_STEPS
+from .metrics import instrument
+from ..utils.precision import image_size
+
+HISTORY_ZLIB_LEVEL = 1
+
+
+def _crop(image, bounds):
+    """Crop a PIL image or a document array."""
+    if isinstance(image, np.ndarray):
+        x0, y0, x1, y1 = bounds
+        return image[y0:y1, x0:x1]
+    return image.crop(bounds)
 
 
 class EditCommand:
@@ -11,12 +26,40 @@ class EditCommand:
     def __init__(self, layer_index, operation, before, after, bounds=None):
         self.layer_index = layer_index
         self.operation = operation
-        self.bounds = bounds or (0, 0, before.width, before.height)
-        self.before = self._compress_image(before.crop(self.bounds))
-        self.after = self._compress_image(after.crop(self.bounds))
-
+        # Edits that change the image size replace the whole image on undo and redo.
+        self.resizes = bounds is None and image_size(before) != image_size(after)
+        self.bounds = bounds or (0, 0, *image_size(before))
+        if self.resizes:
+            self.before = self._compress_image(before)
+            self.after = self._compress_image(after)
+        else:
+            self.before = self._compress_image(_crop(before, self.bounds))
+            self.after = self._compress_image(_crop(after, self.bounds))
+
+    @classmethod
+    def from_patches(cls, layer_index, operation, before_patch, after_patch, bounds):
+        """Create a command from already-cropped before/after patches."""
+        command = cls.__new__(cls)
+        command.layer_index = layer_index
+        command.operation = operation
+        command.resizes = False
+        command.bounds = tuple(bounds)
+        command.before = command._compress_image(before_patch)
+        command.after = command._compress_image(after_patch)
+        return command
+
+    @instrument("commands.compress")
     def _compress_image(self, image):
-        """Compress image to save memory in history."""
+        """Compress image to save memory in history.
+
+        High-bit document arrays are stored as zlib-compressed byte planes
+        (all low bytes, then all high bytes, ...), which compress much
+        better than interleaved samples.
+        """
+        if isinstance(image, np.ndarray):
+            planes = np.ascontiguousarray(image).view(np.uint8).reshape(-1, image.itemsize).T
+            data = zlib.compress(np.ascontiguousarray(planes).tobytes(), HISTORY_ZLIB_LEVEL)
+            return image.shape, image.dtype.str, data
         buffer = io.BytesIO()
         image.save(buffer, format="PNG", optimize=True, compress_level=9)
         return buffer.getvalue()
@@ -31,8 +74,22 @@ class EditCommand:
 
     def _apply_patch(self, image, patch_data):
         """Apply a compressed patch to the image."""
+        if isinstance(patch_data, tuple):
+            shape, dtype, data = patch_data
+            dtype = np.dtype(dtype)
+            planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(dtype.itemsize, -1)
+            patch = np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+            if self.resizes:
+                return patch
+            x0, y0, x1, y1 = self.bounds
+            image[y0:y1, x0:x1] = patch
+            return image
         buffer = io.BytesIO(patch_data)
         patch = Image.open(buffer)
+        if self.resizes:
+            patch = patch.convert("RGBA")
+            patch.info.update(image.info)
+            return patch
         image.paste(patch, self.bounds)
         return image
 
@@ -43,6 +100,17 @@ class CommandProcessor:
     def __init__(self):
         self.undo_stack = []
         self.redo_stack = []
+        # Called as ``listener(event, command)`` after "execute", "undo" and
+        # "redo", and with ``command=None`` after "clear".
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Register a callable notified of history changes."""
+        self.listeners.append(listener)
+
+    def _notify(self, event, command):
+        for listener in self.listeners:
+            listener(event, command)
 
     def execute(self, command):
         """Execute a command and add it to history."""
@@ -50,6 +118,7 @@ class CommandProcessor:
         if len(self.undo_stack) > MAX_HISTORY_STEPS:
             self.undo_stack.pop(0)
         self.redo_stack.clear()
+        self._notify("execute", command)
 
     def undo(self, current_state):
         """Undo the last operation."""
@@ -59,7 +128,9 @@ class CommandProcessor:
         self.redo_stack.append(command)
 
         new_state = current_state.copy()
-        return command.undo(new_state)
+        result = command.undo(new_state)
+        self._notify("undo", command)
+        return result
 
     def redo(self, current_state):
         """Redo the last undone operation."""
@@ -69,7 +140,9 @@ class CommandProcessor:
         self.undo_stack.append(command)
 
         new_state = current_state.copy()
-        return command.redo(new_state)
+        result = command.redo(new_state)
+        self._notify("redo", command)
+        return result
 
     def can_undo(self):
         """Check if undo is available."""
@@ -82,4 +155,5 @@ class CommandProcessor:
     def clear(self):
         """Clear the command history."""
         self.undo_stack.clear()
-        self.redo_stack.clear()
\ No newline at end of file
+        self.redo_stack.clear()
+        self._notify("clear", None)
\ No newline at end of file
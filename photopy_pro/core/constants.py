@@ -16,6 +16,7 @@ TOOL_ICONS = {
     "eraser": "icons/eraser.svg",
     "fill": "icons/fill.svg",
     "clone": "icons/clone.svg",
+    "heal": "icons/heal.svg",
     "select_rect": "icons/select_rect.svg",
     "select_ellipse": "icons/select_ellipse.svg",
     "select_free": "icons/select_free.svg",
@@ -34,6 +35,7 @@ TOOLS_CONFIG = [
     ("eraser", "Eraser", "Erase parts of image"),
     ("fill", "Fill", "Fill area with color"),
     ("clone", "Clone", "Clone image areas"),
+    ("heal", "Heal", "Heal image areas"),
     ("select_rect", "Rect Select", "Rectangular selection"),
     ("select_ellipse", "Ellipse Select", "Elliptical selection"),
     ("select_free", "Free Select", "Freehand selection"),
@@ -42,4 +44,15 @@ TOOLS_CONFIG = [
     ("rect", "Rectangle", "Draw rectangles"),
     ("ellipse", "Ellipse", "Draw ellipses"),
     ("perspective", "Perspective", "Perspective transformation")
-]
\ No newline at end of file
+]
+
+# Filters without parameters, as (operation, menu label)
+FILTERS_CONFIG = [
+    ("grayscale", "Grayscale"),
+    ("invert", "Invert"),
+    ("sepia", "Sepia"),
+    ("edge_detection", "Edge Detection"),
+    ("emboss", "Emboss"),
+    ("sketch", "Sketch"),
+    ("watercolor", "Watercolor"),
+]
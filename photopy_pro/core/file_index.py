@@ -0,0 +1,219 @@
+"""Persistent thumbnail and metadata index for the file browser.
+
+Scanning a folder stats every file and looks the results up in a SQLite
+cache keyed by path, modification time and size. Only new or changed files
+are read, in a thread pool: size, format and EXIF come from the lazily
+parsed header, and thumbnails are decoded in draft mode, which lets JPEG
+decode straight to a reduced scale. Revisiting a folder therefore costs one
+directory listing and one query.
+"""
+
+import io
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps, ExifTags
+
+from .constants import SUPPORTED_FORMATS
+from .metrics import instrument
+
+INDEX_FILE_NAME = "file_index.sqlite3"
+INDEX_SCHEMA_VERSION = 2
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_QUALITY = 85
+INDEX_EXTENSIONS = frozenset(pattern.lstrip("*").lower() for pattern in SUPPORTED_FORMATS.split())
+
+IndexEntry = namedtuple("IndexEntry", "path mtime size width height format mode exif thumbnail")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    mode TEXT,
+    exif TEXT,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+"""
+
+
+def cache_dir():
+    """The application's directory in the user's cache directory."""
+    cache_root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_root, "photopy_pro")
+
+
+def default_index_path():
+    """Location of the index in the user's cache directory."""
+    return os.path.join(cache_dir(), INDEX_FILE_NAME)
+
+
+def _exif_dict(image):
+    """EXIF tags with readable names, limited to JSON-friendly values."""
+    exif = {}
+    for tag, value in image.getexif().items():
+        if isinstance(value, bytes):
+            continue
+        if not isinstance(value, (str, int, float)):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = str(value)
+        exif[ExifTags.TAGS.get(tag, str(tag))] = value
+    return exif
+
+
+def _to_8bit(image):
+    """Greyscale 16-bit, 32-bit and float images rescaled to 8-bit "L".
+
+    PIL's own conversion clips these modes at 255, which turns most of the
+    image white.
+    """
+    if image.mode.startswith("I;16") or image.mode == "I":
+        arr = np.asarray(image, dtype=np.float32) / 257
+    elif image.mode == "F":
+        arr = np.asarray(image, dtype=np.float32) * 255
+    else:
+        return image
+    return Image.fromarray(np.clip(np.rint(arr), 0, 255).astype(np.uint8), "L")
+
+
+def _encode_thumbnail(image):
+    """JPEG (or PNG when transparent) bytes of a thumbnail image."""
+    image = _to_8bit(image)
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.convert("RGBA").save(buffer, format="PNG")
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def read_entry(path, stat=None, thumbnail_size=THUMBNAIL_SIZE):
+    """Reads the metadata and thumbnail of one file.
+
+    Files PIL cannot open still get an entry (without size or thumbnail) so
+    they are not retried until they change.
+    """
+    stat = stat or os.stat(path)
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            file_format, mode = image.format, image.mode
+            exif = _exif_dict(image)
+            # Lets JPEG decode at 1/2, 1/4 or 1/8 scale; ignored by other formats.
+            image.draft("RGB", thumbnail_size)
+            image.thumbnail(thumbnail_size)
+            thumbnail = _encode_thumbnail(ImageOps.exif_transpose(image))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return IndexEntry(path, stat.st_mtime, stat.st_size, None, None, None, None, {}, None)
+    return IndexEntry(path, stat.st_mtime, stat.st_size, width, height, file_format, mode, exif, thumbnail)
+
+
+class FileIndex:
+    """SQLite-backed cache of image metadata and thumbnails."""
+
+    def __init__(self, db_path=None, max_workers=None):
+        self.db_path = db_path or default_index_path()
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        # Scans may run on a worker thread; the lock serializes access.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS files")
+            self._conn.execute(f"PRAGMA user_version={INDEX_SCHEMA_VERSION}")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def list_images(directory):
+        """(path, stat) of the supported image files directly in ``directory``."""
+        files = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if os.path.splitext(entry.name)[1].lower() in INDEX_EXTENSIONS and entry.is_file():
+                    files.append((entry.path, entry.stat()))
+        files.sort(key=lambda item: os.path.basename(item[0]).lower())
+        return files
+
+    def cached(self, directory):
+        """Entries stored for ``directory``, keyed by path."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, mtime, size, width, height, format, mode, exif, thumbnail "
+                "FROM files WHERE directory = ?", (os.path.abspath(directory),)).fetchall()
+        return {row[0]: IndexEntry(*row[:7], json.loads(row[7] or "{}"), row[8]) for row in rows}
+
+    @instrument("file_index.scan")
+    def scan(self, directory, progress=None, cancelled=None):
+        """Index ``directory`` and return its entries sorted by file name.
+
+        ``progress(done, total)`` is called as changed files are read. Once
+        ``cancelled()`` returns true, files not yet read are skipped, the
+        ones already read are stored and None is returned.
+        """
+        directory = os.path.abspath(directory)
+        files = self.list_images(directory)
+        cached = self.cached(directory)
+
+        entries = {}
+        stale = []
+        for path, stat in files:
+            entry = cached.get(path)
+            if entry is not None and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+                entries[path] = entry
+            else:
+                stale.append((path, stat))
+
+        if stale:
+            def read(item):
+                return None if cancelled and cancelled() else read_entry(*item)
+
+            fresh = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for done, entry in enumerate(executor.map(read, stale), 1):
+                    if entry is None:
+                        continue
+                    entries[entry.path] = entry
+                    fresh.append(entry)
+                    if progress:
+                        progress(done, len(stale))
+            self._store(directory, fresh)
+            if len(fresh) < len(stale):
+                return None
+
+        removed = cached.keys() - entries.keys()
+        if removed:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+
+        return [entries[path] for path, _ in files]
+
+    def _store(self, directory, entries):
+        """Insert or replace entries in one transaction."""
+        rows = [(e.path, directory, e.mtime, e.size, e.width, e.height, e.format, e.mode,
+                 json.dumps(e.exif), e.thumbnail) for e in entries]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(path, directory, mtime, size, width, height, format, mode, exif, thumbnail) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
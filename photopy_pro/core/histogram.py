@@ -0,0 +1,82 @@
+"""Tile-based histogram service with incremental updates.
+
+Per-channel and luminance histograms are kept for every tile of the image,
+together with their running total. After an edit only the tiles touching
+the dirty rectangle are recomputed, and their old counts are swapped out of
+the total, so the cost of an update follows the size of the edit rather
+than the size of the image.
+"""
+
+import numpy as np
+import cv2
+
+from .metrics import instrument
+from ..utils.tiles import iter_tiles
+
+HISTOGRAM_TILE_SIZE = 256
+HISTOGRAM_CHANNELS = ("red", "green", "blue", "luminance")
+
+
+def _tile_histograms(tile):
+    """Red, green, blue and luminance histograms of an RGBA tile."""
+    hists = np.empty((len(HISTOGRAM_CHANNELS), 256), dtype=np.int64)
+    for c in range(3):
+        hists[c] = cv2.calcHist([tile], [c], None, [256], [0, 256]).ravel()
+    luminance = cv2.cvtColor(tile, cv2.COLOR_RGBA2GRAY)
+    hists[3] = cv2.calcHist([luminance], [0], None, [256], [0, 256]).ravel()
+    return hists
+
+
+class HistogramService:
+    """Maintains the histograms of an image as it is edited."""
+
+    def __init__(self, tile_size=HISTOGRAM_TILE_SIZE):
+        self.tile_size = tile_size
+        self.size = None
+        self.tiles = None
+        self.total = np.zeros((len(HISTOGRAM_CHANNELS), 256), dtype=np.int64)
+
+    @instrument("histogram.reset")
+    def reset(self, pil_img):
+        """Recompute every tile of ``pil_img``."""
+        if pil_img is None:
+            self.size = None
+            self.tiles = None
+            self.total[:] = 0
+            return
+        self.size = pil_img.size
+        w, h = self.size
+        t = self.tile_size
+        self.tiles = np.zeros(((h + t - 1) // t, (w + t - 1) // t, len(HISTOGRAM_CHANNELS), 256),
+                              dtype=np.int64)
+        self._recompute(pil_img, (0, 0, w, h))
+
+    @instrument("histogram.update")
+    def update(self, pil_img, bounds=None):
+        """Recompute the tiles touching ``bounds`` (the whole image if None)."""
+        if pil_img is None or bounds is None or pil_img.size != self.size:
+            self.reset(pil_img)
+            return
+        w, h = self.size
+        t = self.tile_size
+        x0, y0 = max(0, bounds[0]) // t * t, max(0, bounds[1]) // t * t
+        x1, y1 = min(w, -(-bounds[2] // t) * t), min(h, -(-bounds[3] // t) * t)
+        if x1 > x0 and y1 > y0:
+            self._recompute(pil_img, (x0, y0, x1, y1))
+
+    def _recompute(self, pil_img, rect):
+        """Refresh tile histograms inside a tile-aligned rectangle."""
+        x0, y0, x1, y1 = rect
+        if pil_img.mode != "RGBA":
+            pil_img = pil_img.convert("RGBA")
+        region = np.asarray(pil_img.crop(rect))
+        t = self.tile_size
+        for tx0, ty0, tx1, ty1 in iter_tiles(x1 - x0, y1 - y0, t):
+            key = ((y0 + ty0) // t, (x0 + tx0) // t)
+            hists = _tile_histograms(np.ascontiguousarray(region[ty0:ty1, tx0:tx1]))
+            self.total += hists - self.tiles[key]
+            self.tiles[key] = hists
+
+    def channel(self, name):
+        """Histogram of a single channel as a 256-element array."""
+        return self.total[HISTOGRAM_CHANNELS.index(name)]
@@ -0,0 +1,405 @@
+"""Recorded action macros and batch replay.
+
+An ``ActionRecorder`` captures semantic steps (operation name and
+parameters) rather than pixels. Coordinates such as selection rectangles and
+fill seeds are stored relative to the image size, so a macro recorded on one
+photo applies to others of any size. Before replay, consecutive tone
+adjustments are fused into a single lookup table pass. ``run_batch`` replays
+a macro over many files in a process pool, keeping only a bounded number of
+files in flight.
+"""
+
+import json
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .file_index import FileIndex
+from ..filters import artistic, basic, transforms
+from ..filters.blur import gaussian_blur, kernel_sigma
+from ..utils.color_management import open_document, save_options
+from ..utils.flood_fill import compute_fill_mask, flood_fill
+from ..utils.precision import (
+    PRECISION_FLOAT32, PRECISION_UINT8, convert_precision, image_size, precision_of, read_image,
+    to_display_image, to_document, write_image
+)
+
+MACRO_VERSION = 1
+BATCH_FILES_PER_WORKER = 2
+
+# ``apply(image, **params)`` runs the step; ``luts(precision, **params)``, when
+# present, returns its R, G and B tables so it can be fused with neighbours.
+Operation = namedtuple("Operation", "apply luts")
+MacroStep = namedtuple("MacroStep", "operation params")
+Stage = namedtuple("Stage", "operation params luts")
+
+
+def relative_points(points, size):
+    """Points as fractions of the image ``size``."""
+    width, height = size
+    return [[x / width, y / height] for x, y in points]
+
+
+def absolute_points(points, size):
+    """Relative points scaled back to pixels of an image of ``size``."""
+    width, height = size
+    return [(x * width, y * height) for x, y in points]
+
+
+def _perspective(image, src, dst):
+    size = image_size(image)
+    return transforms.perspective_transform(image, absolute_points(src, size), absolute_points(dst, size))
+
+
+def _content_aware_scale(image, width, height, multires=None):
+    """Seam carving to ``width`` and ``height`` given as fractions of the current size."""
+    current_width, current_height = image_size(image)
+    return transforms.seam_carve(image, max(1, round(width * current_width)),
+                                 max(1, round(height * current_height)), multires)
+
+
+OPERATIONS = {
+    "brightness_contrast": Operation(
+        basic.apply_brightness_contrast,
+        lambda precision, brightness, contrast: [basic.brightness_contrast_lut(brightness, contrast, precision)] * 3),
+    "levels": Operation(
+        basic.apply_levels,
+        lambda precision, black=0, white=255, gamma=1.0, out_black=0, out_white=255, channel="rgb":
+            basic.channel_luts(basic.levels_lut(black, white, gamma, out_black, out_white, precision),
+                               channel, precision)),
+    "curves": Operation(
+        basic.apply_curves,
+        lambda precision, points, channel="rgb":
+            basic.channel_luts(basic.curves_lut(points, precision), channel, precision)),
+    "saturation": Operation(basic.apply_saturation, None),
+    "blur": Operation(basic.apply_blur, None),
+    "sharpen": Operation(basic.apply_sharpen, None),
+    "edge_detection": Operation(basic.edge_detection, None),
+    "sepia": Operation(basic.apply_sepia, None),
+    "posterize": Operation(basic.apply_posterize, None),
+    "remove_background": Operation(basic.remove_background, None),
+    "grayscale": Operation(basic.apply_grayscale, None),
+    "invert": Operation(basic.apply_invert, None),
+    "emboss": Operation(basic.apply_emboss, None),
+    "sketch": Operation(basic.apply_sketch, None),
+    "oil_painting": Operation(artistic.apply_oil_painting, None),
+    "watercolor": Operation(artistic.apply_watercolor, None),
+    "median": Operation(artistic.apply_median, None),
+    "bilateral": Operation(artistic.apply_bilateral, None),
+    "kuwahara": Operation(artistic.apply_kuwahara, None),
+    "warp": Operation(transforms.warp_image, None),
+    "perspective": Operation(_perspective, None),
+    "content_aware_scale": Operation(_content_aware_scale, None),
+}
+
+# Operations that work on 16-bit and float arrays directly. The others run on
+# an 8-bit copy of deep documents, so their result is quantised to 8 bits;
+# the editor marks them in the menus while a deep document is open.
+DEEP_OPERATIONS = ("brightness_contrast", "levels", "curves", "blur", "content_aware_scale",
+                   "saturation", "sepia", "posterize", "grayscale", "invert")
+
+# Steps that change the selection instead of the pixels.
+SELECTION_OPERATIONS = ("select", "deselect")
+OTHER_OPERATIONS = SELECTION_OPERATIONS + ("fill",)
+
+
+def run_operation(image, operation, params):
+    """Apply one registered operation to a PIL image or document array."""
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {operation}")
+    if isinstance(image, np.ndarray) and operation not in DEEP_OPERATIONS:
+        result = OPERATIONS[operation].apply(to_display_image(image), **params)
+        return to_document(result.convert("RGBA"), precision_of(image))
+    return OPERATIONS[operation].apply(image, **params)
+
+
+def selection_mask(image, params):
+    """uint8 mask of a recorded selection on ``image``."""
+    width, height = image_size(image)
+    shape = params["shape"]
+    if shape == "wand":
+        arr = _rgba8(image)
+        (x, y), = absolute_points([params["point"]], (width, height))
+        mask = np.zeros((height, width), dtype=np.uint8)
+        region, bounds = compute_fill_mask(arr, [(int(x), int(y))], params.get("tolerance", 15), floating=True)
+        if region is not None:
+            mask[bounds[1]:bounds[3], bounds[0]:bounds[2]] = region
+        if params.get("feather", 0) > 0:
+            mask = gaussian_blur(mask, kernel_sigma(params["feather"] * 2 + 1))
+        return mask
+
+    mask = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(mask)
+    if shape == "rect":
+        draw.rectangle(absolute_points(params["points"], (width, height)), fill=255)
+    elif shape == "ellipse":
+        draw.ellipse(absolute_points(params["points"], (width, height)), fill=255)
+    elif shape == "polygon":
+        draw.polygon(absolute_points(params["points"], (width, height)), fill=255)
+    else:
+        raise ValueError(f"Unknown selection shape: {shape}")
+    return np.asarray(mask)
+
+
+def _rgba8(image):
+    """Read-only 8-bit RGBA array used by colour-based steps."""
+    if isinstance(image, np.ndarray):
+        return np.asarray(to_display_image(image))
+    return np.asarray(image.convert("RGBA"))
+
+
+def _fill(image, seeds, color, tolerance=32, mode="contiguous", color_space="rgb", antialias=True):
+    """Replays a fill with relative seed points."""
+    arr = _rgba8(image)
+    seeds = [(int(x), int(y)) for x, y in absolute_points(seeds, image_size(image))]
+    if isinstance(image, np.ndarray):
+        # The mask comes from the 8-bit view; the paint is blended at full precision.
+        mask, bounds = compute_fill_mask(arr, seeds, tolerance, mode, color_space, antialias)
+        if mask is None:
+            return image
+        x0, y0, x1, y1 = bounds
+        out = image.copy()
+        region = out[y0:y1, x0:x1]
+        if color[3] == 0:
+            erased = region.copy()
+            erased[..., 3] = 0
+            region[:] = apply_in_mask(erased, region, mask)
+        else:
+            solid = np.empty((1, 1, 4), dtype=np.uint8)
+            solid[0, 0] = color
+            painted = np.broadcast_to(convert_precision(solid, precision_of(image)), region.shape)
+            region[:] = apply_in_mask(painted, region, mask)
+        return out
+    patch, bounds = flood_fill(arr, seeds, tuple(color), tolerance, mode, color_space, antialias)
+    if patch is None:
+        return image
+    x0, y0, x1, y1 = bounds
+    out = image.convert("RGBA")
+    out.paste(Image.fromarray(patch, "RGBA"), (x0, y0))
+    return out
+
+
+def apply_in_mask(result, original, mask):
+    """``result`` inside ``mask`` and ``original`` outside it."""
+    if isinstance(original, np.ndarray):
+        weight = mask.astype(np.float32)[..., np.newaxis] / 255
+        blended = original + (result.astype(np.float32) - original) * weight
+        if precision_of(original) != PRECISION_FLOAT32:
+            blended = np.rint(blended)
+        return blended.astype(original.dtype)
+    return Image.composite(result.convert("RGBA"), original.convert("RGBA"), Image.fromarray(mask, "L"))
+
+
+class Macro:
+    """An ordered list of recorded steps."""
+
+    def __init__(self, steps=None):
+        self.steps = [MacroStep(*step) for step in steps or []]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def to_dict(self):
+        """JSON-ready representation."""
+        return {"version": MACRO_VERSION,
+                "steps": [{"operation": s.operation, "params": s.params} for s in self.steps]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a macro from ``to_dict`` output, validating operation names."""
+        if data.get("version") != MACRO_VERSION:
+            raise ValueError(f"Unsupported macro version: {data.get('version')}")
+        steps = []
+        for step in data["steps"]:
+            operation = step["operation"]
+            if operation not in OPERATIONS and operation not in OTHER_OPERATIONS:
+                raise ValueError(f"Unknown operation: {operation}")
+            steps.append(MacroStep(operation, dict(step.get("params", {}))))
+        return cls(steps)
+
+    def to_json(self):
+        """Serialize to a JSON string."""
+        return json.dumps(self.to_dict(), indent=2)
+
+    @classmethod
+    def from_json(cls, text):
+        """Parse a macro from a JSON string."""
+        return cls.from_dict(json.loads(text))
+
+    def save(self, path):
+        """Write the macro to ``path``."""
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(self.to_json())
+
+    @classmethod
+    def load(cls, path):
+        """Read a macro from ``path``."""
+        with open(path, encoding="utf-8") as fh:
+            return cls.from_json(fh.read())
+
+    def compile(self, precision=PRECISION_UINT8):
+        """Stages to execute, with runs of table-based steps fused into one.
+
+        Integer tables compose exactly by indexing one with the other; float
+        documents run each step on its own.
+        """
+        stages = []
+        for step in self.steps:
+            operation = OPERATIONS.get(step.operation)
+            if operation is None or operation.luts is None or precision == PRECISION_FLOAT32:
+                stages.append(Stage(step.operation, step.params, None))
+                continue
+            luts = operation.luts(precision, **step.params)
+            previous = stages[-1] if stages else None
+            if previous is not None and previous.luts is not None:
+                fused = [np.asarray(lut)[np.asarray(first)] for first, lut in zip(previous.luts, luts)]
+                stages[-1] = Stage("lut", {"steps": previous.params.get("steps", 1) + 1}, fused)
+            else:
+                stages.append(Stage(step.operation, step.params, luts))
+        return stages
+
+    def apply(self, image):
+        """Replay the macro on a PIL image or document array."""
+        mask = None
+        for stage in self.compile(precision_of(image)):
+            if stage.operation == "select":
+                mask = selection_mask(image, stage.params)
+                continue
+            if stage.operation == "deselect":
+                mask = None
+                continue
+
+            if stage.operation == "fill":
+                result = _fill(image, **stage.params)
+            elif stage.operation == "lut":
+                result = (basic.apply_lut_to_array(image, *stage.luts) if isinstance(image, np.ndarray)
+                          else basic.apply_lut_to_pil(image, *stage.luts))
+            else:
+                result = run_operation(image, stage.operation, stage.params)
+            if image_size(result) != image_size(image):
+                # A resize invalidates the selection.
+                mask = None
+            image = result if mask is None else apply_in_mask(result, image, mask)
+        return image
+
+
+class ActionRecorder:
+    """Collects steps while recording is on."""
+
+    def __init__(self):
+        self.steps = []
+        self.recording = False
+
+    def start(self):
+        """Start a new recording."""
+        self.steps = []
+        self.recording = True
+
+    def stop(self):
+        """Stop recording and return the macro."""
+        self.recording = False
+        return Macro(self.steps)
+
+    def record(self, operation, params=None):
+        """Append a step if recording."""
+        if self.recording:
+            self.steps.append(MacroStep(operation, dict(params or {})))
+
+
+# Batch replay -----------------------------------------------------------------
+
+_worker_macro = None
+
+
+def _init_worker(macro_json):
+    global _worker_macro
+    _worker_macro = Macro.from_json(macro_json)
+
+
+def _save_format(path):
+    file_format = os.path.splitext(path)[1][1:].upper()
+    return {"JPG": "JPEG", "TIF": "TIFF"}.get(file_format, file_format)
+
+
+def _process_file(source, destination):
+    """Replay the worker's macro on one file, keeping deep files at their precision."""
+    image, icc_profile = read_image(source), None
+    if image is None:
+        with Image.open(source) as opened:
+            image, icc_profile = open_document(opened)
+    result = _worker_macro.apply(image)
+    file_format = _save_format(destination)
+    if isinstance(result, np.ndarray):
+        if write_image(destination, result, file_format):
+            return destination
+        result = to_display_image(result)
+    if file_format == "JPEG":
+        result = result.convert("RGB")
+    result.save(destination, format=file_format, **save_options(file_format, icc_profile))
+    return destination
+
+
+def batch_files(folders):
+    """Supported image files directly inside each of ``folders``."""
+    return [path for folder in folders for path, _ in FileIndex.list_images(folder)]
+
+
+def _batch_destination(source, output_dir, source_root, used):
+    """Output path of ``source``, unique among the ``used`` paths."""
+    if source_root is None:
+        relative = os.path.basename(source)
+    else:
+        relative = os.path.relpath(source, source_root)
+    stem, extension = os.path.splitext(os.path.join(output_dir, relative))
+    destination, n = stem + extension, 1
+    while os.path.normcase(destination) in used:
+        n += 1
+        destination = f"{stem}-{n}{extension}"
+    used.add(os.path.normcase(destination))
+    return destination
+
+
+def run_batch(macro, files, output_dir, max_workers=None, source_root=None):
+    """Replay ``macro`` on ``files``, writing results to ``output_dir``.
+
+    Files keep their path relative to ``source_root`` when it is given;
+    otherwise they are written side by side and same-named files get a
+    numbered suffix. Files that would overwrite their source fail instead.
+
+    Yields ``(source, destination, error)`` as files finish, in completion
+    order; ``error`` is None on success. Only a few files per worker are
+    queued at a time, so memory stays flat however many files are given.
+    """
+    if source_root is not None and os.path.realpath(source_root) == os.path.realpath(output_dir):
+        raise ValueError("The output folder must differ from the source folder")
+    os.makedirs(output_dir, exist_ok=True)
+    used = set()
+    max_workers = max_workers or os.cpu_count() or 1
+    # Spawned workers do not inherit the GUI's threads and state.
+    context = multiprocessing.get_context("spawn")
+    files = iter(files)
+    pending = {}
+
+    with ProcessPoolExecutor(max_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(macro.to_json(),)) as executor:
+        while True:
+            for source in files:
+                destination = _batch_destination(source, output_dir, source_root, used)
+                if os.path.realpath(destination) == os.path.realpath(source):
+                    yield source, destination, "ValueError: the result would overwrite the source"
+                    continue
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                pending[executor.submit(_process_file, source, destination)] = (source, destination)
+                if len(pending) >= max_workers * BATCH_FILES_PER_WORKER:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, destination = pending.pop(future)
+                error = future.exception()
+                yield source, destination, None if error is None else f"{type(error).__name__}: {error}"
@@ -0,0 +1,179 @@
+"""Opt-in latency and memory instrumentation for image operations.
+
+Instrumentation is disabled by default. Enable it with the ``PHOTOPY_METRICS``
+environment variable or by calling :func:`enable_metrics`; while disabled the
+decorator costs a single attribute check per call. ``tracemalloc`` peaks are
+process-wide, so allocations of concurrently running threads may be
+attributed to whichever instrumented call is active.
+"""
+
+import csv
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+METRICS_ENV_VAR = "PHOTOPY_METRICS"
+MAX_SAMPLES_PER_OPERATION = 1000
+
+
+class MetricsRegistry:
+    """Thread-safe in-process store of operation timings and allocations."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._local = threading.local()
+        self._listeners = []
+        # Whether tracing was started here, so a session owned by others is left running
+        self._started_tracing = False
+
+    def enable(self):
+        """Start recording samples and tracing allocations."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording samples, and tracing if ``enable`` started it."""
+        self.enabled = False
+        if self._started_tracing:
+            self._started_tracing = False
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    def add_listener(self, callback):
+        """Register a callback invoked with each new sample."""
+        self._listeners.append(callback)
+
+    def record(self, name, seconds, peak_bytes, megapixels):
+        """Store a sample for an operation."""
+        sample = {
+            "operation": name,
+            "timestamp": time.time(),
+            "seconds": seconds,
+            "peak_bytes": peak_bytes,
+            "megapixels": megapixels,
+        }
+        with self._lock:
+            samples = self._samples.setdefault(name, [])
+            samples.append(sample)
+            if len(samples) > MAX_SAMPLES_PER_OPERATION:
+                del samples[0]
+        for callback in self._listeners:
+            callback(sample)
+
+    def samples(self, name=None):
+        """Return recorded samples, optionally for a single operation."""
+        with self._lock:
+            if name is not None:
+                return list(self._samples.get(name, []))
+            return [s for samples in self._samples.values() for s in samples]
+
+    def summary(self):
+        """Aggregate count, mean/max time and peak memory per operation."""
+        with self._lock:
+            items = [(name, list(samples)) for name, samples in self._samples.items()]
+
+        summary = {}
+        for name, samples in items:
+            times = [s["seconds"] for s in samples]
+            megapixels = sum(s["megapixels"] for s in samples)
+            summary[name] = {
+                "count": len(samples),
+                "mean_seconds": sum(times) / len(times),
+                "max_seconds": max(times),
+                "max_peak_bytes": max(s["peak_bytes"] for s in samples),
+                "megapixels_per_second": megapixels / sum(times) if sum(times) > 0 else 0.0,
+            }
+        return summary
+
+    def clear(self):
+        """Discard all recorded samples."""
+        with self._lock:
+            self._samples.clear()
+
+    def export_json(self, path):
+        """Write the summary and raw samples to a JSON file."""
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"summary": self.summary(), "samples": self.samples()}, fh, indent=2)
+
+    def export_csv(self, path):
+        """Write raw samples to a CSV file."""
+        fields = ["operation", "timestamp", "seconds", "peak_bytes", "megapixels"]
+        with open(path, "w", encoding="utf-8", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.samples())
+
+    def _frames(self):
+        """Per-thread stack of peak allocations seen by nested calls."""
+        if not hasattr(self._local, "frames"):
+            self._local.frames = []
+        return self._local.frames
+
+
+registry = MetricsRegistry()
+
+
+def enable_metrics():
+    """Enable the global metrics registry."""
+    registry.enable()
+
+
+def disable_metrics():
+    """Disable the global metrics registry."""
+    registry.disable()
+
+
+def _megapixels(args):
+    """Find the first image-like argument and return its size in megapixels."""
+    for arg in args:
+        size = getattr(arg, "size", None)
+        if isinstance(size, tuple) and len(size) == 2:
+            return size[0] * size[1] / 1e6
+        shape = getattr(arg, "shape", None)
+        if isinstance(shape, tuple) and len(shape) >= 2:
+            return shape[0] * shape[1] / 1e6
+        image = getattr(arg, "pil_image", None)
+        if image is not None:
+            return image.width * image.height / 1e6
+    return 0.0
+
+
+def instrument(name=None):
+    """Decorator recording wall time, peak allocation and input size of a call."""
+    def decorator(fn):
+        op_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled or not tracemalloc.is_tracing():
+                return fn(*args, **kwargs)
+
+            frames = registry._frames()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            frames.append(0)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                # Nested instrumented calls reset the tracer's peak, so the
+                # highest peak they saw is carried up through the frame stack.
+                peak = max(tracemalloc.get_traced_memory()[1], frames.pop())
+                if frames:
+                    frames[-1] = max(frames[-1], peak)
+                registry.record(op_name, elapsed, max(0, peak - start_bytes), _megapixels(args))
+        wrapper.metric_name = op_name
+        return wrapper
+    return decorator
+
+
+if os.environ.get(METRICS_ENV_VAR, "").lower() in ("1", "true", "yes", "on"):
+    enable_metrics()
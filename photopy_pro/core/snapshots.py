@@ -0,0 +1,306 @@
+"""Document snapshots in a content-addressed tile store.
+
+The canvas document and its layers are cut into tiles. Each tile is stored
+once, compressed, under the BLAKE2 hash of its pixels. A snapshot is only
+a JSON manifest that lists the tile hashes of every image, so variants of a
+document that differ in one region share all their other tiles.
+
+``SnapshotTracker`` follows the history through ``CommandProcessor``
+listeners and remembers the hash of every tile as it was last snapshotted
+or restored. Taking a snapshot after an edit therefore hashes only the
+tiles inside the edited bounds. Switching to another snapshot decodes only
+the tiles whose hash differs from what the document already holds.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .file_index import cache_dir
+from .metrics import instrument
+from ..utils.tiles import image_info, iter_tiles, pack_tile, tile_bytes, tiles_in_rect, unpack_tile
+
+SNAPSHOT_TILE_SIZE = 256
+SNAPSHOT_ZLIB_LEVEL = 3
+SNAPSHOT_DIGEST_SIZE = 16
+MANIFEST_VERSION = 1
+
+# Listing entry of a stored snapshot; ``path`` is the document's file, if any.
+Snapshot = namedtuple("Snapshot", "id name created path")
+
+
+def default_snapshot_dir():
+    """Root directory of the snapshot store."""
+    return os.path.join(cache_dir(), "snapshots")
+
+
+def tile_key(data, info):
+    """Hash of a tile's pixels, its size and sample type."""
+    digest = hashlib.blake2b(digest_size=SNAPSHOT_DIGEST_SIZE)
+    digest.update(repr(info).encode("ascii"))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class SnapshotStore:
+    """Tiles keyed by content hash plus one manifest per snapshot."""
+
+    def __init__(self, root=None, max_workers=None):
+        self.root = root or default_snapshot_dir()
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.manifests_dir = os.path.join(self.root, "manifests")
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    def _object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key[2:])
+
+    def has(self, key):
+        """Whether the tile ``key`` is stored."""
+        return os.path.exists(self._object_path(key))
+
+    def put(self, key, tile):
+        """Store a tile's pixels under ``key`` unless they are already stored."""
+        path = self._object_path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a unique name and renamed, so readers never see a partial tile.
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as fh:
+            fh.write(pack_tile(tile, SNAPSHOT_ZLIB_LEVEL))
+        os.replace(temp_path, path)
+
+    def get(self, key, rect, dtype):
+        """Pixels of the tile ``key`` as an (h, w, 4) array."""
+        with open(self._object_path(key), "rb") as fh:
+            return unpack_tile(fh.read(), rect, dtype)
+
+    def save_manifest(self, manifest):
+        """Store a manifest and return its snapshot id."""
+        snapshot_id = uuid.uuid4().hex
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        path = os.path.join(self.manifests_dir, f"{snapshot_id}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        os.replace(f"{path}.tmp", path)
+        return snapshot_id
+
+    def manifest(self, snapshot_id):
+        """The manifest of a snapshot."""
+        with open(os.path.join(self.manifests_dir, f"{snapshot_id}.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def snapshots(self, path=None):
+        """Snapshots of the document at ``path``, oldest first."""
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        found = []
+        for name in os.listdir(self.manifests_dir):
+            if not name.endswith(".json"):
+                continue
+            snapshot_id = name[:-len(".json")]
+            try:
+                manifest = self.manifest(snapshot_id)
+            except (OSError, ValueError):
+                continue
+            if manifest.get("path") == path:
+                found.append(Snapshot(snapshot_id, manifest["name"], manifest["created"], path))
+        found.sort(key=lambda snapshot: snapshot.created)
+        return found
+
+    def delete(self, snapshot_id):
+        """Remove a snapshot's manifest; its tiles stay until ``collect_garbage``."""
+        path = os.path.join(self.manifests_dir, f"{snapshot_id}.json")
+        if os.path.exists(path):
+            os.remove(path)
+
+    @instrument("snapshots.collect_garbage")
+    def collect_garbage(self):
+        """Delete tiles no manifest refers to and return how many were deleted.
+
+        Unreadable manifests are skipped, as in ``snapshots``; their snapshots
+        cannot be restored, so their tiles are reclaimed too.
+        """
+        referenced = set()
+        if os.path.isdir(self.manifests_dir):
+            for name in os.listdir(self.manifests_dir):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    manifest = self.manifest(name[:-len(".json")])
+                except (OSError, ValueError):
+                    continue
+                for image in manifest["images"]:
+                    referenced.update(image["tiles"])
+        removed = 0
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                folder = os.path.join(self.objects_dir, prefix)
+                for name in os.listdir(folder):
+                    if prefix + name not in referenced:
+                        os.remove(os.path.join(folder, name))
+                        removed += 1
+        return removed
+
+
+class _TrackedImage:
+    """Tile hashes of one image as last snapshotted or restored."""
+
+    def __init__(self, info, keys):
+        self.info = info
+        self.keys = keys
+        self.dirty = set()
+
+
+class SnapshotTracker:
+    """Takes and restores snapshots of one open document.
+
+    Images are the canvas document followed by the layers, as in the
+    autosave. The window reports layer changes and replaced documents the
+    same way it does to the autosave.
+    """
+
+    def __init__(self, store, tile_size=SNAPSHOT_TILE_SIZE):
+        self.store = store
+        self.tile_size = tile_size
+        # One entry per image; None when its tile hashes are not known
+        self._images = []
+
+    # Change tracking ------------------------------------------------------
+
+    def on_history(self, event, command):
+        """``CommandProcessor`` listener marking the tiles a command changed."""
+        if command is None or command.layer_index + 1 >= len(self._images):
+            return
+        for index in (0, command.layer_index + 1):
+            tracked = self._images[index]
+            if tracked is None:
+                continue
+            if command.resizes:
+                self._images[index] = None
+            else:
+                tracked.dirty.update(tiles_in_rect(command.bounds, self.tile_size))
+
+    def document_replaced(self):
+        """The document and layers were replaced (opened, converted or cleared)."""
+        self._images = []
+
+    def layer_inserted(self, index):
+        """A layer was inserted at ``index``."""
+        if self._images:
+            self._images.insert(index + 1, None)
+
+    def layer_removed(self, index):
+        """The layer at ``index`` was removed."""
+        if index + 1 < len(self._images):
+            self._images.pop(index + 1)
+
+    # Snapshots ------------------------------------------------------------
+
+    def _tile_coords(self, info):
+        width, height, _ = info
+        return [(x0 // self.tile_size, y0 // self.tile_size, (x0, y0, x1, y1))
+                for x0, y0, x1, y1 in iter_tiles(width, height, self.tile_size)]
+
+    @instrument("snapshots.take")
+    def take(self, name, document, layers, meta):
+        """Store a snapshot of the document and layers and return its id.
+
+        ``meta`` holds the document path, ICC profile and layer settings.
+        Only tiles changed since the last snapshot or restore are hashed.
+        """
+        images = [document, *layers]
+        if len(self._images) != len(images):
+            self._images = [None] * len(images)
+
+        jobs = []
+        for index, image in enumerate(images):
+            info = image_info(image)
+            tracked = self._images[index]
+            coords = self._tile_coords(info)
+            if tracked is None or tracked.info != info:
+                tracked = self._images[index] = _TrackedImage(info, {})
+                tracked.dirty = {(tx, ty) for tx, ty, _ in coords}
+            # Clean tiles reuse their hash unless garbage collection removed the tile since.
+            jobs += [(tracked, image, (tx, ty), rect) for tx, ty, rect in coords
+                     if (tx, ty) in tracked.dirty or not self.store.has(tracked.keys[tx, ty])]
+
+        def store_tile(job):
+            tracked, image, coord, rect = job
+            data = tile_bytes(image, rect)
+            key = tile_key(data, tracked.info)
+            self.store.put(key, data)
+            return key
+
+        # Hashing and compression release the GIL, so tiles are stored in parallel.
+        with ThreadPoolExecutor(max_workers=self.store.max_workers) as executor:
+            for (tracked, _, coord, _), key in zip(jobs, executor.map(store_tile, jobs)):
+                tracked.keys[coord] = key
+        for tracked in self._images:
+            tracked.dirty.clear()
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "name": name,
+            "created": time.time(),
+            "path": meta.get("path"),
+            "tile_size": self.tile_size,
+            "images": [{"width": t.info[0], "height": t.info[1], "dtype": t.info[2],
+                        "tiles": [t.keys[tx, ty] for tx, ty, _ in self._tile_coords(t.info)]}
+                       for t in self._images],
+            "meta": dict(meta, icc_profile=(meta.get("icc_profile") or b"").hex()),
+        }
+        return self.store.save_manifest(manifest)
+
+    @instrument("snapshots.restore")
+    def restore(self, snapshot_id, document, layers):
+        """Rebuild a snapshot and return ``(document, layers, meta)``.
+
+        The current document and layers are not modified. Tiles that they
+        already hold unchanged since the last snapshot or restore are copied
+        rather than decoded.
+        """
+        manifest = self.store.manifest(snapshot_id)
+        if manifest["tile_size"] != self.tile_size:
+            raise ValueError(f"Snapshot uses {manifest['tile_size']}px tiles, expected {self.tile_size}px")
+        current = [document, *layers]
+        if len(self._images) != len(current):
+            self._images = [None] * len(current)
+
+        restored, tracked_images, jobs = [], [], []
+        for index, entry in enumerate(manifest["images"]):
+            info = (entry["width"], entry["height"], entry["dtype"])
+            coords = self._tile_coords(info)
+            keys = {(tx, ty): key for (tx, ty, _), key in zip(coords, entry["tiles"])}
+            tracked = self._images[index] if index < len(current) else None
+            if tracked is not None and tracked.info == info:
+                arr = np.array(current[index])
+                stale = [(tx, ty, rect) for tx, ty, rect in coords
+                         if (tx, ty) in tracked.dirty or tracked.keys[tx, ty] != keys[tx, ty]]
+            else:
+                arr = np.empty((info[1], info[0], 4), dtype=info[2])
+                stale = coords
+            jobs += [(arr, keys[tx, ty], rect, info[2]) for tx, ty, rect in stale]
+            restored.append(arr)
+            tracked_images.append(_TrackedImage(info, keys))
+
+        def load_tile(job):
+            arr, key, rect, dtype = job
+            x0, y0, x1, y1 = rect
+            arr[y0:y1, x0:x1] = self.store.get(key, rect, dtype)
+
+        with ThreadPoolExecutor(max_workers=self.store.max_workers) as executor:
+            list(executor.map(load_tile, jobs))
+
+        self._images = tracked_images
+        images = [Image.fromarray(arr, "RGBA") if arr.dtype == np.uint8 else arr for arr in restored]
+        meta = dict(manifest["meta"])
+        meta["icc_profile"] = bytes.fromhex(meta.get("icc_profile") or "") or None
+        return images[0], images[1:], meta
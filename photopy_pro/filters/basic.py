@@ -1,115 +1,338 @@
-"""Basic image filters and adjustments."""
+"""Basic image filters and adjustments.
+
+Tone adjustments and the pointwise filters (saturation, sepia, posterize,
+grayscale, invert) also take 16-bit and float document arrays and keep
+their precision. Deep documents keep their alpha through these filters.
+"""
 
 import numpy as np
 import cv2
 from PIL import Image, ImageFilter, ImageChops
 
+from .blur import gaussian_blur
+from ..utils.flood_fill import flood_fill, COLOR_SPACE_RGB
+from ..utils.precision import (
+    PRECISION_UINT8, PRECISION_UINT16, PRECISION_FLOAT32, PRECISION_MAX, lut_size, precision_of
+)
+from ..core.metrics import instrument
+
 
+@instrument()
 def apply_lut_to_pil(pil_img: Image.Image, lut_r, lut_g, lut_b):
     """Applies a lookup table (LUT) to an image."""
     arr = np.array(pil_img.convert("RGBA"), dtype=np.uint8)
-    r, g, b, a = arr[..., 0], arr[..., 1], arr[..., 2], arr[..., 3]
-    r2 = lut_r[r]
-    g2 = lut_g[g]
-    b2 = lut_b[b]
-    out = np.stack([r2, g2, b2, a], axis=-1).astype(np.uint8)
-    return Image.fromarray(out, mode="RGBA")
+    identity = np.arange(256, dtype=np.uint8)
+    lut = np.stack([lut_r, lut_g, lut_b, identity], axis=-1).astype(np.uint8).reshape(1, 256, 4)
+    cv2.LUT(arr, lut, dst=arr)
+    return Image.fromarray(arr, mode="RGBA")
 
 
-def apply_brightness_contrast(pil_img, brightness, contrast):
-    """Applies brightness and contrast adjustments."""
-    arr = np.array(pil_img.convert("RGBA"), dtype=np.float32)
+@instrument()
+def apply_lut_to_array(arr, lut_r, lut_g, lut_b):
+    """Applies per-channel lookup tables to an RGBA array of any precision.
+
+    Tables must have ``lut_size`` entries for the array's precision. 16-bit
+    arrays index their 65536-entry tables directly; float arrays interpolate
+    between table samples spread evenly over 0..1.
+    """
+    precision = precision_of(arr)
+    if precision == PRECISION_UINT8:
+        identity = np.arange(256, dtype=np.uint8)
+        lut = np.stack([lut_r, lut_g, lut_b, identity], axis=-1).reshape(1, 256, 4)
+        return cv2.LUT(arr, lut)
+
+    out = arr.copy()
+    if precision == PRECISION_UINT16:
+        for c, lut in enumerate((lut_r, lut_g, lut_b)):
+            out[..., c] = lut[arr[..., c]]
+        return out
+
+    # A 1-pixel-high remap performs the linear interpolation between samples.
+    rows = np.zeros(arr.shape[:2], dtype=np.float32)
+    for c, lut in enumerate((lut_r, lut_g, lut_b)):
+        positions = arr[..., c] * np.float32(len(lut) - 1)
+        out[..., c] = cv2.remap(lut.reshape(1, -1), positions, rows, cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_REPLICATE)
+    return out
+
+
+def _apply_luts(image, luts):
+    """Applies R, G and B tables to a PIL image or a document array."""
+    if isinstance(image, np.ndarray):
+        return apply_lut_to_array(image, *luts)
+    return apply_lut_to_pil(image, *luts)
+
+
+def _unit_rgb(arr):
+    """RGB of a document array as float32 on 0..1."""
+    return arr[..., :3].astype(np.float32) * np.float32(1 / PRECISION_MAX[precision_of(arr)])
+
+
+def _with_unit_rgb(arr, rgb):
+    """Copy of the document array ``arr`` with its RGB set from 0..1 floats."""
+    precision = precision_of(arr)
+    values = np.clip(rgb, 0, 1) * np.float32(PRECISION_MAX[precision])
+    out = arr.copy()
+    out[..., :3] = values if precision == PRECISION_FLOAT32 else np.rint(values)
+    return out
+
+
+def _finish_lut(values, precision, rounding=np.round):
+    """Converts table values on the 0..255 scale to ``precision``."""
+    scale = PRECISION_MAX[precision] / 255
+    values = np.clip(values * scale, 0, PRECISION_MAX[precision])
+    if precision != PRECISION_FLOAT32:
+        values = rounding(values)
+    return values.astype(precision)
+
+
+def _lut_inputs(precision):
+    """Table input values on the 0..255 scale."""
+    return np.linspace(0, 255, lut_size(precision), dtype=np.float64)
+
+
+def brightness_contrast_lut(brightness, contrast, precision=PRECISION_UINT8):
+    """Builds the lookup table for a brightness/contrast adjustment."""
+    values = _lut_inputs(precision)
 
     # Brightness (simple linear shift)
-    arr[..., :3] += brightness * 2.55
+    values += brightness * 2.55
 
     # Contrast (factor calculation from GIMP)
     f = 131 * (contrast + 127) / (127 * (131 - contrast)) if contrast != -127 else 0
-    arr[..., :3] = (arr[..., :3] - 127.5) * f + 127.5
+    values = (values - 127.5) * f + 127.5
 
-    arr = np.clip(arr, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr, "RGBA")
+    return _finish_lut(values, precision, np.floor)
+
+
+@instrument()
+def apply_brightness_contrast(pil_img, brightness, contrast):
+    """Applies brightness and contrast adjustments."""
+    lut = brightness_contrast_lut(brightness, contrast, precision_of(pil_img))
+    return _apply_luts(pil_img, (lut, lut, lut))
 
 
+@instrument()
 def apply_saturation(pil_img, saturation):
     """Applies saturation adjustment."""
+    if isinstance(pil_img, np.ndarray):
+        hsv = cv2.cvtColor(_unit_rgb(pil_img), cv2.COLOR_RGB2HSV)
+        hsv[..., 1] = np.clip(hsv[..., 1] * (1 + saturation / 100), 0, 1)
+        return _with_unit_rgb(pil_img, cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB))
     arr = np.array(pil_img.convert("HSV"))
-    arr[:, :, 1] = np.clip(arr[:, :, 1] * (1 + saturation / 100), 0, 255).astype(np.uint8)
+    lut = np.clip(np.arange(256) * (1 + saturation / 100), 0, 255).astype(np.uint8)
+    arr[:, :, 1] = cv2.LUT(arr[:, :, 1], lut)
     return Image.fromarray(arr, "HSV").convert("RGBA")
 
 
+LUT_CHANNELS = ("rgb", "red", "green", "blue")
+
+
+def identity_lut(precision=PRECISION_UINT8):
+    """Lookup table that leaves values unchanged."""
+    return _finish_lut(_lut_inputs(precision), precision)
+
+
+def channel_luts(lut, channel, precision=PRECISION_UINT8):
+    """R, G and B tables applying ``lut`` to all colour channels or to one."""
+    if channel not in LUT_CHANNELS:
+        raise ValueError(f"Unknown channel: {channel}")
+    identity = identity_lut(precision)
+    return [lut if channel in ("rgb", name) else identity for name in LUT_CHANNELS[1:]]
+
+
+def _apply_channel_lut(pil_img, lut, channel):
+    """Applies one LUT to all colour channels or to a single one."""
+    return _apply_luts(pil_img, channel_luts(lut, channel, precision_of(pil_img)))
+
+
+def levels_lut(black=0, white=255, gamma=1.0, out_black=0, out_white=255, precision=PRECISION_UINT8):
+    """Builds the lookup table for a levels adjustment.
+
+    Levels are given on the 0..255 scale whatever the precision.
+    """
+    values = _lut_inputs(precision)
+    values = np.clip((values - black) / max(white - black, 1), 0, 1)
+    values = values ** (1.0 / max(gamma, 1e-3))
+    values = out_black + values * (out_white - out_black)
+    return _finish_lut(values, precision)
+
+
+@instrument()
+def apply_levels(pil_img, black=0, white=255, gamma=1.0, out_black=0, out_white=255, channel="rgb"):
+    """Applies a levels adjustment (input range, gamma, output range)."""
+    lut = levels_lut(black, white, gamma, out_black, out_white, precision_of(pil_img))
+    return _apply_channel_lut(pil_img, lut, channel)
+
+
+def curves_lut(points, precision=PRECISION_UINT8):
+    """Builds the lookup table of a tone curve through control points.
+
+    Points are on the 0..255 scale whatever the precision. Uses monotone
+    cubic (Fritsch-Carlson) interpolation, so the curve never overshoots
+    between points; it is flat outside the first and last point.
+    """
+    by_x = {}
+    for x, y in points:
+        by_x[float(x)] = float(y)
+    x = np.array(sorted(by_x), dtype=np.float64)
+    y = np.array([by_x[k] for k in x], dtype=np.float64)
+    values = _lut_inputs(precision)
+
+    if len(x) == 1:
+        curve = np.full(len(values), y[0])
+    elif len(x) == 2:
+        curve = np.interp(values, x, y)
+    else:
+        secants = np.diff(y) / np.diff(x)
+        tangents = np.empty_like(y)
+        tangents[0], tangents[-1] = secants[0], secants[-1]
+        tangents[1:-1] = np.where(secants[:-1] * secants[1:] > 0, (secants[:-1] + secants[1:]) / 2, 0)
+        for i, secant in enumerate(secants):
+            if secant == 0:
+                tangents[i] = tangents[i + 1] = 0
+                continue
+            a, b = tangents[i] / secant, tangents[i + 1] / secant
+            norm = a * a + b * b
+            if norm > 9:
+                scale = 3 / np.sqrt(norm)
+                tangents[i], tangents[i + 1] = scale * a * secant, scale * b * secant
+
+        xs = np.clip(values, x[0], x[-1])
+        k = np.clip(np.searchsorted(x, xs, side="right") - 1, 0, len(x) - 2)
+        step = x[k + 1] - x[k]
+        t = (xs - x[k]) / step
+        t2, t3 = t * t, t * t * t
+        curve = ((2 * t3 - 3 * t2 + 1) * y[k] + (t3 - 2 * t2 + t) * step * tangents[k]
+                 + (-2 * t3 + 3 * t2) * y[k + 1] + (t3 - t2) * step * tangents[k + 1])
+
+    return _finish_lut(curve, precision)
+
+
+@instrument()
+def apply_curves(pil_img, points, channel="rgb"):
+    """Applies a tone curve given as (input, output) control points."""
+    return _apply_channel_lut(pil_img, curves_lut(points, precision_of(pil_img)), channel)
+
+
+@instrument()
 def apply_blur(pil_img, radius):
     """Applies a Gaussian blur filter."""
-    return pil_img.filter(ImageFilter.GaussianBlur(radius))
+    if isinstance(pil_img, np.ndarray):
+        return gaussian_blur(pil_img, radius)
+    arr = np.array(pil_img.convert("RGBA"))
+    return Image.fromarray(gaussian_blur(arr, radius), "RGBA")
 
 
-def apply_sharpen(pil_img, factor):
+@instrument()
+def apply_sharpen(pil_img, factor, radius=2, threshold=3):
     """Applies an unsharp mask filter."""
-    return pil_img.filter(ImageFilter.UnsharpMask(radius=2, percent=factor, threshold=3))
+    arr = np.array(pil_img.convert("RGBA"))
+    rgb = np.ascontiguousarray(arr[..., :3])
+    blurred = gaussian_blur(rgb, radius)
+
+    # out = rgb + (rgb - blurred) * k, saturated in 8 bits
+    k = factor / 100
+    sharpened = cv2.addWeighted(rgb, 1 + k, blurred, -k, 0)
+    low_contrast = cv2.absdiff(rgb, blurred) < threshold
+    np.copyto(sharpened, rgb, where=low_contrast)
+
+    arr[..., :3] = sharpened
+    return Image.fromarray(arr, "RGBA")
 
 
+def sobel_magnitude(gray_arr):
+    """Returns the float32 Sobel gradient magnitude of a grayscale array."""
+    sobel_x = cv2.Sobel(gray_arr, cv2.CV_32F, 1, 0, ksize=3)
+    sobel_y = cv2.Sobel(gray_arr, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(sobel_x, sobel_y, sobel_x)
+
+
+@instrument()
 def edge_detection(pil_img):
     """Performs edge detection using the Sobel operator."""
-    gray = pil_img.convert("L")
-    gray_arr = np.array(gray)
-    sobel_x = cv2.Sobel(gray_arr, cv2.CV_64F, 1, 0, ksize=3)
-    sobel_y = cv2.Sobel(gray_arr, cv2.CV_64F, 0, 1, ksize=3)
-    magnitude = np.sqrt(sobel_x**2 + sobel_y**2)
-    magnitude = magnitude / magnitude.max() * 255 if magnitude.max() > 0 else magnitude
-    magnitude = 255 - magnitude.astype(np.uint8)
-    return Image.fromarray(magnitude).convert("RGBA")
+    gray_arr = np.array(pil_img.convert("L"))
+    magnitude = sobel_magnitude(gray_arr)
+    peak = float(magnitude.max())
+
+    # 255 - magnitude / peak * 255 in one saturating pass
+    scale = -255.0 / peak if peak > 0 else 0.0
+    edges = cv2.convertScaleAbs(magnitude, alpha=scale, beta=255)
+    return Image.fromarray(edges).convert("RGBA")
+
 
+SEPIA_MATRIX = np.array([
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131],
+], dtype=np.float32)
+GRAYSCALE_WEIGHTS = np.array([[0.299, 0.587, 0.114]], dtype=np.float32)
 
+
+@instrument()
 def apply_sepia(pil_img):
     """Applies a sepia tone filter."""
-    arr = np.array(pil_img.convert("RGB"), dtype=np.float32)
-    r = arr[..., 0] * 0.393 + arr[..., 1] * 0.769 + arr[..., 2] * 0.189
-    g = arr[..., 0] * 0.349 + arr[..., 1] * 0.686 + arr[..., 2] * 0.168
-    b = arr[..., 0] * 0.272 + arr[..., 1] * 0.534 + arr[..., 2] * 0.131
-    arr[..., 0] = np.clip(r, 0, 255)
-    arr[..., 1] = np.clip(g, 0, 255)
-    arr[..., 2] = np.clip(b, 0, 255)
-    return Image.fromarray(arr.astype(np.uint8)).convert("RGBA")
+    if isinstance(pil_img, np.ndarray):
+        return _with_unit_rgb(pil_img, cv2.transform(_unit_rgb(pil_img), SEPIA_MATRIX))
+    arr = np.array(pil_img.convert("RGB"))
+    cv2.transform(arr, SEPIA_MATRIX, dst=arr)
+    return Image.fromarray(arr).convert("RGBA")
 
 
+@instrument()
 def apply_posterize(pil_img, bits):
     """Reduces the number of bits for each color channel."""
+    if isinstance(pil_img, np.ndarray):
+        # The same 2 ** bits levels the 8-bit bit replication produces
+        steps = np.minimum(np.floor(_unit_rgb(pil_img) * 2 ** bits), 2 ** bits - 1)
+        return _with_unit_rgb(pil_img, steps * ((2 ** (8 - bits) + 1) / 255))
     arr = np.array(pil_img.convert("RGB"), dtype=np.uint8)
-    mask = 0xFF << (8 - bits)
+    mask = (0xFF << (8 - bits)) & 0xFF
     arr = (arr & mask) | (arr >> (8 - bits))
     return Image.fromarray(arr).convert("RGBA")
 
 
-def remove_background(pil_img):
+@instrument()
+def remove_background(pil_img, tolerance=0, color_space=COLOR_SPACE_RGB, antialias=False):
     """Simple background removal using flood fill on corners."""
     arr = np.array(pil_img.convert("RGBA"))
     h, w = arr.shape[:2]
-    mask = np.zeros((h+2, w+2), np.uint8)
-
-    # Fill from corners
-    cv2.floodFill(arr, mask, (0, 0), (0, 0, 0, 0), flags=cv2.FLOODFILL_FIXED_RANGE)
-    cv2.floodFill(arr, mask, (w-1, 0), (0, 0, 0, 0), flags=cv2.FLOODFILL_FIXED_RANGE)
-    cv2.floodFill(arr, mask, (0, h-1), (0, 0, 0, 0), flags=cv2.FLOODFILL_FIXED_RANGE)
-    cv2.floodFill(arr, mask, (w-1, h-1), (0, 0, 0, 0), flags=cv2.FLOODFILL_FIXED_RANGE)
+    corners = [(0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1)]
 
+    patch, bounds = flood_fill(arr, corners, (0, 0, 0, 0), tolerance,
+                               color_space=color_space, antialias=antialias)
+    if patch is not None:
+        arr[bounds[1]:bounds[3], bounds[0]:bounds[2]] = patch
     return Image.fromarray(arr, "RGBA")
 
 
+@instrument()
 def apply_grayscale(pil_img):
     """Converts the image to grayscale."""
+    if isinstance(pil_img, np.ndarray):
+        # ITU-R 601-2 luma, the weights PIL's "L" conversion uses
+        luma = cv2.transform(_unit_rgb(pil_img), GRAYSCALE_WEIGHTS)
+        return _with_unit_rgb(pil_img, luma[..., np.newaxis])
     return pil_img.convert("L").convert("RGBA")
 
 
+@instrument()
 def apply_invert(pil_img):
     """Inverts the colors of the image."""
+    if isinstance(pil_img, np.ndarray):
+        out = pil_img.copy()
+        out[..., :3] = PRECISION_MAX[precision_of(pil_img)] - pil_img[..., :3]
+        return out
     return ImageChops.invert(pil_img.convert("RGB")).convert("RGBA")
 
 
+@instrument()
 def apply_emboss(pil_img):
     """Applies an emboss filter."""
     return pil_img.filter(ImageFilter.EMBOSS)
 
 
+@instrument()
 def apply_sketch(pil_img):
     """Applies a contour (sketch) filter."""
     return pil_img.filter(ImageFilter.CONTOUR)
\ No newline at end of file
@@ -1,28 +1,332 @@
-"""Image transformation utilities."""
+"""Image transformation utilities.
+
+Transforms work on the RGBA array so alpha is preserved; pixels mapped from
+outside the source become transparent. Homographies and the wave's
+per-row and per-column offsets are cached per size and parameters, and
+images above ``TILED_TRANSFORM_MIN_PIXELS`` are warped tile by tile so
+temporaries stay bounded by the tile size. ``perspective_preview`` warps a
+downscaled copy while corners are dragged.
+
+Seam carving resizes content-aware: it repeatedly removes (or duplicates)
+the connected path of pixels with the least Sobel energy. After each removal
+only the energy next to the seam is recomputed, and large images find their
+seams on a downscaled copy.
+"""
+
+import math
+import weakref
+from functools import lru_cache
 
 import numpy as np
 import cv2
 from PIL import Image
 
+from ..core.metrics import instrument
+from ..utils.precision import PRECISION_UINT8, convert_precision, image_size
+from ..utils.tiles import iter_tiles
+from .basic import sobel_magnitude
 
-def perspective_transform(pil_img, src_points, dst_points):
-    """Performs a perspective transformation."""
+TRANSFORM_TILE_SIZE = 1024
+TILED_TRANSFORM_MIN_PIXELS = 16_000_000
+PREVIEW_MAX_SIZE = 1024
+TRANSPARENT = (0, 0, 0, 0)
+SEAM_ANALYSIS_MAX_PIXELS = 1_000_000
+_SEAM_KERNEL = np.ones((1, 3), dtype=np.uint8)
+
+# (weak reference to the source, max size, downscaled source, scale) of the
+# last preview; the full-size source is not kept alive by the cache.
+_preview_source = None
+
+
+@lru_cache(maxsize=32)
+def _homography(src_points, dst_points):
+    """Cached perspective matrix for a pair of point tuples."""
     src = np.array(src_points, dtype=np.float32)
     dst = np.array(dst_points, dtype=np.float32)
-    M = cv2.getPerspectiveTransform(src, dst)
-    arr = np.array(pil_img.convert("RGB"))
-    transformed = cv2.warpPerspective(arr, M, (pil_img.width, pil_img.height))
-    return Image.fromarray(transformed).convert("RGBA")
+    return cv2.getPerspectiveTransform(src, dst)
+
+
+def _points_key(points):
+    """Hashable, float-normalised form of a point list."""
+    return tuple((float(x), float(y)) for x, y in points)
+
+
+@instrument()
+def perspective_transform(pil_img, src_points, dst_points, tile_size=None):
+    """Performs a perspective transformation."""
+    M = _homography(_points_key(src_points), _points_key(dst_points))
+    arr = np.array(pil_img.convert("RGBA"))
+    h, w = arr.shape[:2]
+
+    if tile_size is None and w * h < TILED_TRANSFORM_MIN_PIXELS:
+        transformed = cv2.warpPerspective(arr, M, (w, h), borderMode=cv2.BORDER_CONSTANT,
+                                          borderValue=TRANSPARENT)
+    else:
+        transformed = _warp_perspective_tiled(arr, M, (w, h), tile_size or TRANSFORM_TILE_SIZE)
+    return Image.fromarray(transformed, "RGBA")
+
 
+def _warp_perspective_tiled(arr, M, size, tile_size):
+    """Warps each output tile from the part of the source that maps onto it."""
+    w, h = size
+    src_h, src_w = arr.shape[:2]
+    out = np.zeros((h, w, arr.shape[2]), dtype=arr.dtype)
+    M_inv = np.linalg.inv(M)
 
-def warp_image(pil_img, amplitude=10, frequency=0.05):
+    for x0, y0, x1, y1 in iter_tiles(w, h, tile_size):
+        corners = np.array([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]]], dtype=np.float64)
+        denom = M_inv[2, 0] * corners[..., 0] + M_inv[2, 1] * corners[..., 1] + M_inv[2, 2]
+        if np.all(denom > 0):
+            src_corners = cv2.perspectiveTransform(corners, M_inv)[0]
+            sx0 = int(max(0, np.floor(src_corners[:, 0].min()) - 2))
+            sy0 = int(max(0, np.floor(src_corners[:, 1].min()) - 2))
+            sx1 = int(min(src_w, np.ceil(src_corners[:, 0].max()) + 3))
+            sy1 = int(min(src_h, np.ceil(src_corners[:, 1].max()) + 3))
+        else:
+            # The tile straddles the horizon line; fall back to the full source.
+            sx0, sy0, sx1, sy1 = 0, 0, src_w, src_h
+        if sx1 <= sx0 or sy1 <= sy0:
+            continue
+
+        # Source crop -> full source -> destination -> tile coordinates
+        shift_src = np.array([[1, 0, sx0], [0, 1, sy0], [0, 0, 1]], dtype=np.float64)
+        shift_dst = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64)
+        M_tile = shift_dst @ M @ shift_src
+        out[y0:y1, x0:x1] = cv2.warpPerspective(
+            arr[sy0:sy1, sx0:sx1], M_tile, (x1 - x0, y1 - y0),
+            borderMode=cv2.BORDER_CONSTANT, borderValue=TRANSPARENT)
+    return out
+
+
+def perspective_preview(pil_img, src_points, dst_points, max_size=PREVIEW_MAX_SIZE):
+    """Low-resolution perspective warp for interactive dragging.
+
+    Returns the preview image and the factor from full-resolution to preview
+    coordinates. The downscaled source is reused while the same image is
+    being dragged.
+    """
+    global _preview_source
+    cached = _preview_source
+    if cached is not None and cached[0]() is pil_img and cached[1] == max_size:
+        small, scale = cached[2], cached[3]
+    else:
+        scale = min(1.0, max_size / max(pil_img.width, pil_img.height))
+        size = (max(1, round(pil_img.width * scale)), max(1, round(pil_img.height * scale)))
+        small = pil_img.convert("RGBA").resize(size, Image.Resampling.BILINEAR)
+        _preview_source = (weakref.ref(pil_img), max_size, small, scale)
+
+    src = [(x * scale, y * scale) for x, y in src_points]
+    dst = [(x * scale, y * scale) for x, y in dst_points]
+    return perspective_transform(small, src, dst), scale
+
+
+@lru_cache(maxsize=16)
+def _wave_offsets(width, height, amplitude, frequency):
+    """Per-row x offsets and per-column y offsets of the wave warp."""
+    rows = np.arange(height, dtype=np.float32)
+    cols = np.arange(width, dtype=np.float32)
+    dx = (amplitude * np.sin(2 * np.pi * frequency * rows)).astype(np.float32)
+    dy = (amplitude * np.cos(2 * np.pi * frequency * cols)).astype(np.float32)
+    return dx, dy
+
+
+def _wave_maps_region(width, height, amplitude, frequency, rect):
+    """Fixed-point remap grids for the given output rectangle."""
+    x0, y0, x1, y1 = rect
+    dx, dy = _wave_offsets(width, height, amplitude, frequency)
+    cols = np.arange(x0, x1, dtype=np.float32)
+    rows = np.arange(y0, y1, dtype=np.float32)
+    map_x = cols[np.newaxis, :] + dx[y0:y1, np.newaxis]
+    map_y = rows[:, np.newaxis] + dy[np.newaxis, x0:x1]
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+
+@instrument()
+def warp_image(pil_img, amplitude=10, frequency=0.05, tile_size=None):
     """Applies a wave-like warp effect."""
-    arr = np.array(pil_img.convert("RGB"))
+    arr = np.array(pil_img.convert("RGBA"))
     rows, cols = arr.shape[0], arr.shape[1]
-    x, y = np.meshgrid(np.arange(cols), np.arange(rows))
-    dx = amplitude * np.sin(2 * np.pi * frequency * y)
-    dy = amplitude * np.cos(2 * np.pi * frequency * x)
-    map_x = (x + dx).astype(np.float32)
-    map_y = (y + dy).astype(np.float32)
-    warped = cv2.remap(arr, map_x, map_y, cv2.INTER_LINEAR)
-    return Image.fromarray(warped).convert("RGBA")
\ No newline at end of file
+    amplitude, frequency = float(amplitude), float(frequency)
+
+    if tile_size is None and rows * cols < TILED_TRANSFORM_MIN_PIXELS:
+        # Only the per-row and per-column offsets are cached; full-frame grids
+        # are 6 bytes per pixel and would pin hundreds of MB in a cache.
+        map1, map2 = _wave_maps_region(cols, rows, amplitude, frequency, (0, 0, cols, rows))
+        warped = cv2.remap(arr, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+                           borderValue=TRANSPARENT)
+        return Image.fromarray(warped, "RGBA")
+
+    warped = np.empty_like(arr)
+    for rect in iter_tiles(cols, rows, tile_size or TRANSFORM_TILE_SIZE):
+        x0, y0, x1, y1 = rect
+        map1, map2 = _wave_maps_region(cols, rows, amplitude, frequency, rect)
+        warped[y0:y1, x0:x1] = cv2.remap(arr, map1, map2, cv2.INTER_LINEAR,
+                                         borderMode=cv2.BORDER_CONSTANT, borderValue=TRANSPARENT)
+    return Image.fromarray(warped, "RGBA")
+
+
+def _reflect101(index, size):
+    """Maps out-of-range indices the way OpenCV's default border does."""
+    index = np.abs(index)
+    return np.where(index >= size, 2 * (size - 1) - index, index)
+
+
+def _min_seam(energy):
+    """Column of the lowest-energy 8-connected vertical seam in each row."""
+    h = energy.shape[0]
+    cost = np.empty_like(energy)
+    cost[0] = energy[0]
+    for y in range(1, h):
+        # A 1x3 erosion is the minimum over the three parents of every pixel.
+        cv2.erode(cost[y - 1:y], _SEAM_KERNEL, dst=cost[y:y + 1], borderType=cv2.BORDER_REPLICATE)
+        cost[y] += energy[y]
+
+    seam = np.empty(h, dtype=np.intp)
+    x = int(np.argmin(cost[-1]))
+    seam[-1] = x
+    for y in range(h - 2, -1, -1):
+        lo = max(x - 1, 0)
+        x = lo + int(np.argmin(cost[y, lo:x + 2]))
+        seam[y] = x
+    return seam
+
+
+def _update_energy(energy, gray, seam, detail=None):
+    """Recomputes, in place, the energy of the pixels next to a removed seam.
+
+    Only pixels whose 3x3 Sobel neighbourhood straddled the seam change; the
+    result matches a full ``sobel_magnitude`` of ``gray`` (plus ``detail``).
+    """
+    h, w = gray.shape
+    rows = np.arange(h)[:, np.newaxis]
+    cols = np.clip(seam[:, np.newaxis] + np.arange(-2, 2), 0, w - 1)
+    up, down = _reflect101(rows - 1, h), _reflect101(rows + 1, h)
+    left, right = _reflect101(cols - 1, w), _reflect101(cols + 1, w)
+
+    def px(r, c):
+        return gray[r, c].astype(np.float32)
+
+    gx = px(up, right) + 2 * px(rows, right) + px(down, right) - px(up, left) - 2 * px(rows, left) - px(down, left)
+    gy = px(down, left) + 2 * px(down, cols) + px(down, right) - px(up, left) - 2 * px(up, cols) - px(up, right)
+    magnitude = cv2.magnitude(gx, gy)
+    if detail is not None:
+        magnitude += detail[rows, cols]
+    energy[rows, cols] = magnitude
+
+
+def _find_seams(gray, count, detail=None):
+    """Mask of the pixels of ``count`` successive minimum seams, one per row each.
+
+    ``detail`` is a fixed energy added to the Sobel energy of ``gray``.
+    """
+    h, w = gray.shape
+    energy = sobel_magnitude(gray)
+    if detail is not None:
+        energy += detail
+    # Original column of every remaining pixel
+    index = np.tile(np.arange(w, dtype=np.int32), (h, 1))
+    removed = np.zeros((h, w), dtype=bool)
+    rows = np.arange(h)
+
+    for _ in range(count):
+        seam = _min_seam(energy)
+        removed[rows, index[rows, seam]] = True
+        keep = np.ones(gray.shape, dtype=bool)
+        keep[rows, seam] = False
+        width = gray.shape[1] - 1
+        gray = gray[keep].reshape(h, width)
+        energy = energy[keep].reshape(h, width)
+        index = index[keep].reshape(h, width)
+        if detail is not None:
+            detail = detail[keep].reshape(h, width)
+        if h > 1 and width > 1:
+            _update_energy(energy, gray, seam, detail)
+        else:
+            energy = sobel_magnitude(gray) if detail is None else sobel_magnitude(gray) + detail
+    return removed
+
+
+def _seam_mask(gray, count, multires, max_analysis_pixels):
+    """Mask of ``count`` pixels per row to remove from ``gray``.
+
+    In multi-resolution mode seams are found on a copy shrunk by a whole
+    factor to at most ``max_analysis_pixels``, with the full-size energy
+    averaged down so fine texture still counts. Each of its seams covers a
+    band of full-size pixels, and every row drops its ``count``
+    lowest-energy pixels inside those bands.
+    """
+    h, w = gray.shape
+    factor = math.ceil(math.sqrt(w * h / max_analysis_pixels))
+    if not multires or factor < 2 or w < 2 * factor:
+        return _find_seams(gray, count)
+
+    energy = sobel_magnitude(gray)
+    small_size = (-(-w // factor), -(-h // factor))
+    small = cv2.resize(gray, small_size, interpolation=cv2.INTER_AREA)
+    detail = cv2.resize(energy, small_size, interpolation=cv2.INTER_AREA)
+    small_count = min(small_size[0] - 1, -(-count // factor))
+    guide = _find_seams(small, small_count, detail)
+    guide = np.repeat(np.repeat(guide, factor, axis=0), factor, axis=1)[:h, :w]
+
+    # Pixels in a seam band rank before all others; energy breaks ties.
+    energy[~guide] += float(energy.max()) + 1
+    order = np.argpartition(energy, count - 1, axis=1)[:, :count]
+    removed = np.zeros((h, w), dtype=bool)
+    np.put_along_axis(removed, order, True, axis=1)
+    return removed
+
+
+def _carve_columns(arr, gray, target_width, multires, max_analysis_pixels):
+    """``arr`` resized to ``target_width`` columns by removing or duplicating seams."""
+    h, w = gray.shape
+    count = abs(target_width - w)
+    if count == 0:
+        return arr
+    removed = _seam_mask(gray, count, multires, max_analysis_pixels)
+    if target_width < w:
+        return arr[~removed].reshape(h, target_width, arr.shape[2])
+
+    # Enlarging inserts each seam that would be removed first, as the
+    # average of its pixels and their right neighbours.
+    flat = arr.reshape(h * w, arr.shape[2])
+    source = np.repeat(np.arange(h * w), 1 + removed.ravel())
+    out = flat[source]
+    inserted = np.zeros(len(source), dtype=bool)
+    inserted[1:] = source[1:] == source[:-1]
+    seam_pixels = source[inserted]
+    right = np.where(seam_pixels % w < w - 1, seam_pixels + 1, seam_pixels)
+    average = (flat[seam_pixels].astype(np.float32) + flat[right]) / 2
+    if arr.dtype != np.float32:
+        np.rint(average, out=average)
+    out[inserted] = average.astype(arr.dtype)
+    return out.reshape(h, target_width, arr.shape[2])
+
+
+def _energy_gray(arr):
+    """8-bit luminance used for the seam energy."""
+    return cv2.cvtColor(convert_precision(np.ascontiguousarray(arr), PRECISION_UINT8), cv2.COLOR_RGBA2GRAY)
+
+
+@instrument()
+def seam_carve(image, width, height, multires=None, max_analysis_pixels=SEAM_ANALYSIS_MAX_PIXELS):
+    """Content-aware resize of a PIL image or document array to ``width`` x ``height``.
+
+    Each dimension can shrink to one pixel or grow to just under double.
+    ``multires`` finds seams on a downscaled copy, trading some accuracy for
+    speed; by default it is used for images above ``max_analysis_pixels``.
+    """
+    w, h = image_size(image)
+    if not (1 <= width < 2 * w and 1 <= height < 2 * h):
+        raise ValueError(f"Cannot seam carve {w}x{h} to {width}x{height}")
+    if multires is None:
+        multires = w * h > max_analysis_pixels
+
+    is_pil = isinstance(image, Image.Image)
+    arr = np.asarray(image.convert("RGBA")) if is_pil else image
+    arr = _carve_columns(arr, _energy_gray(arr), width, multires, max_analysis_pixels)
+    if height != h:
+        # Rows are carved as the columns of the transposed image.
+        transposed = arr.transpose(1, 0, 2)
+        carved = _carve_columns(transposed, _energy_gray(transposed), height, multires, max_analysis_pixels)
+        arr = np.ascontiguousarray(carved.transpose(1, 0, 2))
+    return Image.fromarray(arr, "RGBA") if is_pil else arr
@@ -0,0 +1,5 @@
+"""Run the render service: ``python -m photopy_pro.service``."""
+
+from .server import main
+
+main()
@@ -0,0 +1,171 @@
+"""Render work done in the service's worker processes.
+
+A render takes one input image, optional extra layers and a chain of steps.
+Registered operations run through ``Macro``, so tone adjustments are fused
+exactly as in the editor. ``blend`` steps composite another uploaded image
+or a solid colour with ``blend_images``. Each worker keeps an LRU of recently
+decoded inputs keyed by content hash, so repeated requests for the same
+product photo skip decoding.
+"""
+
+import hashlib
+import io
+from collections import OrderedDict
+
+from PIL import Image
+
+from ..core.macros import Macro, OPERATIONS, OTHER_OPERATIONS
+from ..utils.blend_modes import BLEND_MODES, blend_images
+from ..utils.color_management import open_document, save_options
+
+DECODE_CACHE_SIZE = 8
+DECODE_CACHE_MAX_PIXELS = 200_000_000
+DEFAULT_JPEG_QUALITY = 90
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "tiff": ("TIFF", "image/tiff"),
+}
+BLEND_OPERATION = "blend"
+
+
+class RenderError(ValueError):
+    """A request that cannot be rendered as given (reported as HTTP 400)."""
+
+
+def input_key(data):
+    """Content hash identifying an uploaded image."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class DecodeCache:
+    """Decoded documents by input hash, bounded by count and total pixels."""
+
+    def __init__(self, max_items=DECODE_CACHE_SIZE, max_pixels=DECODE_CACHE_MAX_PIXELS):
+        self.max_items = max_items
+        self.max_pixels = max_pixels
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, data):
+        """``(image, icc_profile)`` of ``data``, decoding it only on a miss."""
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+        self.misses += 1
+        try:
+            with Image.open(io.BytesIO(data)) as opened:
+                item = open_document(opened)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise RenderError(f"Cannot decode image: {e}") from e
+        item[0].readonly = True
+        self._items[key] = item
+        while len(self._items) > self.max_items or (
+                len(self._items) > 1 and self._pixels() > self.max_pixels):
+            self._items.popitem(last=False)
+        return item
+
+    def _pixels(self):
+        return sum(image.width * image.height for image, _ in self._items.values())
+
+
+_cache = None
+
+
+def init_worker():
+    """Process pool initializer."""
+    global _cache
+    _cache = DecodeCache()
+
+
+def validate_steps(steps, layer_names=()):
+    """Check a step chain before it is queued; raises ``RenderError``."""
+    if not isinstance(steps, list):
+        raise RenderError("operations must be a list of steps")
+    for step in steps:
+        if not isinstance(step, dict) or not isinstance(step.get("operation"), str):
+            raise RenderError(f"Invalid step: {step!r}")
+        operation = step["operation"]
+        params = step.get("params", {})
+        if not isinstance(params, dict):
+            raise RenderError(f"Parameters of {operation} must be an object")
+        if operation == BLEND_OPERATION:
+            mode = params.get("mode", "normal")
+            if not isinstance(mode, str) or mode not in BLEND_MODES:
+                raise RenderError(f"Unknown blend mode: {mode!r}")
+            if "layer" in params and (not isinstance(params["layer"], str) or params["layer"] not in layer_names):
+                raise RenderError(f"Unknown layer: {params['layer']!r}")
+            if "layer" not in params and "color" not in params:
+                raise RenderError("blend needs a layer or a color")
+            color = params.get("color", [0, 0, 0])
+            if not isinstance(color, list) or len(color) not in (3, 4) or not all(
+                    type(c) is int and 0 <= c <= 255 for c in color):
+                raise RenderError(f"blend color must be 3 or 4 integers from 0 to 255: {color!r}")
+            opacity = params.get("opacity", 1.0)
+            if type(opacity) not in (int, float) or not 0 <= opacity <= 1:
+                raise RenderError(f"blend opacity must be a number from 0 to 1: {opacity!r}")
+        elif operation not in OPERATIONS and operation not in OTHER_OPERATIONS:
+            raise RenderError(f"Unknown operation: {operation}")
+
+
+def _blend(image, layers, mode="normal", opacity=1.0, layer=None, color=None):
+    """Composite an uploaded layer (resized to fit) or a solid colour over ``image``."""
+    if layer is not None:
+        top = layers[layer]
+        if top.size != image.size:
+            top = top.resize(image.size, Image.Resampling.LANCZOS)
+    else:
+        top = Image.new("RGBA", image.size, tuple(color))
+    if opacity < 1:
+        top = top.copy()
+        top.putalpha(top.getchannel("A").point(lambda a: round(a * opacity)))
+    return blend_images(image, top, mode)
+
+
+def run_chain(image, steps, layers=None):
+    """Apply a chain of steps; runs of registered operations replay as one macro."""
+    pending = []
+    for step in steps + [None]:
+        if step is not None and step["operation"] != BLEND_OPERATION:
+            pending.append((step["operation"], step.get("params", {})))
+            continue
+        if pending:
+            image = Macro(pending).apply(image)
+            pending = []
+        if step is not None:
+            image = _blend(image.convert("RGBA"), layers or {}, **step.get("params", {}))
+    return image
+
+
+def encode(image, output_format, icc_profile, quality=DEFAULT_JPEG_QUALITY):
+    """Encoded bytes and content type of the result."""
+    if output_format not in OUTPUT_FORMATS:
+        raise RenderError(f"Unsupported output format: {output_format}")
+    file_format, content_type = OUTPUT_FORMATS[output_format]
+    if file_format == "JPEG":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    options = {"quality": quality} if file_format in ("JPEG", "WEBP") else {}
+    image.save(buffer, format=file_format, **options, **save_options(file_format, icc_profile))
+    return buffer.getvalue(), content_type
+
+
+def render(key, data, steps, layers=None, output_format="png", quality=DEFAULT_JPEG_QUALITY):
+    """Worker entry point: decode (or reuse) the input, apply ``steps`` and encode.
+
+    ``layers`` maps names to ``(key, data)`` of extra images used by blend
+    steps. Returns ``(body, content_type)``.
+    """
+    image, icc_profile = _cache.get(key, data)
+    decoded_layers = {name: _cache.get(*layer)[0] for name, layer in (layers or {}).items()}
+    try:
+        result = run_chain(image, steps, decoded_layers)
+    except (TypeError, KeyError, IndexError, ValueError) as e:
+        # Operations reject out-of-range parameters with ValueError.
+        raise RenderError(f"Invalid parameters: {e}") from e
+    return encode(result, output_format, icc_profile, quality)
@@ -0,0 +1,365 @@
+"""Local HTTP render service.
+
+Exposes the filter engine to headless clients::
+
+    python -m photopy_pro.service --port 8765
+
+``POST /render`` takes the image either as the raw request body, with the
+other fields in the query string, or as ``multipart/form-data`` with an
+``image`` part. Fields:
+
+* ``operations``: JSON list of ``{"operation": ..., "params": {...}}`` steps,
+  using the macro operation names, plus ``blend`` (``mode``, ``opacity`` and
+  either ``layer``, the name of another uploaded part, or ``color``),
+* ``format``: ``png`` (default), ``jpeg``, ``webp`` or ``tiff``,
+* ``quality``: JPEG/WebP quality.
+
+The response body is streamed in chunks. ``GET /operations`` lists the
+step names and blend modes, and ``GET /health`` reports the queue.
+
+The HTTP layer is a small HTTP/1.1 implementation on asyncio streams, so the
+service needs nothing beyond the editor's own dependencies. Renders run in a
+process pool. A semaphore bounds the requests queued or running; a request
+that cannot get a slot within ``queue_timeout`` is answered with 503, and
+one that runs past ``timeout`` with 504. Each worker is a separate
+process pool, so a render that misses its deadline is terminated and its
+worker replaced rather than left holding a slot; a worker that dies is
+replaced the same way.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from .render import (
+    BLEND_OPERATION, DEFAULT_JPEG_QUALITY, OUTPUT_FORMATS, RenderError, init_worker, input_key, render,
+    validate_steps
+)
+from ..core.macros import OPERATIONS, OTHER_OPERATIONS
+from ..utils.blend_modes import BLEND_MODES
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_QUEUE_TIMEOUT = 5.0
+REQUESTS_PER_WORKER = 2
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 256 * 1024 * 1024
+RESPONSE_CHUNK_SIZE = 64 * 1024
+KEEP_ALIVE_TIMEOUT = 30.0
+
+
+class HTTPError(Exception):
+    """An error answered with ``status`` and a JSON message."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def _parse_head(head):
+    """Method, target, version and lower-cased headers of a request head."""
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def _parse_multipart(content_type, body):
+    """Form fields (str) and files (bytes) of a multipart body, by part name."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    if not message.is_multipart():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed multipart body")
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None or part.get_content_maintype() == "image":
+            files[name] = payload
+        else:
+            try:
+                fields[name] = payload.decode("utf-8")
+            except UnicodeDecodeError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Field {name} is not UTF-8 text")
+    return fields, files
+
+
+class RenderService:
+    """Asyncio HTTP front end over a render process pool."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, max_workers=None, timeout=DEFAULT_TIMEOUT,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, max_body_bytes=MAX_BODY_BYTES):
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.max_body_bytes = max_body_bytes
+        self.max_requests = self.max_workers * REQUESTS_PER_WORKER
+        self.server = None
+        self._slots = None
+        # One single-process pool per worker, so a render that misses its
+        # deadline can be killed without touching the others.
+        self._idle = None
+        self._busy = set()
+        self._closing = False
+        self.in_flight = 0
+
+    async def start(self):
+        """Start the workers and listen; returns the bound port (useful with port 0)."""
+        self._slots = asyncio.Semaphore(self.max_requests)
+        self._idle = asyncio.Queue()
+        for _ in range(self.max_workers):
+            self._idle.put_nowait(self._start_worker())
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                 limit=MAX_HEADER_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    @staticmethod
+    def _start_worker():
+        # Spawned workers do not inherit the parent's threads and state.
+        return ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker)
+
+    @staticmethod
+    def _kill_worker(worker):
+        """Terminate a worker's process, whatever it is doing."""
+        # ProcessPoolExecutor has no public way to stop a running task.
+        for process in list((worker._processes or {}).values()):
+            process.terminate()
+        worker.shutdown(wait=False, cancel_futures=True)
+
+    async def close(self):
+        """Stop listening, kill running renders and shut the workers down."""
+        self._closing = True
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for worker in list(self._busy):
+            self._kill_worker(worker)
+        while self._idle is not None and not self._idle.empty():
+            # Idle workers exit on their own once shut down; nothing here waits for them.
+            self._idle.get_nowait().shutdown(wait=False)
+
+    async def serve_forever(self):
+        """Run until cancelled."""
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    # Connections ----------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        """Serve requests on one connection until it closes."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._send_error(writer, HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                                             "Request header too large"))
+                    return
+                keep_alive = await self._handle_request(head, reader, writer)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def _handle_request(self, head, reader, writer):
+        """Answer one request; returns whether the connection stays open."""
+        try:
+            method, target, version, headers = _parse_head(head)
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            body = await self._read_body(reader, headers)
+        except HTTPError as e:
+            await self._send_error(writer, e)
+            return False
+
+        url = urlsplit(target)
+        try:
+            if url.path == "/render":
+                if method != "POST":
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST", {"Allow": "POST"})
+                content, content_type = await self._render(url.query, headers, body)
+                await self._send(writer, HTTPStatus.OK, content, content_type, keep_alive)
+            elif url.path in ("/health", "/operations"):
+                if method != "GET":
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET", {"Allow": "GET"})
+                data = self._health() if url.path == "/health" else self._operations()
+                await self._send(writer, HTTPStatus.OK, json.dumps(data).encode(), "application/json", keep_alive)
+            else:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+        except HTTPError as e:
+            await self._send_error(writer, e, keep_alive)
+        except ConnectionError:
+            return False
+        except Exception as e:
+            # Answer unexpected failures rather than dropping the connection.
+            await self._send_error(writer, HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}"))
+            return False
+        return keep_alive
+
+    async def _read_body(self, reader, headers):
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.max_body_bytes:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body exceeds {self.max_body_bytes} bytes")
+        try:
+            return await reader.readexactly(length) if length else b""
+        except asyncio.IncompleteReadError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body shorter than Content-Length")
+
+    # Endpoints ------------------------------------------------------------
+
+    def _health(self):
+        return {"status": "ok", "workers": self.max_workers, "in_flight": self.in_flight,
+                "capacity": self.max_requests}
+
+    @staticmethod
+    def _operations():
+        return {"operations": sorted(OPERATIONS) + list(OTHER_OPERATIONS) + [BLEND_OPERATION],
+                "blend_modes": BLEND_MODES, "formats": sorted(OUTPUT_FORMATS)}
+
+    def _render_arguments(self, query, headers, body):
+        """Validated ``render`` arguments from either request form."""
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            fields, files = _parse_multipart(content_type, body)
+            image = files.pop("image", None)
+        else:
+            fields = {name: values[-1] for name, values in parse_qs(query).items()}
+            image, files = body, {}
+        if not image:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "No image in the request")
+        try:
+            steps = json.loads(fields.get("operations", "[]"))
+            quality = int(fields.get("quality", DEFAULT_JPEG_QUALITY))
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid field: {e}")
+        output_format = fields.get("format", "png").lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unsupported output format: {output_format}")
+        try:
+            validate_steps(steps, files.keys())
+        except RenderError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        layers = {name: (input_key(data), data) for name, data in files.items()}
+        return input_key(image), image, steps, layers, output_format, quality
+
+    async def _render(self, query, headers, body):
+        """Queue a render with backpressure and a deadline."""
+        # Multipart parsing and input hashing scale with the body, so they run off the event loop.
+        arguments = await asyncio.get_running_loop().run_in_executor(
+            None, self._render_arguments, query, headers, body)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many requests in progress",
+                            {"Retry-After": "1"})
+
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(self._run(arguments), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, f"Render took longer than {self.timeout} s")
+        except RenderError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        except BrokenProcessPool:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "Render worker crashed")
+        except Exception as e:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, f"Render failed: {e}")
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def _run(self, arguments):
+        """Render on an idle worker; a worker that is cancelled or dies is replaced."""
+        worker = await self._idle.get()
+        self._busy.add(worker)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(worker, render, *arguments)
+        except (asyncio.CancelledError, BrokenProcessPool):
+            # Missed the deadline (or crashed): the process may still be busy, so kill it.
+            self._kill_worker(worker)
+            self._busy.discard(worker)
+            worker = None if self._closing else self._start_worker()
+            raise
+        finally:
+            self._busy.discard(worker)
+            if worker is not None:
+                self._idle.put_nowait(worker)
+
+    # Responses ------------------------------------------------------------
+
+    async def _send(self, writer, status, content, content_type, keep_alive, headers=None):
+        """Write a response, streaming the body in chunked encoding."""
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+                 f"Content-Type: {content_type}",
+                 "Transfer-Encoding: chunked",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        view = memoryview(content)
+        for start in range(0, len(view), RESPONSE_CHUNK_SIZE):
+            chunk = view[start:start + RESPONSE_CHUNK_SIZE]
+            writer.write(b"%x\r\n" % len(chunk))
+            writer.write(chunk)
+            writer.write(b"\r\n")
+            # Waits while the client is slower than the chunks are produced.
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _send_error(self, writer, error, keep_alive=False):
+        body = json.dumps({"error": error.message}).encode()
+        try:
+            await self._send(writer, error.status, body, "application/json", keep_alive, error.headers)
+        except ConnectionError:
+            pass
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="PhotoPy Pro render service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per render")
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help="seconds a request may wait for a free slot")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.host, args.port, args.workers, args.timeout, args.queue_timeout)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
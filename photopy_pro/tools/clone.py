@@ -0,0 +1,287 @@
+"""Clone and heal tools.
+
+Both sample from an offset source and stamp along the stroke's dab path.
+The heal variant additionally blends each stroke segment into its
+surroundings with a Poisson solve (``cv2.seamlessClone``) restricted to the
+segment's bounding box plus a margin, so extending a stroke only solves the
+new part. Strokes draw straight into the RGBA image; only the tiles they
+touch are copied, to keep the original pixels for sampling and history.
+"""
+
+import numpy as np
+import cv2
+from PIL import Image
+from PyQt6.QtCore import Qt
+
+from .stroke import DEFAULT_DAB_SPACING, dab_mask, dab_positions, dab_rect
+from ..utils.tiles import expand_rect
+
+SOURCE_TILE_SIZE = 256
+HEAL_MARGIN = 8
+HEAL_SEGMENT_DABS = 8
+
+
+def _read_rect(image, rect):
+    """Writable RGBA array of ``rect`` of a PIL image or array."""
+    if isinstance(image, Image.Image):
+        return np.array(image.crop(rect))
+    x0, y0, x1, y1 = rect
+    return image[y0:y1, x0:x1].copy()
+
+
+def _write_rect(image, rect, region):
+    """Store ``region`` at ``rect`` of a PIL image or array."""
+    if isinstance(image, Image.Image):
+        image.paste(Image.fromarray(region, "RGBA"), rect[:2])
+    else:
+        x0, y0, x1, y1 = rect
+        image[y0:y1, x0:x1] = region
+
+
+def _size(image):
+    """(width, height) of a PIL image or array."""
+    if isinstance(image, Image.Image):
+        return image.size
+    return image.shape[1], image.shape[0]
+
+
+def _union(a, b):
+    """Bounding rectangle of two (x0, y0, x1, y1) rectangles, either may be None."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+class SourceSampler:
+    """Reads pixels as they were when the stroke started.
+
+    Instead of copying the whole image up front, tiles are preserved the
+    first time the stroke is about to modify them.
+    """
+
+    def __init__(self, image, tile_size=SOURCE_TILE_SIZE):
+        self.image = image
+        self.tile_size = tile_size
+        self.tiles = {}
+
+    def _tile_keys(self, rect):
+        x0, y0, x1, y1 = rect
+        t = self.tile_size
+        for ty in range(y0 // t, (y1 - 1) // t + 1):
+            for tx in range(x0 // t, (x1 - 1) // t + 1):
+                yield tx, ty
+
+    def preserve(self, rect):
+        """Save original tiles overlapping ``rect`` before it is modified."""
+        t = self.tile_size
+        for key in self._tile_keys(rect):
+            if key not in self.tiles:
+                tx, ty = key
+                width, height = _size(self.image)
+                rect = (tx * t, ty * t, min((tx + 1) * t, width), min((ty + 1) * t, height))
+                self.tiles[key] = _read_rect(self.image, rect)
+
+    def read(self, rect):
+        """Original pixels of ``rect``."""
+        x0, y0, x1, y1 = rect
+        out = _read_rect(self.image, rect)
+        t = self.tile_size
+        for tx, ty in self._tile_keys(rect):
+            tile = self.tiles.get((tx, ty))
+            if tile is None:
+                continue
+            ox, oy = tx * t, ty * t
+            sx0, sy0 = max(x0, ox), max(y0, oy)
+            sx1, sy1 = min(x1, ox + tile.shape[1]), min(y1, oy + tile.shape[0])
+            out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = tile[sy0 - oy:sy1 - oy, sx0 - ox:sx1 - ox]
+        return out
+
+
+class CloneEngine:
+    """Stamps source pixels along a stroke, optionally healing each segment."""
+
+    def __init__(self, radius=20, hardness=0.5, opacity=1.0, spacing=DEFAULT_DAB_SPACING,
+                 heal=False, heal_margin=HEAL_MARGIN, segment_dabs=HEAL_SEGMENT_DABS):
+        self.radius = radius
+        self.hardness = hardness
+        self.opacity = opacity
+        self.spacing = spacing
+        self.heal = heal
+        self.heal_margin = heal_margin
+        self.segment_dabs = segment_dabs
+        self.offset = None
+        self.target = None
+
+    def begin_stroke(self, image, point, offset):
+        """Start a stroke on an RGBA PIL image or writable array; returns dirty bounds.
+
+        ``image`` is modified in place as the stroke is drawn.
+        """
+        self.target = image
+        self.offset = (int(round(offset[0])), int(round(offset[1])))
+        self.sampler = SourceSampler(image)
+        w, h = _size(image)
+        # Lazily committed, so only the pages under the stroke are allocated.
+        self.coverage = np.zeros((h, w), dtype=np.uint8)
+        self.stroke_bounds = None
+        self.last_point = point
+        self.carry = 0.0
+        self.segment_bounds = None
+        self.segment_count = 0
+        return self._stamp([point])
+
+    def stroke_to(self, point):
+        """Extend the stroke to ``point``; returns the dirty bounds or None."""
+        positions, self.carry = dab_positions(self.last_point, point,
+                                              self.spacing * (2 * self.radius + 1), self.carry)
+        self.last_point = point
+        return self._stamp(positions)
+
+    def end_stroke(self):
+        """Finish the stroke and return (before, after, bounds) for history."""
+        if self.heal:
+            self._flush_segment()
+        bounds = self.stroke_bounds
+        target = self.target
+        self.target = None
+        if bounds is None:
+            return None, None, None
+        return self.sampler.read(bounds), _read_rect(target, bounds), bounds
+
+    def _stamp(self, positions):
+        """Clone each dab from the source; heal full segments."""
+        w, h = _size(self.target)
+        dx, dy = self.offset
+        mask = dab_mask(self.radius, self.hardness)
+        dirty = None
+
+        for center in positions:
+            (x0, y0, x1, y1), (ox, oy) = dab_rect(center, self.radius, w, h)
+            # Clip further so the source rectangle stays in the image too.
+            x0, y0 = max(x0, -dx), max(y0, -dy)
+            x1, y1 = min(x1, w - dx), min(y1, h - dy)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            rect = (x0, y0, x1, y1)
+
+            self.sampler.preserve(rect)
+            source = self.sampler.read((x0 + dx, y0 + dy, x1 + dx, y1 + dy))
+            dab = mask[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+            coverage = (dab * self.opacity).astype(np.uint8) if self.opacity < 1 else dab
+
+            region = _read_rect(self.target, rect)
+            weights = cv2.merge([coverage] * region.shape[2])
+            kept = cv2.multiply(region, cv2.bitwise_not(weights), scale=1 / 255)
+            _write_rect(self.target, rect, cv2.add(kept, cv2.multiply(source, weights, scale=1 / 255)))
+            np.maximum(self.coverage[y0:y1, x0:x1], coverage, out=self.coverage[y0:y1, x0:x1])
+
+            dirty = _union(dirty, rect)
+            self.segment_bounds = _union(self.segment_bounds, rect)
+            self.segment_count += 1
+            if self.heal and self.segment_count >= self.segment_dabs:
+                dirty = _union(dirty, self._flush_segment())
+
+        self.stroke_bounds = _union(self.stroke_bounds, dirty)
+        return dirty
+
+    def _flush_segment(self):
+        """Heal the pending segment and return the area it changed."""
+        if self.segment_bounds is None:
+            return None
+        bounds = self.segment_bounds
+        self.segment_bounds = None
+        self.segment_count = 0
+
+        solved = self._solve(bounds)
+        if solved is None:
+            return None
+        rect, result, mask = solved
+        region = _read_rect(self.target, rect)
+        np.copyto(region[..., :3], result, where=mask[..., np.newaxis] > 0)
+        _write_rect(self.target, rect, region)
+        return rect
+
+    def _solve(self, bounds):
+        """Poisson-blend the cloned pixels of ``bounds`` into their surroundings."""
+        w, h = _size(self.target)
+        dx, dy = self.offset
+        rect = expand_rect(bounds, self.heal_margin, w, h)
+        # The source rectangle must stay inside the image too.
+        rect = (max(rect[0], -dx), max(rect[1], -dy), min(rect[2], w - dx), min(rect[3], h - dy))
+        x0, y0, x1, y1 = rect
+        if x1 - x0 < 3 or y1 - y0 < 3:
+            return None
+
+        mask = (self.coverage[y0:y1, x0:x1] > 0).astype(np.uint8) * 255
+        mask[0, :] = mask[-1, :] = 0
+        mask[:, 0] = mask[:, -1] = 0
+        bx, by, bw, bh = cv2.boundingRect(mask)
+        if bw == 0 or bh == 0:
+            return None
+
+        source = cv2.cvtColor(self.sampler.read((x0 + dx, y0 + dy, x1 + dx, y1 + dy)), cv2.COLOR_RGBA2RGB)
+        # The boundary comes from the untouched surroundings, not the stamped clone.
+        dest = cv2.cvtColor(self.sampler.read(rect), cv2.COLOR_RGBA2RGB)
+        center = (bx + bw // 2, by + bh // 2)
+        # seamlessClone overwrites its mask argument.
+        result = cv2.seamlessClone(source, dest, mask.copy(), center, cv2.NORMAL_CLONE)
+        return rect, result, mask
+
+
+class CloneTool:
+    """Clone stamp / healing brush.
+
+    Alt-click sets the source point; strokes then copy from the same offset
+    relative to where the first stroke started.
+    """
+
+    def __init__(self, canvas, heal=False):
+        self.canvas = canvas
+        self.engine = CloneEngine(heal=heal)
+        self.source_point = None
+        self.offset = None
+        self.stroking = False
+
+    def mouse_press(self, event):
+        """Set the source or start a stroke."""
+        pil_img = self.canvas.pil_image
+        if not pil_img:
+            return
+        scene_pos = self.canvas.mapToScene(event.pos())
+        point = (scene_pos.x(), scene_pos.y())
+
+        if event.modifiers() & Qt.KeyboardModifier.AltModifier:
+            self.source_point = point
+            self.offset = None
+            return
+        if self.source_point is None:
+            return
+        if self.offset is None:
+            self.offset = (self.source_point[0] - point[0], self.source_point[1] - point[1])
+
+        # The stroke draws into the RGBA display image; the engine keeps the touched tiles' originals.
+        self.stroking = True
+        self._show(self.engine.begin_stroke(pil_img, point, self.offset))
+
+    def mouse_move(self, event):
+        """Continue the stroke."""
+        if not self.stroking:
+            return
+        scene_pos = self.canvas.mapToScene(event.pos())
+        self._show(self.engine.stroke_to((scene_pos.x(), scene_pos.y())))
+
+    def mouse_release(self, event):
+        """Finish the stroke and record it in history."""
+        if not self.stroking:
+            return
+        before, after, bounds = self.engine.end_stroke()
+        self.stroking = False
+        if bounds is not None:
+            self.canvas.commit_patch("heal" if self.engine.heal else "clone", after, bounds, before)
+
+    def _show(self, bounds):
+        """Refresh the area the stroke changed."""
+        if bounds is not None:
+            self.canvas.update_region(bounds)
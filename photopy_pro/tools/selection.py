@@ -8,6 +8,9 @@ from PyQt6.QtGui import QPen, QColor, QPainterPath
 from PyQt6.QtWidgets import QGraphicsRectItem, QGraphicsPathItem, QGraphicsPixmapItem
 from PyQt6.QtGui import QImage, QPixmap
 from ..utils.image_utils import qpixmap_to_pil_image
+from ..filters.blur import gaussian_blur, kernel_sigma
+from ..utils.flood_fill import compute_fill_mask
+from ..core.macros import relative_points
 
 
 class SelectionManager:
@@ -77,47 +80,75 @@ class SelectionManager:
         if self.current_mode == self.MODE_MAGIC_WAND:
             point = self.canvas.mapToScene(event.pos())
             self.magic_wand_selection(point)
+        else:
+            self._record_selection()
 
         self.start_point = None
         self.current_path = None
 
+    def _record_selection(self):
+        """Record the finished rectangle, ellipse or freehand selection."""
+        pil_img = self.canvas.pil_image
+        if not pil_img or not self.selection_item:
+            return
+        if isinstance(self.selection_item, QGraphicsRectItem):
+            rect = self.selection_item.rect().normalized()
+            if rect.isEmpty():
+                return
+            shape = "rect" if self.current_mode == self.MODE_RECTANGLE else "ellipse"
+            points = [(rect.x(), rect.y()), (rect.right(), rect.bottom())]
+        else:
+            shape, points = "polygon", self._path_points()
+            if len(points) < 3:
+                return
+        self.canvas.record_action("select", {"shape": shape, "points": relative_points(points, pil_img.size)})
+
+    def _path_points(self):
+        """Vertices of the freehand selection path."""
+        polygon = self.selection_item.path().toFillPolygon()
+        return [(point.x(), point.y()) for point in polygon]
+
     def magic_wand_selection(self, point):
         """Create a selection using magic wand (flood fill) algorithm."""
         pil_img = self.canvas.pil_image
         if not pil_img:
             return
 
-        img_array = np.array(pil_img)
+        img_array = np.asarray(pil_img)
         x, y = int(point.x()), int(point.y())
 
         # Check boundaries
         if not (0 <= x < pil_img.width and 0 <= y < pil_img.height):
             return
 
-        target_color = tuple(img_array[y, x, :3])
-
-        mask = np.zeros((img_array.shape[0] + 2, img_array.shape[1] + 2), dtype=np.uint8)
-
-        # Use floodFill to get the selection mask
-        cv2.floodFill(
-            image=img_array,
-            mask=mask,
-            seedPoint=(x, y),
-            newVal=(0, 0, 0),
-            loDiff=(self.tolerance,)*3,
-            upDiff=(self.tolerance,)*3,
-            flags=4 | (255 << 8) | cv2.FLOODFILL_MASK_ONLY
-        )
-
-        mask = mask[1:-1, 1:-1]
+        region, bounds = compute_fill_mask(img_array, [(x, y)], self.tolerance, floating=True)
+        mask = np.zeros(img_array.shape[:2], dtype=np.uint8)
+        mask[bounds[1]:bounds[3], bounds[0]:bounds[2]] = region
 
         if self.feather > 0:
-            mask = cv2.GaussianBlur(mask, (self.feather*2+1, self.feather*2+1), 0)
+            self._feather_mask(mask)
 
         qimage = QImage(mask.data, mask.shape[1], mask.shape[0], QImage.Format.Format_Grayscale8)
         self.selection_item = QGraphicsPixmapItem(QPixmap.fromImage(qimage))
         self.canvas.scene.addItem(self.selection_item)
         self.selection_item.setZValue(10)
+        self.canvas.record_action("select", {
+            "shape": "wand",
+            "point": relative_points([(x, y)], pil_img.size)[0],
+            "tolerance": self.tolerance,
+            "feather": self.feather,
+        })
+
+    def _feather_mask(self, mask):
+        """Feather a selection mask in place, touching only its bounding box."""
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            return
+        sigma = kernel_sigma(self.feather * 2 + 1)
+        margin = int(np.ceil(3 * sigma))
+        x1, y1 = max(0, x - margin), max(0, y - margin)
+        x2, y2 = min(mask.shape[1], x + w + margin), min(mask.shape[0], y + h + margin)
+        mask[y1:y2, x1:x2] = gaussian_blur(mask[y1:y2, x1:x2], sigma)
 
     def get_selection_mask(self):
         """Get the selection as a PIL mask image."""
@@ -135,9 +166,9 @@ class SelectionManager:
             elif self.current_mode == self.MODE_ELLIPSE:
                 draw.ellipse((rect.x(), rect.y(), rect.right(), rect.bottom()), fill=255)
         elif isinstance(self.selection_item, QGraphicsPathItem):
-            # For freehand selections, we'd need to convert the path
-            # This is a simplified version - full implementation would require path conversion
-            pass
+            points = self._path_points()
+            if len(points) >= 3:
+                draw.polygon(points, fill=255)
         elif isinstance(self.selection_item, QGraphicsPixmapItem):
             # Already a mask, just convert
             return qpixmap_to_pil_image(self.selection_item.pixmap()).convert("L")
@@ -0,0 +1,53 @@
+"""Stroke dab path shared by painting tools.
+
+A stroke is rendered as round dabs spaced at a fraction of the brush
+diameter along the pointer path. Leftover distance is carried between
+pointer events so spacing stays even however events are delivered.
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_DAB_SPACING = 0.25
+
+
+def dab_positions(start, end, spacing, carry=0.0):
+    """Dab centres from ``start`` towards ``end`` every ``spacing`` pixels.
+
+    ``carry`` is the distance already travelled since the last dab. Returns
+    the list of centres and the new carry.
+    """
+    x0, y0 = start
+    x1, y1 = end
+    length = math.hypot(x1 - x0, y1 - y0)
+    spacing = max(spacing, 1.0)
+    positions = []
+    distance = spacing - carry
+    while distance <= length:
+        t = distance / length
+        positions.append((x0 + (x1 - x0) * t, y0 + (y1 - y0) * t))
+        distance += spacing
+    return positions, length - (distance - spacing)
+
+
+@lru_cache(maxsize=32)
+def dab_mask(radius, hardness):
+    """Round uint8 coverage mask of size (2r+1, 2r+1) with a soft falloff."""
+    size = 2 * radius + 1
+    coords = np.arange(size, dtype=np.float32) - radius
+    dist = np.sqrt(coords[np.newaxis, :] ** 2 + coords[:, np.newaxis] ** 2) / max(radius, 1)
+    hard_edge = min(max(hardness, 0.0), 0.999)
+    falloff = np.clip((1.0 - dist) / (1.0 - hard_edge), 0.0, 1.0)
+    mask = (falloff * 255).astype(np.uint8)
+    mask.flags.writeable = False
+    return mask
+
+
+def dab_rect(center, radius, width, height):
+    """Clipped image rectangle of a dab and the unclipped top-left corner."""
+    cx, cy = int(round(center[0])), int(round(center[1]))
+    ox, oy = cx - radius, cy - radius
+    rect = (max(0, ox), max(0, oy), min(width, cx + radius + 1), min(height, cy + radius + 1))
+    return rect, (ox, oy)
@@ -0,0 +1,268 @@
+"""Text tool.
+
+Text stays an editable ``TextLayer`` (string, position, font, size and
+colour) until it is committed, and is only then rasterized into the image.
+Glyphs are rasterized once per font, size and character into a
+``GlyphCache``, so laying out text while typing only copies cached masks.
+Each edit renders just the text's bounding box into an overlay pixmap
+above the image. The document and its display are left alone until
+commit, which records a single history patch covering that box.
+
+Glyphs are placed by their advance widths, so pair kerning is not applied.
+"""
+
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from PyQt6.QtCore import Qt
+
+from ..core.constants import DEFAULT_BRUSH_COLOR
+from ..core.metrics import instrument
+
+GLYPH_CACHE_SIZE = 4096
+FONT_CACHE_SIZE = 16
+DEFAULT_TEXT_SIZE = 48
+MIN_TEXT_SIZE = 4
+MAX_TEXT_SIZE = 999
+DEFAULT_LINE_SPACING = 1.2
+CARET_WIDTH = 2
+
+# ``mask`` is the glyph's uint8 coverage, placed at (left, top) relative to
+# the pen position at the top of the line; ``advance`` moves the pen.
+Glyph = namedtuple("Glyph", "mask left top advance")
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path, size):
+    """FreeType font of ``size`` pixels; ``None`` selects Pillow's built-in font."""
+    if font_path is None:
+        return ImageFont.load_default(size)
+    return ImageFont.truetype(font_path, size)
+
+
+def _rasterize_glyph(font, char):
+    """Coverage mask and metrics of one character."""
+    left, top, right, bottom = font.getbbox(char)
+    advance = font.getlength(char)
+    if right <= left or bottom <= top:
+        return Glyph(np.zeros((0, 0), dtype=np.uint8), 0, 0, advance)
+    image = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(image).text((-left, -top), char, font=font, fill=255)
+    mask = np.asarray(image)
+    mask.flags.writeable = False
+    return Glyph(mask, left, top, advance)
+
+
+class GlyphCache:
+    """Least recently used glyph rasters keyed by font, size and character."""
+
+    def __init__(self, max_glyphs=GLYPH_CACHE_SIZE):
+        self.max_glyphs = max_glyphs
+        self._glyphs = OrderedDict()
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def glyph(self, font_path, size, char):
+        """Cached raster of ``char``."""
+        key = (font_path, size, char)
+        glyph = self._glyphs.get(key)
+        if glyph is not None:
+            self._glyphs.move_to_end(key)
+            return glyph
+        glyph = self._glyphs[key] = _rasterize_glyph(load_font(font_path, size), char)
+        if len(self._glyphs) > self.max_glyphs:
+            self._glyphs.popitem(last=False)
+        return glyph
+
+
+class TextLayer:
+    """Editable text whose first line starts at ``position`` (image pixels)."""
+
+    def __init__(self, position, text="", font_path=None, size=DEFAULT_TEXT_SIZE,
+                 color=(0, 0, 0, 255), line_spacing=DEFAULT_LINE_SPACING):
+        self.position = (int(round(position[0])), int(round(position[1])))
+        self.text = text
+        self.font_path = font_path
+        self.size = size
+        self.color = tuple(color)
+        self.line_spacing = line_spacing
+
+    def line_height(self):
+        """Distance between baselines in pixels."""
+        ascent, descent = load_font(self.font_path, self.size).getmetrics()
+        return int(round((ascent + descent) * self.line_spacing))
+
+    def layout(self, cache):
+        """Placed glyphs as (glyph, x, y), and the pen position after the last one."""
+        x0, y = self.position
+        line_height = self.line_height()
+        placed = []
+        pen = float(x0)
+        for char in self.text:
+            if char == "\n":
+                pen = float(x0)
+                y += line_height
+                continue
+            glyph = cache.glyph(self.font_path, self.size, char)
+            if glyph.mask.size:
+                placed.append((glyph, int(round(pen)) + glyph.left, y + glyph.top))
+            pen += glyph.advance
+        return placed, (int(round(pen)), y)
+
+    def bounds(self, cache, caret=False):
+        """(x0, y0, x1, y1) covering the glyphs, and the caret if asked; None if empty."""
+        placed, (pen_x, pen_y) = self.layout(cache)
+        rects = [(x, y, x + glyph.mask.shape[1], y + glyph.mask.shape[0]) for glyph, x, y in placed]
+        if caret:
+            rects.append((pen_x, pen_y, pen_x + CARET_WIDTH, pen_y + self.line_height()))
+        if not rects:
+            return None
+        xs0, ys0, xs1, ys1 = zip(*rects)
+        return min(xs0), min(ys0), max(xs1), max(ys1)
+
+    @instrument("text.render")
+    def render(self, cache, bounds):
+        """uint8 coverage of the text inside ``bounds``."""
+        bx0, by0, bx1, by1 = bounds
+        coverage = np.zeros((by1 - by0, bx1 - bx0), dtype=np.uint8)
+        placed, _ = self.layout(cache)
+        for glyph, x, y in placed:
+            h, w = glyph.mask.shape
+            # Clip the glyph to the bounds; glyphs may overlap, so keep the maximum.
+            cx0, cy0 = max(x, bx0), max(y, by0)
+            cx1, cy1 = min(x + w, bx1), min(y + h, by1)
+            if cx1 <= cx0 or cy1 <= cy0:
+                continue
+            target = coverage[cy0 - by0:cy1 - by0, cx0 - bx0:cx1 - bx0]
+            np.maximum(target, glyph.mask[cy0 - y:cy1 - y, cx0 - x:cx1 - x], out=target)
+        return coverage
+
+    def overlay(self, cache, bounds, caret=True):
+        """RGBA image of the text (and caret) inside ``bounds`` on transparency."""
+        bx0, by0, bx1, by1 = bounds
+        alpha = self.render(cache, bounds).astype(np.uint16) * self.color[3] // 255
+        if caret:
+            pen_x, pen_y = self.layout(cache)[1]
+            x0, y0 = max(pen_x, bx0) - bx0, max(pen_y, by0) - by0
+            x1, y1 = min(pen_x + CARET_WIDTH, bx1) - bx0, min(pen_y + self.line_height(), by1) - by0
+            if x1 > x0 and y1 > y0:
+                alpha[y0:y1, x0:x1] = 255
+        arr = np.empty((by1 - by0, bx1 - bx0, 4), dtype=np.uint8)
+        arr[..., :3] = self.color[:3]
+        arr[..., 3] = alpha
+        return Image.fromarray(arr, "RGBA")
+
+    def composite(self, cache, region, bounds):
+        """The RGBA uint8 ``region`` at ``bounds`` with the text drawn over it."""
+        alpha = self.render(cache, bounds).astype(np.float32) * (self.color[3] / 255 ** 2)
+        alpha = alpha[..., np.newaxis]
+        dst = region.astype(np.float32) / 255
+        dst_alpha = dst[..., 3:]
+        out_alpha = alpha + dst_alpha * (1 - alpha)
+        color = np.asarray(self.color[:3], dtype=np.float32) / 255
+        out_rgb = (color * alpha + dst[..., :3] * dst_alpha * (1 - alpha)) / np.maximum(out_alpha, 1e-6)
+        out = np.concatenate([out_rgb, out_alpha], axis=2)
+        return np.rint(out * 255).astype(np.uint8)
+
+
+def _clip(rect, width, height):
+    """``rect`` clipped to the image, or None if nothing is left."""
+    x0, y0, x1, y1 = max(0, rect[0]), max(0, rect[1]), min(width, rect[2]), min(height, rect[3])
+    return (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+
+
+class TextTool:
+    """Click to place text, type to edit it.
+
+    Return starts a new line and Backspace deletes. Ctrl+Return, clicking
+    elsewhere or switching tools commits the text; Escape discards it.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.cache = GlyphCache()
+        self.font_path = None
+        self.size = DEFAULT_TEXT_SIZE
+        self.color = DEFAULT_BRUSH_COLOR
+        self.layer = None
+
+    @property
+    def editing(self):
+        """Whether text is being edited."""
+        return self.layer is not None
+
+    def set_font(self, font_path, size):
+        """Use a font file (``None`` for the built-in font) and pixel size.
+
+        Applies to the text being edited as well as to new text. Raises
+        OSError if the font cannot be loaded.
+        """
+        load_font(font_path, size)
+        self.font_path, self.size = font_path, size
+        if self.layer is not None:
+            self.layer.font_path, self.layer.size = font_path, size
+            self._show()
+
+    def mouse_press(self, event):
+        """Commit the current text and start a new one at the click."""
+        if not self.canvas.pil_image:
+            return
+        self.commit()
+        point = self.canvas.mapToScene(event.pos())
+        self.layer = TextLayer((point.x(), point.y()), font_path=self.font_path, size=self.size,
+                               color=self.color.getRgb())
+        self.canvas.setFocus()
+        self._show()
+
+    def key_press(self, event):
+        """Edit the text; returns False for keys the tool does not handle."""
+        if self.layer is None:
+            return False
+        key = event.key()
+        if key in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+            if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+                self.commit()
+                return True
+            self.layer.text += "\n"
+        elif key == Qt.Key.Key_Backspace:
+            self.layer.text = self.layer.text[:-1]
+        elif key == Qt.Key.Key_Escape:
+            self.cancel()
+            return True
+        elif event.text() and event.text().isprintable():
+            self.layer.text += event.text()
+        else:
+            return False
+        self._show()
+        return True
+
+    def _show(self):
+        """Render the text's bounding box into the canvas overlay."""
+        width, height = self.canvas.pil_image.size
+        bounds = self.layer.bounds(self.cache, caret=True)
+        bounds = _clip(bounds, width, height) if bounds else None
+        if bounds is None:
+            self.canvas.set_overlay(None)
+            return
+        self.canvas.set_overlay(self.layer.overlay(self.cache, bounds), bounds[:2])
+
+    def commit(self):
+        """Rasterize the text into the image as one history step."""
+        layer, self.layer = self.layer, None
+        self.canvas.set_overlay(None)
+        if layer is None or not self.canvas.pil_image:
+            return
+        bounds = layer.bounds(self.cache)
+        bounds = _clip(bounds, *self.canvas.pil_image.size) if bounds else None
+        if bounds is None:
+            return
+        region = np.asarray(self.canvas.pil_image.crop(bounds).convert("RGBA"))
+        self.canvas.commit_patch("text", layer.composite(self.cache, region, bounds), bounds)
+
+    def cancel(self):
+        """Discard the text being edited."""
+        self.layer = None
+        self.canvas.set_overlay(None)
@@ -1,17 +1,40 @@
 """Image canvas for displaying and editing images."""
 
+import math
+
+import numpy as np
 from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QPixmap
 from PIL import Image
 
 from ..utils.image_utils import pil_image_to_qpixmap, qpixmap_to_pil_image
+from ..utils.color_management import (
+    RENDERING_INTENT, document_profile, open_document, to_display, save_options
+)
+from ..utils.precision import (
+    PRECISION_UINT8, convert_precision, image_size, precision_of, read_image,
+    to_display_image, to_document, write_image
+)
 from ..tools.selection import SelectionManager
+from ..tools.fill import FillTool
+from ..tools.clone import CloneTool
+from ..tools.text import TextTool
+from ..core.commands import EditCommand
+from ..core.macros import ActionRecorder, apply_in_mask, run_operation
+from ..core.metrics import instrument
+
+MAX_PATCH_ITEMS = 64
+MAX_DISPLAY_LEVEL = 6
 
 
 class ImageCanvas(QGraphicsView):
     """Main image editing canvas."""
 
+    # Emitted with the changed (left, upper, right, lower) bounds, or None
+    # when the whole image was replaced.
+    image_changed = pyqtSignal(object)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_window = parent
@@ -23,10 +46,27 @@ class ImageCanvas(QGraphicsView):
         # Image data
         self.pil_image = None
         self.pixmap_item = None
+        self.patch_items = []
+        # Pixmap drawn above the image by tools previewing an edit
+        self.overlay_item = None
+        self.icc_profile = None
+        self.rendering_intent = RENDERING_INTENT
+        # 8-bit documents live in pil_image. Deeper ones are kept in
+        # ``document`` and pil_image holds their 8-bit rendering.
+        self.precision = PRECISION_UINT8
+        self.document = None
+        # Pyramid level shown on screen: the image is displayed downscaled
+        # by 2 ** display_level, so only that many pixels are transformed.
+        self.display_level = 0
 
         # Tools and interaction
+        self.recorder = ActionRecorder()
         self.current_tool = "select"
         self.selection_manager = SelectionManager(self)
+        self.fill_tool = FillTool(self)
+        self.clone_tool = CloneTool(self)
+        self.heal_tool = CloneTool(self, heal=True)
+        self.text_tool = TextTool(self)
 
         # Canvas settings
         self.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
@@ -37,12 +77,17 @@ class ImageCanvas(QGraphicsView):
     def load_image(self, file_path):
         """Load an image from file path."""
         try:
-            self.pil_image = Image.open(file_path).convert("RGBA")
-            self.display_image()
+            document = read_image(file_path)
+            if document is not None:
+                icc_profile = document_profile(self._embedded_profile(file_path))
+            else:
+                with Image.open(file_path) as opened:
+                    document, icc_profile = open_document(opened, self.rendering_intent)
+            self.set_document(document, icc_profile)
 
             # Initialize layers in parent window
             if hasattr(self.parent_window, 'layers'):
-                self.parent_window.layers = [self.pil_image.copy()]
+                self.parent_window.layers = [self._document_state().copy()]
                 self.parent_window.layer_opacities = [100]
                 self.parent_window.blend_modes = ["normal"]
                 self.parent_window.active_layer_index = 0
@@ -51,41 +96,285 @@ class ImageCanvas(QGraphicsView):
         except Exception as e:
             raise Exception(f"Failed to load image: {str(e)}")
 
-    def display_image(self):
+    def set_document(self, document, icc_profile):
+        """Show ``document`` (an RGBA PIL image or a deep array) as the current image."""
+        self.text_tool.cancel()
+        if isinstance(document, np.ndarray):
+            self.document = document
+            self.precision = precision_of(document)
+            self.pil_image = to_display_image(document)
+        else:
+            self.document = None
+            self.precision = PRECISION_UINT8
+            self.pil_image = document
+        self.icc_profile = icc_profile
+        self.pil_image.info["icc_profile"] = icc_profile
+        self.display_image()
+        self.image_changed.emit(None)
+
+    @staticmethod
+    def _embedded_profile(file_path):
+        """ICC profile in the header of ``file_path``, if PIL can read it."""
+        try:
+            with Image.open(file_path) as header:
+                return header.info.get("icc_profile")
+        except (OSError, ValueError):
+            return None
+
+    def _document_state(self):
+        """The full-precision document: ``document`` or the PIL image."""
+        return self.document if self.document is not None else self.pil_image
+
+    def set_precision(self, precision):
+        """Convert the document and its layers to another precision.
+
+        History is cleared, since its patches are stored at the old precision.
+        """
+        if not self.pil_image or precision == self.precision:
+            return
+        converted = to_document(self._document_state(), precision)
+        if precision == PRECISION_UINT8:
+            self.document = None
+            self.pil_image = converted
+            self.pil_image.info["icc_profile"] = self.icc_profile
+        else:
+            self.document = converted
+        self.precision = precision
+
+        if hasattr(self.parent_window, 'layers'):
+            self.parent_window.layers = [to_document(layer, precision)
+                                         for layer in self.parent_window.layers]
+        if hasattr(self.parent_window, 'command_processor'):
+            self.parent_window.command_processor.clear()
+        self.display_image(fit_view=False)
+        self.image_changed.emit(None)
+
+    @instrument()
+    def display_image(self, fit_view=True):
         """Display the current PIL image on the canvas."""
         if not self.pil_image:
             return
 
-        # Clear existing items
+        # Clear existing items, keeping the selection outline and overlay
+        kept_items = [item for item in (self.selection_manager.selection_item, self.overlay_item)
+                      if item is not None]
+        for item in kept_items:
+            self.scene.removeItem(item)
         self.scene.clear()
+        self.patch_items = []
 
-        # Convert and display
-        pixmap = pil_image_to_qpixmap(self.pil_image)
-        self.pixmap_item = QGraphicsPixmapItem(pixmap)
+        # Convert and display the pyramid level matching the zoom
+        scale = self._fit_scale() if fit_view else self.transform().m11()
+        self.display_level = self._level_for_scale(scale)
+        self.pixmap_item = QGraphicsPixmapItem(self._display_pixmap(self.pil_image))
+        self.pixmap_item.setScale(2 ** self.display_level)
         self.scene.addItem(self.pixmap_item)
+        for item in kept_items:
+            self.scene.addItem(item)
 
         # Fit in view
-        self.fitInView(self.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+        if fit_view:
+            self.fitInView(self.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
+    def _fit_scale(self):
+        """View scale at which the whole image fits the viewport."""
+        width, height = self.pil_image.size
+        viewport = self.viewport()
+        return min(viewport.width() / width, viewport.height() / height)
+
+    def _level_for_scale(self, scale):
+        """Coarsest pyramid level that still has a pixel per screen pixel."""
+        if scale <= 0 or scale >= 1:
+            return 0
+        level = int(math.floor(math.log2(1 / scale)))
+        max_level = int(math.log2(max(1, min(self.pil_image.size))))
+        return max(0, min(level, MAX_DISPLAY_LEVEL, max_level))
+
+    def _display_pixmap(self, pil_img):
+        """Pixmap of ``pil_img`` at the current level, in the display profile."""
+        if self.display_level:
+            pil_img = pil_img.reduce(2 ** self.display_level)
+        return pil_image_to_qpixmap(to_display(pil_img, self.icc_profile, self.rendering_intent))
+
+    def _sync_display_level(self):
+        """Switch pyramid level after a zoom change."""
+        if self.pixmap_item is None:
+            return
+        level = self._level_for_scale(self.transform().m11())
+        if level == self.display_level:
+            return
+        self.display_level = level
+        for item in self.patch_items:
+            self.scene.removeItem(item)
+        self.patch_items = []
+        self.pixmap_item.setPixmap(self._display_pixmap(self.pil_image))
+        self.pixmap_item.setScale(2 ** level)
+
+    def refresh_region(self, bounds):
+        """Refresh only ``bounds`` of the displayed image.
+
+        The changed area, widened to whole pixels of the current pyramid
+        level, is drawn as a small pixmap on top of the current one; after
+        ``MAX_PATCH_ITEMS`` patches the display is rebuilt.
+        """
+        if self.pixmap_item is None or len(self.patch_items) >= MAX_PATCH_ITEMS:
+            self.display_image(fit_view=False)
+            return
+        step = 2 ** self.display_level
+        width, height = self.pil_image.size
+        x0, y0 = bounds[0] // step * step, bounds[1] // step * step
+        x1 = min(width, -(-bounds[2] // step) * step)
+        y1 = min(height, -(-bounds[3] // step) * step)
+        item = QGraphicsPixmapItem(self._display_pixmap(self.pil_image.crop((x0, y0, x1, y1))),
+                                   self.pixmap_item)
+        # Children inherit the level scale, so positions are in level pixels.
+        item.setPos(x0 // step, y0 // step)
+        self.patch_items.append(item)
+
+    def set_overlay(self, pil_img, origin=(0, 0)):
+        """Show an RGBA image above the document at ``origin``; None removes it.
+
+        Overlays preview edits without touching the document or its display.
+        """
+        if pil_img is None:
+            if self.overlay_item is not None:
+                self.scene.removeItem(self.overlay_item)
+                self.overlay_item = None
+            return
+        pixmap = pil_image_to_qpixmap(to_display(pil_img, self.icc_profile, self.rendering_intent))
+        if self.overlay_item is None:
+            self.overlay_item = QGraphicsPixmapItem()
+            self.overlay_item.setZValue(1)
+            self.scene.addItem(self.overlay_item)
+        self.overlay_item.setPixmap(pixmap)
+        self.overlay_item.setPos(*origin)
+
+    def update_region(self, bounds):
+        """Refresh ``bounds`` on screen and notify listeners of the change."""
+        self.refresh_region(bounds)
+        self.image_changed.emit(tuple(bounds))
+
+    def commit_patch(self, operation, patch, bounds, before=None):
+        """Paste an edited RGBA patch into the image and record it in history.
+
+        ``before`` holds the original pixels when the tool has already
+        drawn into the image while the edit was in progress. Patches are
+        8-bit; deeper documents receive only the pixels the patch changes,
+        converted to their precision, and keep full precision elsewhere.
+        """
+        patch_img = Image.fromarray(patch, "RGBA")
+        x0, y0, x1, y1 = bounds
+        if self.document is not None:
+            # Tools only draw into the 8-bit view, so the document still
+            # holds the original pixels.
+            before_patch = self.document[y0:y1, x0:x1].copy()
+            original = before if before is not None else np.asarray(self.pil_image.crop(bounds))
+            changed = np.any(patch != original, axis=2)
+            after_patch = before_patch.copy()
+            after_patch[changed] = convert_precision(patch, self.precision)[changed]
+            self.document[y0:y1, x0:x1] = after_patch
+        elif before is None:
+            before_patch = self.pil_image.crop(bounds)
+            after_patch = patch_img
+        else:
+            before_patch = Image.fromarray(before, "RGBA")
+            after_patch = patch_img
+        self.pil_image.paste(patch_img, bounds[:2])
+
+        layer_index = getattr(self.parent_window, 'active_layer_index', 0)
+        layers = getattr(self.parent_window, 'layers', None)
+        if layers and image_size(layers[layer_index]) == self.pil_image.size:
+            if isinstance(after_patch, Image.Image):
+                layers[layer_index].paste(after_patch, bounds[:2])
+            else:
+                layers[layer_index][y0:y1, x0:x1] = after_patch
+
+        if hasattr(self.parent_window, 'command_processor'):
+            command = EditCommand.from_patches(layer_index, operation, before_patch, after_patch, bounds)
+            self.parent_window.command_processor.execute(command)
+
+        self.update_region(bounds)
+
+    def record_action(self, operation, params=None):
+        """Record a semantic step if a macro is being recorded."""
+        self.recorder.record(operation, params)
+
+    def apply_operation(self, operation, **params):
+        """Run a registered operation on the document, inside the selection if any."""
+        if not self.pil_image:
+            return
+        self.text_tool.commit()
+        before = self._document_state()
+        result = run_operation(before, operation, params)
+        if isinstance(result, Image.Image):
+            result = result.convert("RGBA")
+        if image_size(result) != image_size(before):
+            # The selection no longer matches the resized image.
+            self.selection_manager.clear_selection()
+        elif self.selection_manager.has_selection():
+            mask = np.asarray(self.selection_manager.get_selection_mask())
+            result = apply_in_mask(result, before, mask)
+        self._commit_document(operation, before, result)
+        self.record_action(operation, params)
+
+    def apply_macro(self, macro):
+        """Replay a macro on the document as a single history step."""
+        if not self.pil_image:
+            return
+        self.text_tool.commit()
+        before = self._document_state()
+        result = macro.apply(before)
+        if isinstance(result, Image.Image):
+            result = result.convert("RGBA")
+        self._commit_document("macro", before, result)
+
+    def _commit_document(self, operation, before, result):
+        """Replace the whole document with ``result`` and record it in history."""
+        layer_index = getattr(self.parent_window, 'active_layer_index', 0)
+        if hasattr(self.parent_window, 'command_processor'):
+            command = EditCommand(layer_index, operation, before, result)
+            self.parent_window.command_processor.execute(command)
+        layers = getattr(self.parent_window, 'layers', None)
+        if layers and image_size(layers[layer_index]) == image_size(before):
+            layers[layer_index] = result.copy()
+
+        if self.document is not None:
+            self.document = result
+            self.pil_image = to_display_image(result)
+        else:
+            self.pil_image = result
+        self.pil_image.info["icc_profile"] = self.icc_profile
+        self.display_image(fit_view=image_size(result) != image_size(before))
+        self.image_changed.emit(None)
 
     def save_image(self, file_path):
         """Save the current image."""
         if not self.pil_image:
             raise Exception("No image to save")
+        self.text_tool.commit()
 
         # Determine format from extension
         file_format = file_path.split('.')[-1].upper()
         if file_format == 'JPG':
             file_format = 'JPEG'
+        elif file_format == 'TIF':
+            file_format = 'TIFF'
+
+        # Deep documents are written at full precision where the format allows
+        if self.document is not None and write_image(file_path, self.document, file_format):
+            return
 
         # Convert to RGB if saving as JPEG
         save_image = self.pil_image
         if file_format == 'JPEG':
             save_image = self.pil_image.convert('RGB')
 
-        save_image.save(file_path, format=file_format)
+        save_image.save(file_path, format=file_format, **save_options(file_format, self.icc_profile))
 
     def set_tool(self, tool_name):
         """Set the active tool."""
+        if tool_name != "text":
+            self.text_tool.commit()
         self.current_tool = tool_name
 
         # Update selection manager mode
@@ -101,12 +390,24 @@ class ImageCanvas(QGraphicsView):
 
         # Clear selection if switching away from selection tools
         if not tool_name.startswith("select"):
+            if self.selection_manager.has_selection():
+                self.record_action("deselect")
             self.selection_manager.clear_selection()
 
+    def stroke_tools(self):
+        """Tools that receive press, move and release events."""
+        return {"clone": self.clone_tool, "heal": self.heal_tool}
+
     def mousePressEvent(self, event):
         """Handle mouse press events."""
         if self.current_tool.startswith("select"):
             self.selection_manager.mouse_press(event)
+        elif self.current_tool == "fill":
+            self.fill_tool.mouse_press(event)
+        elif self.current_tool == "text":
+            self.text_tool.mouse_press(event)
+        elif self.current_tool in self.stroke_tools():
+            self.stroke_tools()[self.current_tool].mouse_press(event)
         else:
             super().mousePressEvent(event)
 
@@ -114,6 +415,8 @@ class ImageCanvas(QGraphicsView):
         """Handle mouse move events."""
         if self.current_tool.startswith("select"):
             self.selection_manager.mouse_move(event)
+        elif self.current_tool in self.stroke_tools():
+            self.stroke_tools()[self.current_tool].mouse_move(event)
         else:
             super().mouseMoveEvent(event)
 
@@ -121,9 +424,17 @@ class ImageCanvas(QGraphicsView):
         """Handle mouse release events."""
         if self.current_tool.startswith("select"):
             self.selection_manager.mouse_release(event)
+        elif self.current_tool in self.stroke_tools():
+            self.stroke_tools()[self.current_tool].mouse_release(event)
         else:
             super().mouseReleaseEvent(event)
 
+    def keyPressEvent(self, event):
+        """Send typing to the text tool while it is editing."""
+        if self.current_tool == "text" and self.text_tool.key_press(event):
+            return
+        super().keyPressEvent(event)
+
     def wheelEvent(self, event):
         """Handle zoom with mouse wheel."""
         zoom_in_factor = 1.25
@@ -139,12 +450,19 @@ class ImageCanvas(QGraphicsView):
             zoom_factor = zoom_out_factor
 
         self.scale(zoom_factor, zoom_factor)
+        self._sync_display_level()
 
     def clear(self):
         """Clear the canvas."""
+        self.text_tool.cancel()
         self.scene.clear()
         self.pil_image = None
         self.pixmap_item = None
+        self.patch_items = []
+        self.icc_profile = None
+        self.precision = PRECISION_UINT8
+        self.document = None
+        self.image_changed.emit(None)
 
         # Clear parent window layers
         if hasattr(self.parent_window, 'layers'):
@@ -158,16 +476,39 @@ class ImageCanvas(QGraphicsView):
         """Undo the last operation."""
         if hasattr(self.parent_window, 'command_processor'):
             if self.pil_image and self.parent_window.command_processor.can_undo():
-                result = self.parent_window.command_processor.undo(self.pil_image)
-                if result:
-                    self.pil_image = result
-                    self.display_image()
+                result = self.parent_window.command_processor.undo(self._document_state())
+                if result is not None:
+                    self._set_history_result(result, self._last_command_bounds("undo"))
 
     def redo(self):
         """Redo the last undone operation."""
         if hasattr(self.parent_window, 'command_processor'):
             if self.pil_image and self.parent_window.command_processor.can_redo():
-                result = self.parent_window.command_processor.redo(self.pil_image)
-                if result:
-                    self.pil_image = result
-                    self.display_image()
\ No newline at end of file
+                result = self.parent_window.command_processor.redo(self._document_state())
+                if result is not None:
+                    self._set_history_result(result, self._last_command_bounds("redo"))
+
+    def _set_history_result(self, result, bounds):
+        """Show the document returned by undo or redo."""
+        resized = image_size(result) != self.pil_image.size
+        if self.document is not None:
+            self.document = result
+            if bounds is None:
+                self.pil_image = to_display_image(result)
+                self.pil_image.info["icc_profile"] = self.icc_profile
+            else:
+                # Only the command's area changed in the 8-bit view.
+                x0, y0, x1, y1 = bounds
+                self.pil_image.paste(to_display_image(result[y0:y1, x0:x1]), (x0, y0))
+        else:
+            self.pil_image = result
+        self.display_image(fit_view=resized)
+        self.image_changed.emit(bounds)
+
+    def _last_command_bounds(self, action):
+        """Bounds of the command that was just undone or redone."""
+        processor = self.parent_window.command_processor
+        stack = processor.redo_stack if action == "undo" else processor.undo_stack
+        if not stack or stack[-1].resizes:
+            return None
+        return tuple(stack[-1].bounds)
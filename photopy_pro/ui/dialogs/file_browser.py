@@ -0,0 +1,164 @@
+"""Thumbnail file browser backed by the persistent file index."""
+
+import os
+import threading
+
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QListView, QLabel, QFileDialog
+)
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, pyqtSignal
+from PyQt6.QtGui import QIcon, QPixmap
+
+from ...core.worker import ImageWorker
+
+BROWSER_ICON_SIZE = 128
+EXIF_TOOLTIP_TAGS = ("DateTime", "Make", "Model")
+
+
+class ThumbnailModel(QAbstractListModel):
+    """List model over index entries.
+
+    Thumbnails are decoded into icons only when a view asks for them, so a
+    folder with thousands of files costs nothing for rows never shown.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self._icons = {}
+
+    def set_entries(self, entries):
+        """Replace the listed entries."""
+        self.beginResetModel()
+        self.entries = list(entries)
+        self._icons = {}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        """Number of entries."""
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        """Name, icon, tooltip or path of an entry."""
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(entry.path)
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self._icon(index.row(), entry)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._tooltip(entry)
+        if role == Qt.ItemDataRole.UserRole:
+            return entry.path
+        return None
+
+    def _icon(self, row, entry):
+        icon = self._icons.get(row)
+        if icon is None and entry.thumbnail:
+            pixmap = QPixmap()
+            pixmap.loadFromData(entry.thumbnail)
+            icon = self._icons[row] = QIcon(pixmap)
+        return icon
+
+    @staticmethod
+    def _tooltip(entry):
+        if entry.width is None:
+            return f"{entry.path}\nUnreadable image"
+        lines = [entry.path, f"{entry.width} × {entry.height} {entry.format} ({entry.mode})"]
+        lines += [f"{tag}: {entry.exif[tag]}" for tag in EXIF_TOOLTIP_TAGS if tag in entry.exif]
+        return "\n".join(lines)
+
+
+class FileBrowserDialog(QDialog):
+    """Browses a folder as thumbnails; double-click opens a file."""
+
+    file_selected = pyqtSignal(str)
+
+    def __init__(self, file_index, directory="", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Browse Images")
+        self.resize(900, 600)
+        self.file_index = file_index
+        self.directory = directory
+        self.worker = None
+        self.scan_cancelled = None
+
+        layout = QVBoxLayout(self)
+        path_layout = QHBoxLayout()
+        self.path_edit = QLineEdit(directory)
+        self.path_edit.returnPressed.connect(lambda: self.open_directory(self.path_edit.text()))
+        choose_btn = QPushButton("Choose...")
+        choose_btn.clicked.connect(self.choose_directory)
+        path_layout.addWidget(self.path_edit)
+        path_layout.addWidget(choose_btn)
+        layout.addLayout(path_layout)
+
+        self.model = ThumbnailModel(self)
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setUniformItemSizes(True)
+        self.view.setIconSize(QSize(BROWSER_ICON_SIZE, BROWSER_ICON_SIZE))
+        self.view.setGridSize(QSize(BROWSER_ICON_SIZE + 24, BROWSER_ICON_SIZE + 40))
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self.on_double_clicked)
+        layout.addWidget(self.view)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        if directory:
+            self.open_directory(directory)
+
+    def choose_directory(self):
+        """Pick a folder with the system dialog."""
+        directory = QFileDialog.getExistingDirectory(self, "Choose Folder", self.directory)
+        if directory:
+            self.open_directory(directory)
+
+    def open_directory(self, directory):
+        """Index ``directory`` in the background and list it."""
+        if not os.path.isdir(directory):
+            self.status_label.setText(f"Not a folder: {directory}")
+            return
+        self.cancel_scan()
+        self.directory = directory
+        self.path_edit.setText(directory)
+        self.status_label.setText("Indexing...")
+
+        self.scan_cancelled = threading.Event()
+        worker = self.worker = ImageWorker(self.file_index.scan, directory,
+                                           cancelled=self.scan_cancelled.is_set)
+        worker.finished.connect(lambda entries: self.on_scanned(worker, entries))
+        worker.error.connect(lambda message: self._on_scan_error(worker, message))
+        worker.start()
+
+    def cancel_scan(self):
+        """Stop a running scan; only the files being read are waited for."""
+        if self.worker is None:
+            return
+        self.scan_cancelled.set()
+        self.worker.wait()
+        self.worker = None
+
+    def on_scanned(self, worker, entries):
+        """Show the entries of a finished scan unless it was superseded."""
+        if worker is not self.worker or entries is None:
+            return
+        self.model.set_entries(entries)
+        self.status_label.setText(f"{len(entries)} images")
+
+    def on_double_clicked(self, index):
+        """Open the double-clicked file."""
+        self.file_selected.emit(self.model.data(index, Qt.ItemDataRole.UserRole))
+        self.accept()
+
+    def _on_scan_error(self, worker, message):
+        if worker is self.worker:
+            self.status_label.setText(f"Error: {message}")
+
+    def done(self, result):
+        """Cancel a running scan before closing."""
+        self.cancel_scan()
+        super().done(result)
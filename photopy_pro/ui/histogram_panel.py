@@ -0,0 +1,83 @@
+"""Live histogram panel."""
+
+from PyQt6.QtWidgets import QWidget
+from PyQt6.QtCore import Qt, QTimer, QPointF
+from PyQt6.QtGui import QPainter, QColor, QPolygonF
+
+from ..core.histogram import HistogramService, HISTOGRAM_CHANNELS
+
+HISTOGRAM_REFRESH_MS = 100
+
+CHANNEL_COLORS = {
+    "red": QColor(220, 60, 60, 110),
+    "green": QColor(60, 180, 60, 110),
+    "blue": QColor(60, 90, 220, 110),
+    "luminance": QColor(200, 200, 200, 160),
+}
+
+
+class HistogramPanel(QWidget):
+    """Draws the histograms of the canvas image and keeps them current.
+
+    Dirty rectangles reported by the canvas are merged and processed on a
+    short timer, so a stroke with many small updates costs one incremental
+    refresh per interval.
+    """
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.service = HistogramService()
+        self.pending_bounds = None
+        self.pending_reset = False
+        self.setMinimumHeight(120)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.refresh)
+
+    def on_image_changed(self, bounds):
+        """Queue an update for ``bounds`` (None means the whole image)."""
+        if bounds is None:
+            self.pending_reset = True
+        elif self.pending_bounds is None:
+            self.pending_bounds = tuple(bounds)
+        else:
+            a = self.pending_bounds
+            self.pending_bounds = (min(a[0], bounds[0]), min(a[1], bounds[1]),
+                                   max(a[2], bounds[2]), max(a[3], bounds[3]))
+        if not self._timer.isActive():
+            self._timer.start(HISTOGRAM_REFRESH_MS)
+
+    def refresh(self):
+        """Apply queued updates and repaint."""
+        image = self.canvas.pil_image
+        if self.pending_reset:
+            self.service.reset(image)
+        elif self.pending_bounds is not None:
+            self.service.update(image, self.pending_bounds)
+        self.pending_reset = False
+        self.pending_bounds = None
+        self.update()
+
+    def paintEvent(self, event):
+        """Draw each channel as a filled curve."""
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(40, 40, 40))
+        total = self.service.total
+        # Ignore the extreme bins, which clipped images tend to dominate.
+        peak = total[:, 1:-1].max()
+
+        if peak > 0:
+            w, h = self.width(), self.height()
+            painter.setPen(Qt.PenStyle.NoPen)
+            for index, name in enumerate(HISTOGRAM_CHANNELS):
+                counts = total[index]
+                polygon = QPolygonF([QPointF(0, h)])
+                for value in range(256):
+                    height = min(counts[value] / peak, 1.0) * h
+                    polygon.append(QPointF(value * w / 255, h - height))
+                polygon.append(QPointF(w, h))
+                painter.setBrush(CHANNEL_COLORS[name])
+                painter.drawPolygon(polygon)
+        painter.end()
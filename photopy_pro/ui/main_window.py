@@ -2,19 +2,35 @@
 
 import sys
 import os
+import time
+from datetime import datetime
 from PyQt6.QtWidgets import (
     QMainWindow, QLabel, QFileDialog, QVBoxLayout, QHBoxLayout,
     QWidget, QPushButton, QListWidget, QMessageBox, QToolBar,
-    QSplitter, QGroupBox
+    QSplitter, QGroupBox, QInputDialog, QApplication, QSpinBox
 )
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QAction, QKeySequence
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QAction, QActionGroup, QKeySequence
 from PIL import Image
+import numpy as np
 
-from ..core.constants import TOOLS_CONFIG, SUPPORTED_FORMATS, RECENT_FILES_LIMIT
+from ..core.constants import TOOLS_CONFIG, FILTERS_CONFIG, SUPPORTED_FORMATS, RECENT_FILES_LIMIT
 from ..core.commands import CommandProcessor
 from ..core.worker import ImageWorker
+from ..core.metrics import registry as metrics_registry
+from ..core.file_index import FileIndex
+from ..core.macros import DEEP_OPERATIONS, Macro, batch_files, run_batch
+from ..core.snapshots import SnapshotStore, SnapshotTracker
+from ..core.autosave import (
+    AUTOSAVE_IDLE_SECONDS, AUTOSAVE_INTERVAL_MS, Autosave, discard_session, find_sessions, load_session
+)
+from ..filters.basic import LUT_CHANNELS
+from ..tools.text import DEFAULT_TEXT_SIZE, MAX_TEXT_SIZE, MIN_TEXT_SIZE
+from ..utils.precision import PRECISION_UINT8, PRECISION_UINT16, PRECISION_FLOAT32
 from .canvas import ImageCanvas
+from .metrics_widget import MetricsStatusLabel
+from .histogram_panel import HistogramPanel
+from .dialogs.file_browser import FileBrowserDialog
 
 
 class MainWindow(QMainWindow):
@@ -26,10 +42,17 @@ class MainWindow(QMainWindow):
         self.resize(1400, 900)
         self._current_path = None
         self.recent_files = []
+        self.file_index = None
+        self.macro = None
 
         # Initialize core systems
         self.command_processor = CommandProcessor()
         self.worker_thread = None
+        self.autosave = Autosave()
+        self.command_processor.add_listener(self.autosave.on_history)
+        self._autosaved_at = 0.0
+        self.snapshots = SnapshotTracker(SnapshotStore())
+        self.command_processor.add_listener(self.snapshots.on_history)
 
         # Initialize data structures
         self.layers = []
@@ -43,11 +66,18 @@ class MainWindow(QMainWindow):
         self.setup_menus()
         self.setup_toolbar()
         self.setup_shortcuts()
+        self.setup_status_bar()
 
         # Set default state
         self.set_tool("select")
         self.update_layers_list()
 
+        # Autosave in the background; the first tick offers to recover a crashed session
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.timeout.connect(self.autosave_tick)
+        self.autosave_timer.start(AUTOSAVE_INTERVAL_MS)
+        QTimer.singleShot(0, self.offer_recovery)
+
     def setup_ui(self):
         """Set up the main user interface."""
         central = QWidget()
@@ -90,15 +120,68 @@ class MainWindow(QMainWindow):
 
         tools_group.setLayout(tools_layout)
         left_layout.addWidget(tools_group)
+
+        text_group = QGroupBox("Text")
+        text_layout = QVBoxLayout()
+        self.text_font_btn = QPushButton("Default Font")
+        self.text_font_btn.setToolTip("Choose a TrueType/OpenType font file for the text tool")
+        self.text_font_btn.clicked.connect(self.choose_text_font)
+        default_font_btn = QPushButton("Reset")
+        default_font_btn.setToolTip("Use the built-in font")
+        default_font_btn.clicked.connect(lambda: self.set_text_font(None))
+        font_layout = QHBoxLayout()
+        font_layout.addWidget(self.text_font_btn, 1)
+        font_layout.addWidget(default_font_btn)
+        text_layout.addLayout(font_layout)
+
+        self.text_size_spin = QSpinBox()
+        self.text_size_spin.setRange(MIN_TEXT_SIZE, MAX_TEXT_SIZE)
+        self.text_size_spin.setValue(DEFAULT_TEXT_SIZE)
+        self.text_size_spin.setSuffix(" px")
+        self.text_size_spin.setToolTip("Text size in pixels")
+        self.text_size_spin.valueChanged.connect(self.set_text_size)
+        text_layout.addWidget(self.text_size_spin)
+
+        text_group.setLayout(text_layout)
+        left_layout.addWidget(text_group)
         left_layout.addStretch()
 
         return left_panel
 
+    def choose_text_font(self):
+        """Ask for a font file for the text tool."""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Text Font", "", "Fonts (*.ttf *.otf *.ttc);;All Files (*)"
+        )
+        if file_path:
+            self.set_text_font(file_path)
+
+    def set_text_font(self, font_path):
+        """Set the text tool's font file; ``None`` selects the built-in font."""
+        try:
+            self.canvas.text_tool.set_font(font_path, self.text_size_spin.value())
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Could not load font: {str(e)}")
+            return
+        self.text_font_btn.setText(os.path.basename(font_path) if font_path else "Default Font")
+
+    def set_text_size(self, size):
+        """Set the text tool's size in pixels."""
+        self.canvas.text_tool.set_font(self.canvas.text_tool.font_path, size)
+
     def create_layers_panel(self):
         """Create the right layers panel."""
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
 
+        histogram_group = QGroupBox("Histogram")
+        histogram_layout = QVBoxLayout()
+        self.histogram_panel = HistogramPanel(self.canvas)
+        self.canvas.image_changed.connect(self.histogram_panel.on_image_changed)
+        histogram_layout.addWidget(self.histogram_panel)
+        histogram_group.setLayout(histogram_layout)
+        right_layout.addWidget(histogram_group)
+
         layers_group = QGroupBox("Layers")
         layers_layout = QVBoxLayout()
 
@@ -138,6 +221,10 @@ class MainWindow(QMainWindow):
         self.open_action.setShortcut(QKeySequence.StandardKey.Open)
         self.open_action.triggered.connect(self.open_file)
 
+        self.browse_action = QAction("&Browse...", self)
+        self.browse_action.setShortcut(QKeySequence("Ctrl+Shift+O"))
+        self.browse_action.triggered.connect(self.browse_files)
+
         self.save_action = QAction("&Save", self)
         self.save_action.setShortcut(QKeySequence.StandardKey.Save)
         self.save_action.triggered.connect(self.save_file)
@@ -155,6 +242,82 @@ class MainWindow(QMainWindow):
         self.redo_action.setShortcut(QKeySequence.StandardKey.Redo)
         self.redo_action.triggered.connect(self.redo)
 
+        self.take_snapshot_action = QAction("&Take Snapshot...", self)
+        self.take_snapshot_action.triggered.connect(self.take_snapshot)
+
+        self.delete_snapshots_action = QAction("&Delete Snapshots", self)
+        self.delete_snapshots_action.triggered.connect(self.delete_snapshots)
+
+        # Image actions
+        self.precision_actions = {}
+        self.precision_group = QActionGroup(self)
+        for precision, label in ((PRECISION_UINT8, "&8 Bits/Channel"),
+                                 (PRECISION_UINT16, "&16 Bits/Channel"),
+                                 (PRECISION_FLOAT32, "&32-bit Float")):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.triggered.connect(lambda checked, p=precision: self.set_precision(p))
+            self.precision_group.addAction(action)
+            self.precision_actions[precision] = action
+        self.precision_actions[PRECISION_UINT8].setChecked(True)
+
+        # Filter actions
+        self.filter_actions = []
+        # (action, label) of each operation, to mark 8-bit-only filters on deep documents
+        self.operation_actions = {}
+        for operation, label in FILTERS_CONFIG:
+            action = QAction(label, self)
+            action.triggered.connect(lambda checked, op=operation: self.apply_filter(op))
+            self.filter_actions.append(action)
+            self.operation_actions[operation] = (action, label)
+
+        self.blur_action = QAction("Gaussian &Blur...", self)
+        self.blur_action.triggered.connect(self.ask_blur)
+
+        self.smoothing_actions = []
+        for operation, label, radius in (("median", "&Median...", 3), ("bilateral", "&Surface Blur...", 8),
+                                         ("kuwahara", "&Kuwahara...", 4)):
+            action = QAction(label, self)
+            action.triggered.connect(
+                lambda checked, op=operation, title=label, r=radius: self.ask_radius_filter(op, title, r))
+            self.smoothing_actions.append(action)
+            self.operation_actions[operation] = (action, label)
+
+        self.brightness_contrast_action = QAction("&Brightness/Contrast...", self)
+        self.brightness_contrast_action.triggered.connect(self.ask_brightness_contrast)
+
+        self.levels_action = QAction("&Levels...", self)
+        self.levels_action.triggered.connect(self.ask_levels)
+
+        self.curves_action = QAction("&Curves...", self)
+        self.curves_action.triggered.connect(self.ask_curves)
+
+        self.content_aware_scale_action = QAction("Content-Aware &Scale...", self)
+        self.content_aware_scale_action.triggered.connect(self.ask_content_aware_scale)
+
+        # Macro actions
+        self.record_macro_action = QAction("&Record Macro", self)
+        self.record_macro_action.setCheckable(True)
+        self.record_macro_action.toggled.connect(self.toggle_macro_recording)
+
+        self.play_macro_action = QAction("&Play Macro", self)
+        self.play_macro_action.triggered.connect(self.play_macro)
+
+        self.save_macro_action = QAction("&Save Macro...", self)
+        self.save_macro_action.triggered.connect(self.save_macro)
+
+        self.load_macro_action = QAction("&Load Macro...", self)
+        self.load_macro_action.triggered.connect(self.load_macro)
+
+        self.batch_macro_action = QAction("Run Macro on &Folder...", self)
+        self.batch_macro_action.triggered.connect(self.run_macro_on_folder)
+        self.update_macro_actions()
+
+        # View actions
+        self.export_metrics_action = QAction("Export &Metrics...", self)
+        self.export_metrics_action.setEnabled(metrics_registry.enabled)
+        self.export_metrics_action.triggered.connect(self.export_metrics)
+
     def setup_menus(self):
         """Set up the menu bar."""
         menubar = self.menuBar()
@@ -163,6 +326,9 @@ class MainWindow(QMainWindow):
         file_menu = menubar.addMenu("&File")
         file_menu.addAction(self.new_action)
         file_menu.addAction(self.open_action)
+        file_menu.addAction(self.browse_action)
+        self.recent_menu = file_menu.addMenu("Open &Recent")
+        self.update_recent_menu()
         file_menu.addSeparator()
         file_menu.addAction(self.save_action)
         file_menu.addAction(self.save_as_action)
@@ -171,6 +337,45 @@ class MainWindow(QMainWindow):
         edit_menu = menubar.addMenu("&Edit")
         edit_menu.addAction(self.undo_action)
         edit_menu.addAction(self.redo_action)
+        edit_menu.addSeparator()
+        self.snapshot_menu = edit_menu.addMenu("S&napshots")
+        self.snapshot_menu.aboutToShow.connect(self.update_snapshot_menu)
+        self.update_snapshot_menu()
+
+        # Image menu
+        image_menu = menubar.addMenu("&Image")
+        mode_menu = image_menu.addMenu("&Mode")
+        for action in self.precision_actions.values():
+            mode_menu.addAction(action)
+        image_menu.addSeparator()
+        image_menu.addAction(self.levels_action)
+        image_menu.addAction(self.curves_action)
+        image_menu.addSeparator()
+        image_menu.addAction(self.content_aware_scale_action)
+
+        # Filter menu
+        filter_menu = menubar.addMenu("Fi&lter")
+        filter_menu.addAction(self.brightness_contrast_action)
+        filter_menu.addAction(self.blur_action)
+        for action in self.smoothing_actions:
+            filter_menu.addAction(action)
+        filter_menu.addSeparator()
+        for action in self.filter_actions:
+            filter_menu.addAction(action)
+
+        # Macro menu
+        macro_menu = menubar.addMenu("&Macro")
+        macro_menu.addAction(self.record_macro_action)
+        macro_menu.addAction(self.play_macro_action)
+        macro_menu.addSeparator()
+        macro_menu.addAction(self.save_macro_action)
+        macro_menu.addAction(self.load_macro_action)
+        macro_menu.addSeparator()
+        macro_menu.addAction(self.batch_macro_action)
+
+        # View menu
+        view_menu = menubar.addMenu("&View")
+        view_menu.addAction(self.export_metrics_action)
 
     def setup_toolbar(self):
         """Set up the toolbar."""
@@ -185,6 +390,13 @@ class MainWindow(QMainWindow):
         """Set up keyboard shortcuts."""
         pass  # Already handled in actions
 
+    def setup_status_bar(self):
+        """Set up the status bar."""
+        status_bar = self.statusBar()
+        if metrics_registry.enabled:
+            self.metrics_label = MetricsStatusLabel(self)
+            status_bar.addPermanentWidget(self.metrics_label)
+
     def set_tool(self, tool_name):
         """Set the active tool."""
         # Clear all tool button selections
@@ -212,17 +424,27 @@ class MainWindow(QMainWindow):
         """Add a new layer."""
         if hasattr(self.canvas, 'pil_image') and self.canvas.pil_image:
             # Create empty layer same size as canvas
-            new_layer = Image.new("RGBA", self.canvas.pil_image.size, (255, 255, 255, 0))
+            if self.canvas.document is not None:
+                width, height = self.canvas.pil_image.size
+                new_layer = np.zeros((height, width, 4), dtype=self.canvas.precision)
+            else:
+                new_layer = Image.new("RGBA", self.canvas.pil_image.size, (255, 255, 255, 0))
+                if self.canvas.icc_profile:
+                    new_layer.info["icc_profile"] = self.canvas.icc_profile
             self.layers.append(new_layer)
             self.layer_opacities.append(100)
             self.blend_modes.append("normal")
             self.active_layer_index = len(self.layers) - 1
+            self.autosave.layer_inserted(self.active_layer_index)
+            self.snapshots.layer_inserted(self.active_layer_index)
             self.update_layers_list()
 
     def remove_layer(self):
         """Remove the active layer."""
         if self.layers and len(self.layers) > 1:
             self.layers.pop(self.active_layer_index)
+            self.autosave.layer_removed(self.active_layer_index)
+            self.snapshots.layer_removed(self.active_layer_index)
             self.layer_opacities.pop(self.active_layer_index)
             self.blend_modes.pop(self.active_layer_index)
             self.active_layer_index = min(self.active_layer_index, len(self.layers) - 1)
@@ -239,6 +461,9 @@ class MainWindow(QMainWindow):
         if hasattr(self.canvas, 'clear'):
             self.canvas.clear()
         self._current_path = None
+        self.autosave.document_replaced()
+        self.snapshots.document_replaced()
+        self.update_precision_actions()
 
     def open_file(self):
         """Open an image file."""
@@ -250,13 +475,49 @@ class MainWindow(QMainWindow):
         )
 
         if file_path:
-            try:
-                if hasattr(self.canvas, 'load_image'):
-                    self.canvas.load_image(file_path)
-                    self._current_path = file_path
-                    self.setWindowTitle(f"PhotoPy Pro - {os.path.basename(file_path)}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not open image: {str(e)}")
+            self.open_path(file_path)
+
+    def open_path(self, file_path):
+        """Open the image at ``file_path``."""
+        try:
+            if hasattr(self.canvas, 'load_image'):
+                self.canvas.load_image(file_path)
+                self._current_path = file_path
+                self.autosave.document_replaced()
+                self.snapshots.document_replaced()
+                self.update_precision_actions()
+                self.add_recent_file(file_path)
+                self.setWindowTitle(f"PhotoPy Pro - {os.path.basename(file_path)}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not open image: {str(e)}")
+
+    def browse_files(self):
+        """Show the thumbnail browser, starting in the current file's folder."""
+        if self.file_index is None:
+            self.file_index = FileIndex()
+        recent = self._current_path or (self.recent_files[0] if self.recent_files else None)
+        directory = os.path.dirname(recent) if recent else os.path.expanduser("~")
+        dialog = FileBrowserDialog(self.file_index, directory, self)
+        dialog.file_selected.connect(self.open_path)
+        dialog.exec()
+
+    def add_recent_file(self, file_path):
+        """Move ``file_path`` to the top of the recent files list."""
+        file_path = os.path.abspath(file_path)
+        if file_path in self.recent_files:
+            self.recent_files.remove(file_path)
+        self.recent_files.insert(0, file_path)
+        del self.recent_files[RECENT_FILES_LIMIT:]
+        self.update_recent_menu()
+
+    def update_recent_menu(self):
+        """Rebuild the Open Recent menu."""
+        self.recent_menu.clear()
+        for file_path in self.recent_files:
+            action = self.recent_menu.addAction(os.path.basename(file_path))
+            action.setToolTip(file_path)
+            action.triggered.connect(lambda checked, p=file_path: self.open_path(p))
+        self.recent_menu.setEnabled(bool(self.recent_files))
 
     def save_file(self):
         """Save the current file."""
@@ -289,6 +550,253 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Could not save image: {str(e)}")
 
+    def set_precision(self, precision):
+        """Change the document precision."""
+        self.canvas.set_precision(precision)
+        self.autosave.document_replaced()
+        self.snapshots.document_replaced()
+        self.update_precision_actions()
+
+    def update_precision_actions(self):
+        """Check the current precision and mark filters that only run at 8 bits."""
+        self.precision_actions[self.canvas.precision].setChecked(True)
+        deep = self.canvas.precision != PRECISION_UINT8
+        for operation, (action, label) in self.operation_actions.items():
+            quantized = deep and operation not in DEEP_OPERATIONS
+            name, dots = (label[:-3], "...") if label.endswith("...") else (label, "")
+            action.setText(f"{name} (8-bit){dots}" if quantized else label)
+            action.setStatusTip("Runs on an 8-bit copy; the result loses the document's precision"
+                                if quantized else "")
+
+    def apply_filter(self, operation, **params):
+        """Apply a filter to the current image."""
+        precision = self.canvas.precision
+        try:
+            self.canvas.apply_operation(operation, **params)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not apply filter: {str(e)}")
+            return
+        if precision != PRECISION_UINT8 and operation not in DEEP_OPERATIONS:
+            self.statusBar().showMessage(
+                f"{operation.replace('_', ' ').capitalize()} ran at 8 bits per channel; "
+                f"the {precision} document was quantised", 8000)
+
+    def ask_blur(self):
+        """Ask for a radius and blur the image."""
+        radius, ok = QInputDialog.getDouble(self, "Gaussian Blur", "Radius:", 2.0, 0.1, 250.0, 1)
+        if ok:
+            self.apply_filter("blur", radius=radius)
+
+    def ask_radius_filter(self, operation, title, radius):
+        """Ask for a radius and apply an edge-preserving smoothing filter."""
+        title = title.replace("&", "").rstrip(".")
+        radius, ok = QInputDialog.getInt(self, title, "Radius:", radius, 1, 250)
+        if ok:
+            self.apply_filter(operation, radius=radius)
+
+    def ask_brightness_contrast(self):
+        """Ask for brightness and contrast and adjust the image."""
+        brightness, ok = QInputDialog.getInt(self, "Brightness/Contrast", "Brightness:", 0, -100, 100)
+        if not ok:
+            return
+        contrast, ok = QInputDialog.getInt(self, "Brightness/Contrast", "Contrast:", 0, -100, 100)
+        if ok:
+            self.apply_filter("brightness_contrast", brightness=brightness, contrast=contrast)
+
+    def ask_channel(self, title):
+        """Ask which channel a tone adjustment applies to; None if cancelled."""
+        labels = [channel.upper() if channel == "rgb" else channel.capitalize() for channel in LUT_CHANNELS]
+        label, ok = QInputDialog.getItem(self, title, "Channel:", labels, 0, False)
+        return LUT_CHANNELS[labels.index(label)] if ok else None
+
+    def ask_levels(self):
+        """Ask for input levels and gamma and apply a levels adjustment."""
+        channel = self.ask_channel("Levels")
+        if channel is None:
+            return
+        black, ok = QInputDialog.getInt(self, "Levels", "Input black:", 0, 0, 254)
+        if not ok:
+            return
+        white, ok = QInputDialog.getInt(self, "Levels", "Input white:", 255, black + 1, 255)
+        if not ok:
+            return
+        gamma, ok = QInputDialog.getDouble(self, "Levels", "Gamma:", 1.0, 0.1, 10.0, 2)
+        if ok:
+            self.apply_filter("levels", black=black, white=white, gamma=gamma, channel=channel)
+
+    def ask_curves(self):
+        """Ask for tone curve control points and apply them."""
+        channel = self.ask_channel("Curves")
+        if channel is None:
+            return
+        text, ok = QInputDialog.getText(self, "Curves", "Points (input:output, 0-255):",
+                                        text="0:0, 64:56, 192:200, 255:255")
+        if not ok:
+            return
+        try:
+            points = [tuple(int(value) for value in point.split(":")) for point in text.split(",")]
+            if not points or any(len(point) != 2 or not all(0 <= v <= 255 for v in point) for point in points):
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "Curves", "Enter points as input:output pairs between 0 and 255, "
+                                                "separated by commas.")
+            return
+        self.apply_filter("curves", points=points, channel=channel)
+
+    def ask_content_aware_scale(self):
+        """Ask for a new size and resize the image by seam carving."""
+        if not self.canvas.pil_image:
+            return
+        width, height = self.canvas.pil_image.size
+        new_width, ok = QInputDialog.getInt(self, "Content-Aware Scale", "Width:", width, 1, 2 * width - 1)
+        if not ok:
+            return
+        new_height, ok = QInputDialog.getInt(self, "Content-Aware Scale", "Height:", height, 1, 2 * height - 1)
+        if ok and (new_width, new_height) != (width, height):
+            # Stored relative to the size so the step replays on other images.
+            self.apply_filter("content_aware_scale", width=new_width / width, height=new_height / height)
+
+    def toggle_macro_recording(self, recording):
+        """Start or stop recording a macro."""
+        if recording:
+            self.canvas.recorder.start()
+            self.statusBar().showMessage("Recording macro...")
+        else:
+            self.macro = self.canvas.recorder.stop()
+            self.statusBar().showMessage(f"Recorded {len(self.macro)} steps", 5000)
+        self.update_macro_actions()
+
+    def update_macro_actions(self):
+        """Enable macro actions that need a macro."""
+        available = self.macro is not None and len(self.macro) > 0
+        for action in (self.play_macro_action, self.save_macro_action, self.batch_macro_action):
+            action.setEnabled(available)
+
+    def play_macro(self):
+        """Replay the current macro on the open image."""
+        try:
+            self.canvas.apply_macro(self.macro)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not play macro: {str(e)}")
+
+    def save_macro(self):
+        """Save the current macro as JSON."""
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Macro", "", "Macro (*.json)")
+        if file_path:
+            try:
+                self.macro.save(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Could not save macro: {str(e)}")
+
+    def load_macro(self):
+        """Load a macro from JSON."""
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load Macro", "", "Macro (*.json)")
+        if file_path:
+            try:
+                self.macro = Macro.load(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Could not load macro: {str(e)}")
+            self.update_macro_actions()
+
+    def run_macro_on_folder(self):
+        """Replay the current macro on every image of a folder in the background."""
+        source = QFileDialog.getExistingDirectory(self, "Images to Process")
+        if not source:
+            return
+        destination = QFileDialog.getExistingDirectory(self, "Output Folder")
+        if not destination:
+            return
+        if os.path.realpath(destination) == os.path.realpath(source):
+            QMessageBox.warning(self, "Macro", "Choose an output folder other than the source folder.")
+            return
+
+        macro = self.macro
+        self.batch_macro_action.setEnabled(False)
+        self.statusBar().showMessage("Running macro...")
+        self.worker_thread = ImageWorker(lambda: list(run_batch(macro, batch_files([source]), destination,
+                                                                 source_root=source)))
+        self.worker_thread.finished.connect(self.on_batch_finished)
+        self.worker_thread.error.connect(lambda message: QMessageBox.critical(self, "Error", message))
+        self.worker_thread.start()
+
+    def on_batch_finished(self, results):
+        """Report the outcome of a batch run."""
+        self.update_macro_actions()
+        failed = [(source, error) for source, _, error in results if error]
+        self.statusBar().showMessage(f"Processed {len(results) - len(failed)} of {len(results)} images", 5000)
+        if failed:
+            details = "\n".join(f"{os.path.basename(source)}: {error}" for source, error in failed[:10])
+            QMessageBox.warning(self, "Macro", f"{len(failed)} images failed:\n{details}")
+
+    def _document_meta(self):
+        """Path, profile and layer settings saved alongside the pixels."""
+        return {
+            "path": self._current_path,
+            "icc_profile": self.canvas.icc_profile,
+            "layer_opacities": list(self.layer_opacities),
+            "blend_modes": list(self.blend_modes),
+            "active_layer_index": self.active_layer_index,
+        }
+
+    def update_snapshot_menu(self):
+        """Rebuild the Snapshots menu for the current document."""
+        self.snapshot_menu.clear()
+        self.snapshot_menu.addAction(self.take_snapshot_action)
+        snapshots = self.snapshots.store.snapshots(self._current_path) if self.canvas.pil_image else []
+        if snapshots:
+            self.snapshot_menu.addSeparator()
+        for snapshot in snapshots:
+            created = datetime.fromtimestamp(snapshot.created).strftime("%Y-%m-%d %H:%M")
+            action = self.snapshot_menu.addAction(f"{snapshot.name} ({created})")
+            action.triggered.connect(lambda checked, s=snapshot.id: self.restore_snapshot(s))
+        self.snapshot_menu.addSeparator()
+        self.snapshot_menu.addAction(self.delete_snapshots_action)
+        self.take_snapshot_action.setEnabled(bool(self.canvas.pil_image))
+        self.delete_snapshots_action.setEnabled(bool(snapshots))
+
+    def take_snapshot(self):
+        """Store the current document as a named snapshot."""
+        if not self.canvas.pil_image:
+            return
+        count = len(self.snapshots.store.snapshots(self._current_path))
+        name, ok = QInputDialog.getText(self, "Take Snapshot", "Name:", text=f"Snapshot {count + 1}")
+        if not ok:
+            return
+        try:
+            self.snapshots.take(name, self.canvas._document_state(), self.layers, self._document_meta())
+            self.statusBar().showMessage(f"Snapshot \"{name}\" saved", 5000)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not take snapshot: {str(e)}")
+
+    def restore_snapshot(self, snapshot_id):
+        """Switch the document to a snapshot. History is cleared."""
+        try:
+            document, layers, meta = self.snapshots.restore(
+                snapshot_id, self.canvas._document_state(), self.layers)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not restore snapshot: {str(e)}")
+            return
+        self.canvas.selection_manager.clear_selection()
+        self.canvas.set_document(document, meta["icc_profile"])
+        self.layers = layers
+        self.layer_opacities = meta["layer_opacities"]
+        self.blend_modes = meta["blend_modes"]
+        self.active_layer_index = meta["active_layer_index"]
+        self.command_processor.clear()
+        self.autosave.document_replaced()
+        self.update_layers_list()
+        self.update_precision_actions()
+
+    def delete_snapshots(self):
+        """Delete every snapshot of the current document."""
+        snapshots = self.snapshots.store.snapshots(self._current_path)
+        answer = QMessageBox.question(self, "Delete Snapshots", f"Delete {len(snapshots)} snapshots?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        for snapshot in snapshots:
+            self.snapshots.store.delete(snapshot.id)
+        self.snapshots.store.collect_garbage()
+
     def undo(self):
         """Undo the last operation."""
         if hasattr(self.canvas, 'undo'):
@@ -297,4 +805,88 @@ class MainWindow(QMainWindow):
     def redo(self):
         """Redo the last undone operation."""
         if hasattr(self.canvas, 'redo'):
-            self.canvas.redo()
\ No newline at end of file
+            self.canvas.redo()
+
+    def export_metrics(self):
+        """Export recorded metrics to JSON or CSV."""
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Export Metrics",
+            "",
+            "JSON (*.json);;CSV (*.csv)"
+        )
+
+        if file_path:
+            try:
+                if file_path.lower().endswith(".csv"):
+                    metrics_registry.export_csv(file_path)
+                else:
+                    metrics_registry.export_json(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Could not export metrics: {str(e)}")
+
+    def autosave_tick(self):
+        """Save the changes since the last autosave, unless the user is busy editing.
+
+        Flushes are skipped while a mouse button is held (a stroke or drag is
+        in progress) and until the document has been idle for a moment, so
+        copying tiles never delays interactive rendering.
+        """
+        changed_at = self.autosave.last_change
+        if not self.canvas.pil_image or changed_at <= self._autosaved_at:
+            return
+        if QApplication.mouseButtons() != Qt.MouseButton.NoButton:
+            return
+        if time.monotonic() - changed_at < AUTOSAVE_IDLE_SECONDS:
+            return
+        meta = self._document_meta()
+        if self.autosave.flush(self.canvas._document_state(), self.layers, self.command_processor, meta):
+            self._autosaved_at = time.monotonic()
+
+    def offer_recovery(self):
+        """Offer to restore a session that ended without closing cleanly."""
+        for session_dir in find_sessions(self.autosave.root):
+            try:
+                session = load_session(session_dir)
+            except Exception as e:
+                # A session cut off by the crash can fail in any decoder.
+                QMessageBox.warning(self, "Recovery", f"Could not read autosaved session: {str(e)}")
+                discard_session(session_dir)
+                continue
+            name = os.path.basename(session.path) if session.path else "Untitled"
+            saved_at = datetime.fromtimestamp(session.saved_at).strftime("%Y-%m-%d %H:%M")
+            answer = QMessageBox.question(
+                self, "Recover Document",
+                f"PhotoPy Pro did not close properly. Recover \"{name}\" (autosaved {saved_at})?")
+            discard_session(session_dir)
+            if answer == QMessageBox.StandardButton.Yes:
+                try:
+                    self.restore_session(session)
+                except Exception as e:
+                    QMessageBox.warning(self, "Recovery", f"Could not restore autosaved session: {str(e)}")
+                    self.new_file()
+                    continue
+                return
+
+    def restore_session(self, session):
+        """Replace the document, layers and history with a recovered session."""
+        self.canvas.set_document(session.document, session.meta["icc_profile"])
+        self.layers = list(session.layers)
+        self.layer_opacities = session.meta["layer_opacities"]
+        self.blend_modes = session.meta["blend_modes"]
+        self.active_layer_index = session.meta["active_layer_index"]
+        self.command_processor.undo_stack[:] = session.undo_stack
+        self.command_processor.redo_stack[:] = session.redo_stack
+        self._current_path = session.path
+        self.autosave.document_replaced()
+        self.snapshots.document_replaced()
+        self.update_layers_list()
+        self.update_precision_actions()
+        name = os.path.basename(session.path) if session.path else "Untitled"
+        self.setWindowTitle(f"PhotoPy Pro - {name} (recovered)")
+
+    def closeEvent(self, event):
+        """A clean exit deletes the autosaved session."""
+        self.autosave_timer.stop()
+        self.autosave.close()
+        super().closeEvent(event)
@@ -0,0 +1,37 @@
+"""Status bar readout for the metrics registry."""
+
+from PyQt6.QtWidgets import QLabel
+from PyQt6.QtCore import QTimer
+
+from ..core.metrics import registry
+
+METRICS_REFRESH_MS = 1000
+
+
+class MetricsStatusLabel(QLabel):
+    """Shows the most recent instrumented operation in the status bar."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._latest = None
+        registry.add_listener(self._on_sample)
+
+        # Samples may arrive from worker threads, so the label is refreshed
+        # from the GUI thread on a timer instead of inside the listener.
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(METRICS_REFRESH_MS)
+
+    def _on_sample(self, sample):
+        """Remember the latest sample."""
+        self._latest = sample
+
+    def refresh(self):
+        """Update the label text from the latest sample."""
+        sample = self._latest
+        if sample is None:
+            return
+        self.setText(
+            f"{sample['operation']}: {sample['seconds'] * 1000:.1f} ms, "
+            f"{sample['peak_bytes'] / 1e6:.1f} MB, {sample['megapixels']:.1f} MP"
+        )
@@ -0,0 +1,108 @@
+"""ICC colour management.
+
+Documents keep the profile they were opened with (sRGB when none is
+embedded) and are edited in that space. Pixels are only converted when they
+are shown, using the display profile, and when a non-RGB file is opened.
+Building an LCMS transform is far more expensive than applying one, so
+transforms are cached by profile pair, rendering intent and mode.
+"""
+
+import io
+from functools import lru_cache
+
+from PIL import ImageCms
+
+RENDERING_INTENT = ImageCms.Intent.PERCEPTUAL
+SAVE_PROFILE_FORMATS = {"PNG", "JPEG", "TIFF", "WEBP"}
+TRANSFORM_CACHE_SIZE = 16
+
+
+@lru_cache(maxsize=1)
+def srgb_profile():
+    """Serialized built-in sRGB profile."""
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+
+
+@lru_cache(maxsize=1)
+def display_profile():
+    """Serialized profile of the primary display, or sRGB if it is unknown."""
+    try:
+        profile = ImageCms.get_display_profile()
+    except (ImageCms.PyCMSError, OSError):
+        profile = None
+    if profile is None:
+        return srgb_profile()
+    return profile.tobytes()
+
+
+@lru_cache(maxsize=TRANSFORM_CACHE_SIZE)
+def _profile(icc_bytes):
+    return ImageCms.ImageCmsProfile(io.BytesIO(icc_bytes))
+
+
+@lru_cache(maxsize=TRANSFORM_CACHE_SIZE)
+def get_transform(src_icc, dst_icc, intent=RENDERING_INTENT, in_mode="RGBA", out_mode="RGBA"):
+    """Cached LCMS transform between two serialized profiles."""
+    return ImageCms.buildTransform(_profile(src_icc), _profile(dst_icc), in_mode, out_mode, intent)
+
+
+def profile_color_space(icc_bytes):
+    """Colour space signature of a profile, e.g. ``"RGB"``, ``"CMYK"`` or ``"GRAY"``."""
+    return _profile(icc_bytes).profile.xcolor_space.strip()
+
+
+def profile_description(icc_bytes):
+    """Human readable name of a profile."""
+    return _profile(icc_bytes).profile.profile_description or ""
+
+
+def document_profile(icc_bytes):
+    """``icc_bytes`` if it is a readable RGB profile, otherwise sRGB."""
+    try:
+        if icc_bytes and profile_color_space(icc_bytes) == "RGB":
+            return icc_bytes
+    except (ImageCms.PyCMSError, OSError):
+        pass
+    return srgb_profile()
+
+
+def open_document(pil_img, intent=RENDERING_INTENT):
+    """Converts an opened file to an RGBA document and returns ``(image, icc_profile)``.
+
+    RGB files keep their pixel values and embedded profile. Files whose
+    profile describes another colour space (CMYK, greyscale) are converted
+    to sRGB through that profile, since documents are edited as RGBA.
+    """
+    icc = pil_img.info.get("icc_profile") or srgb_profile()
+    try:
+        color_space = profile_color_space(icc)
+    except (ImageCms.PyCMSError, OSError):
+        # Unreadable profiles are treated as untagged.
+        icc, color_space = srgb_profile(), "RGB"
+
+    if color_space != "RGB":
+        if pil_img.mode in ("CMYK", "L"):
+            transform = get_transform(icc, srgb_profile(), intent, pil_img.mode, "RGB")
+            pil_img = ImageCms.applyTransform(pil_img, transform)
+        icc = srgb_profile()
+
+    image = pil_img.convert("RGBA")
+    image.info["icc_profile"] = icc
+    return image, icc
+
+
+def to_display(pil_img, icc_profile, intent=RENDERING_INTENT):
+    """Returns ``pil_img`` converted from ``icc_profile`` to the display profile."""
+    target = display_profile()
+    if not icc_profile or icc_profile == target:
+        return pil_img
+    if pil_img.mode != "RGBA":
+        pil_img = pil_img.convert("RGBA")
+    return ImageCms.applyTransform(pil_img, get_transform(icc_profile, target, intent))
+
+
+def save_options(file_format, icc_profile):
+    """Keyword arguments that embed ``icc_profile`` when saving ``file_format``."""
+    if icc_profile and file_format in SAVE_PROFILE_FORMATS:
+        return {"icc_profile": icc_profile}
+    return {}
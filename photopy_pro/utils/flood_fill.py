@@ -0,0 +1,165 @@
+"""Flood fill engine shared by the Fill tool, the magic wand and background removal.
+
+Contiguous fills use OpenCV's scanline flood fill inside a window around
+each seed that only grows when the fill reaches its edge, so colour
+conversion and filling scale with the filled area rather than the image.
+Every seed of a multi-seed fill shares one mask, so already-filled areas are
+never revisited. Global fills select every pixel within tolerance of any
+seed colour. All results are returned as a mask cropped to the affected
+bounding box.
+"""
+
+import numpy as np
+import cv2
+
+from ..filters.blur import gaussian_blur
+
+FILL_CONTIGUOUS = "contiguous"
+FILL_GLOBAL = "global"
+COLOR_SPACE_RGB = "rgb"
+COLOR_SPACE_LAB = "lab"
+ANTIALIAS_SIGMA = 0.6
+INITIAL_FILL_WINDOW = 512
+MAX_FILL_SEEDS = 255
+
+
+def _color_array(arr, color_space):
+    """Three-channel uint8 array used for colour comparisons."""
+    if arr.ndim == 2:
+        arr = cv2.cvtColor(arr, cv2.COLOR_GRAY2RGB)
+    elif arr.shape[2] == 4:
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGBA2RGB)
+    else:
+        arr = np.ascontiguousarray(arr)
+    if color_space == COLOR_SPACE_LAB:
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2LAB)
+    if color_space != COLOR_SPACE_RGB:
+        raise ValueError(f"Unknown color space: {color_space}")
+    return arr if arr.flags.writeable else arr.copy()
+
+
+def _fill_seed(arr, padded, x, y, value, diff, base_flags, color_space):
+    """Flood fills one seed into ``padded`` with mask value ``value``.
+
+    The fill starts in a small window around the seed; if it reaches a window
+    edge that is not an image edge, the partial fill is cleared and retried in
+    a window twice as large.
+    """
+    h, w = arr.shape[:2]
+    flags = base_flags | (value << 8)
+    half = INITIAL_FILL_WINDOW // 2
+    while True:
+        x0, y0 = max(0, x - half), max(0, y - half)
+        x1, y1 = min(w, x + half), min(h, y + half)
+        colors = _color_array(arr[y0:y1, x0:x1], color_space)
+        window_mask = padded[y0:y1 + 2, x0:x1 + 2]
+        # floodFill overwrites the mask border, which here belongs to pixels
+        # outside the window, so it is restored afterwards.
+        border = (window_mask[0].copy(), window_mask[-1].copy(),
+                  window_mask[:, 0].copy(), window_mask[:, -1].copy())
+        _, _, _, (rx, ry, rw, rh) = cv2.floodFill(colors, window_mask, (x - x0, y - y0), 0,
+                                                  diff, diff, flags)
+        window_mask[0], window_mask[-1], window_mask[:, 0], window_mask[:, -1] = border
+        clipped = ((rx == 0 and x0 > 0) or (ry == 0 and y0 > 0)
+                   or (rx + rw == x1 - x0 and x1 < w) or (ry + rh == y1 - y0 and y1 < h))
+        if not clipped:
+            return x0 + rx, y0 + ry, x0 + rx + rw, y0 + ry + rh
+        region = window_mask[1:-1, 1:-1]
+        region[region == value] = 0
+        half *= 2
+
+
+def compute_fill_mask(arr, seeds, tolerance=32, mode=FILL_CONTIGUOUS, color_space=COLOR_SPACE_RGB,
+                      antialias=False, floating=False, connectivity=4):
+    """Computes the fill mask for one or more seed points.
+
+    ``tolerance`` is the maximum per-channel difference from the seed colour
+    (or from the neighbouring pixel when ``floating`` is set). Returns a
+    uint8 mask covering ``bounds`` (left, upper, right, lower), or
+    ``(None, None)`` when no seed lies inside the image.
+    """
+    h, w = arr.shape[:2]
+    seeds = [(int(x), int(y)) for x, y in seeds if 0 <= x < w and 0 <= y < h]
+    if not seeds:
+        return None, None
+
+    diff = (tolerance,) * 3
+
+    if mode == FILL_GLOBAL:
+        colors = _color_array(arr, color_space)
+        mask = np.zeros((h, w), dtype=np.uint8)
+        for x, y in seeds:
+            seed_color = colors[y, x].astype(np.int16)
+            lower = np.clip(seed_color - tolerance, 0, 255).astype(np.uint8)
+            upper = np.clip(seed_color + tolerance, 0, 255).astype(np.uint8)
+            mask |= cv2.inRange(colors, lower, upper)
+        x, y, bw, bh = cv2.boundingRect(mask)
+        if bw == 0 or bh == 0:
+            return None, None
+        bounds = (x, y, x + bw, y + bh)
+        full = mask
+    elif mode == FILL_CONTIGUOUS:
+        if len(seeds) > MAX_FILL_SEEDS:
+            raise ValueError(f"At most {MAX_FILL_SEEDS} seeds are supported")
+        # np.zeros is lazily committed, so only pages the fill touches are paid for.
+        padded = np.zeros((h + 2, w + 2), dtype=np.uint8)
+        base_flags = connectivity | cv2.FLOODFILL_MASK_ONLY
+        if not floating:
+            base_flags |= cv2.FLOODFILL_FIXED_RANGE
+        bounds = None
+        for value, (x, y) in enumerate(seeds, 1):
+            if padded[y + 1, x + 1]:
+                continue
+            rect_bounds = _fill_seed(arr, padded, x, y, value, diff, base_flags, color_space)
+            bounds = rect_bounds if bounds is None else (
+                min(bounds[0], rect_bounds[0]), min(bounds[1], rect_bounds[1]),
+                max(bounds[2], rect_bounds[2]), max(bounds[3], rect_bounds[3]))
+        full = padded[1:-1, 1:-1]
+        roi = full[bounds[1]:bounds[3], bounds[0]:bounds[2]]
+        roi[roi > 0] = 255
+    else:
+        raise ValueError(f"Unknown fill mode: {mode}")
+
+    if antialias:
+        # One extra pixel on each side receives the soft edge.
+        x0, y0 = max(0, bounds[0] - 1), max(0, bounds[1] - 1)
+        x1, y1 = min(w, bounds[2] + 1), min(h, bounds[3] + 1)
+        bounds = (x0, y0, x1, y1)
+        hard = full[y0:y1, x0:x1]
+        mask = np.maximum(hard, gaussian_blur(hard, ANTIALIAS_SIGMA))
+    else:
+        mask = full[bounds[1]:bounds[3], bounds[0]:bounds[2]].copy()
+    return mask, bounds
+
+
+def fill_region(arr, mask, bounds, color):
+    """Returns the filled RGBA patch for ``bounds`` given a coverage mask.
+
+    A fully transparent ``color`` erases: only alpha is reduced, so colour
+    information at soft edges is kept.
+    """
+    x0, y0, x1, y1 = bounds
+    patch = arr[y0:y1, x0:x1].copy()
+    inverse = cv2.bitwise_not(mask)
+
+    if color[3] == 0:
+        patch[..., 3] = cv2.multiply(patch[..., 3], inverse, scale=1 / 255)
+        return patch
+
+    # patch * (1 - coverage) + color * coverage, in saturating 8-bit steps
+    kept = cv2.multiply(patch, cv2.merge([inverse] * 4), scale=1 / 255)
+    painted = cv2.multiply(cv2.merge([mask] * 4), tuple(float(c) for c in color), scale=1 / 255)
+    return cv2.add(kept, painted)
+
+
+def flood_fill(arr, seeds, color, tolerance=32, mode=FILL_CONTIGUOUS, color_space=COLOR_SPACE_RGB,
+               antialias=True):
+    """Fills from ``seeds`` and returns ``(patch, bounds)`` for the changed area.
+
+    ``arr`` must be an RGBA uint8 array; it is not modified. Returns
+    ``(None, None)`` if nothing was filled.
+    """
+    mask, bounds = compute_fill_mask(arr, seeds, tolerance, mode, color_space, antialias)
+    if mask is None:
+        return None, None
+    return fill_region(arr, mask, bounds, color), bounds
@@ -0,0 +1,161 @@
+"""Document precision (bit depth) utilities.
+
+Documents are RGBA at one of three precisions: 8-bit, 16-bit integer or
+32-bit float with a nominal 0..1 range. 8-bit documents keep using PIL
+images throughout; deeper documents are held as NumPy arrays and only
+reduced to 8-bit for display, for tools that sample the displayed image and
+for file formats that cannot store more.
+"""
+
+import numpy as np
+import cv2
+from PIL import Image
+
+PRECISION_UINT8 = "uint8"
+PRECISION_UINT16 = "uint16"
+PRECISION_FLOAT32 = "float32"
+PRECISIONS = (PRECISION_UINT8, PRECISION_UINT16, PRECISION_FLOAT32)
+
+PRECISION_MAX = {
+    PRECISION_UINT8: 255,
+    PRECISION_UINT16: 65535,
+    PRECISION_FLOAT32: 1.0,
+}
+
+# Float documents evaluate lookup tables by interpolating this many samples.
+FLOAT_LUT_SIZE = 4096
+
+# PIL modes of single-channel images deeper than 8 bits.
+DEEP_MODES = ("I;16", "I;16B", "I;16L", "I;16N", "I", "F")
+
+# TIFF tag holding the bits of each sample.
+TIFF_BITS_PER_SAMPLE = 258
+
+# Precisions each format can store, deepest first.
+HIGH_BIT_FORMATS = {
+    "PNG": (PRECISION_UINT16,),
+    "TIFF": (PRECISION_FLOAT32, PRECISION_UINT16),
+}
+
+
+def precision_of(image):
+    """Precision name of a PIL image or RGBA array."""
+    if isinstance(image, Image.Image):
+        return PRECISION_UINT8
+    precision = str(image.dtype)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision: {precision}")
+    return precision
+
+
+def image_size(image):
+    """(width, height) of a PIL image or array."""
+    if isinstance(image, Image.Image):
+        return image.size
+    return image.shape[1], image.shape[0]
+
+
+def lut_size(precision):
+    """Number of entries in a lookup table for ``precision``."""
+    if precision == PRECISION_FLOAT32:
+        return FLOAT_LUT_SIZE
+    return PRECISION_MAX[precision] + 1
+
+
+def convert_precision(arr, precision):
+    """Returns ``arr`` rescaled to ``precision`` (``arr`` itself if it already matches)."""
+    source = precision_of(arr)
+    if source == precision:
+        return arr
+    if precision == PRECISION_FLOAT32:
+        out = arr.astype(np.float32)
+        out *= 1.0 / PRECISION_MAX[source]
+        return out
+    if source == PRECISION_UINT8:
+        out = arr.astype(np.uint16)
+        out *= 257
+        return out
+    if source == PRECISION_UINT16:
+        return cv2.convertScaleAbs(arr, alpha=1 / 257)
+    # Float to integer: clip to the nominal range and round.
+    scale = PRECISION_MAX[precision]
+    out = np.clip(arr, 0.0, 1.0) * scale
+    np.rint(out, out=out)
+    return out.astype(precision)
+
+
+def to_display_image(arr):
+    """8-bit RGBA PIL image of a document array."""
+    return Image.fromarray(convert_precision(arr, PRECISION_UINT8), "RGBA")
+
+
+def to_document(image, precision):
+    """Converts a PIL image or document array to a document at ``precision``.
+
+    8-bit documents are PIL images; deeper ones are arrays.
+    """
+    if isinstance(image, Image.Image):
+        if precision == PRECISION_UINT8:
+            return image
+        return convert_precision(np.asarray(image.convert("RGBA")), precision)
+    if precision == PRECISION_UINT8:
+        return to_display_image(image)
+    return convert_precision(image, precision)
+
+
+def _has_deep_samples(header):
+    """Whether a lazily opened PIL image stores more than 8 bits per sample."""
+    if header.mode in DEEP_MODES:
+        return True
+    bits = getattr(header, "tag_v2", {}).get(TIFF_BITS_PER_SAMPLE)
+    if bits:
+        return max(bits) > 8
+    # PNG opens 16-bit colour as RGB/RGBA; the depth is only in the raw mode.
+    for tile in header.tile:
+        rawmode = tile[-1] if isinstance(tile[-1], str) else tile[-1][0]
+        if ";16" in rawmode:
+            return True
+    return False
+
+
+def read_image(file_path):
+    """Reads a deep image as an RGBA array at its native precision.
+
+    The bit depth is taken from the PIL header, so 8-bit files are never
+    decoded here. Returns None for them (they are loaded through PIL) and for
+    files OpenCV cannot read.
+    """
+    try:
+        with Image.open(file_path) as header:
+            if not _has_deep_samples(header):
+                return None
+    except (OSError, ValueError):
+        pass  # e.g. float RGB TIFF, which PIL cannot identify
+    arr = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+    if arr is None or arr.dtype == np.uint8:
+        return None
+    if arr.dtype == np.float64:
+        arr = arr.astype(np.float32)
+    if str(arr.dtype) not in PRECISIONS:
+        return None
+    if arr.ndim == 2:
+        return cv2.cvtColor(arr, cv2.COLOR_GRAY2RGBA)
+    if arr.shape[2] == 3:
+        return cv2.cvtColor(arr, cv2.COLOR_BGR2RGBA)
+    return cv2.cvtColor(arr, cv2.COLOR_BGRA2RGBA)
+
+
+def write_image(file_path, arr, file_format):
+    """Writes ``arr`` at the deepest precision ``file_format`` supports.
+
+    Returns False without writing if the format has no high-bit support, so
+    the caller can fall back to an 8-bit save.
+    """
+    supported = HIGH_BIT_FORMATS.get(file_format, ())
+    if not supported:
+        return False
+    if precision_of(arr) not in supported:
+        arr = convert_precision(arr, supported[-1])
+    if not cv2.imwrite(file_path, cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)):
+        raise OSError(f"Could not write {file_path}")
+    return True
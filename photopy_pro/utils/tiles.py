@@ -0,0 +1,99 @@
+"""Tile grid helpers for processing and storing large images in bounded memory."""
+
+import zlib
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_TILE_SIZE = 1024
+TILE_ZLIB_LEVEL = 1
+
+
+def iter_tiles(width, height, tile_size=DEFAULT_TILE_SIZE):
+    """Yield (x0, y0, x1, y1) rectangles covering an image in row-major order."""
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)
+
+
+def expand_rect(rect, margin, width, height):
+    """Grow a rectangle by ``margin`` on every side, clipped to the image."""
+    x0, y0, x1, y1 = rect
+    return max(0, x0 - margin), max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin)
+
+
+def tiles_in_rect(rect, tile_size=DEFAULT_TILE_SIZE):
+    """Yield (column, row) indices of the tiles a rectangle touches."""
+    x0, y0, x1, y1 = rect
+    for ty in range(y0 // tile_size, (y1 - 1) // tile_size + 1):
+        for tx in range(x0 // tile_size, (x1 - 1) // tile_size + 1):
+            yield tx, ty
+
+
+def tile_rect(tx, ty, width, height, tile_size=DEFAULT_TILE_SIZE):
+    """Pixel rectangle of tile (``tx``, ``ty``), clipped to the image."""
+    x0, y0 = tx * tile_size, ty * tile_size
+    return x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)
+
+
+class DirtyTiles:
+    """Tiles changed since they were last taken, per key (such as a layer)."""
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE):
+        self.tile_size = tile_size
+        self._tiles = {}
+
+    def mark(self, key, rect):
+        """Mark the tiles of ``key`` that ``rect`` touches."""
+        if rect[2] > rect[0] and rect[3] > rect[1]:
+            self._tiles.setdefault(key, set()).update(tiles_in_rect(rect, self.tile_size))
+
+    def mark_all(self, key, width, height):
+        """Mark every tile of a ``width`` x ``height`` image."""
+        self.mark(key, (0, 0, width, height))
+
+    def discard(self, key):
+        """Forget the tiles of ``key``."""
+        self._tiles.pop(key, None)
+
+    def take(self):
+        """Return ``{key: set of (tx, ty)}`` and clear the tracker."""
+        tiles, self._tiles = self._tiles, {}
+        return tiles
+
+    def __len__(self):
+        return sum(len(tiles) for tiles in self._tiles.values())
+
+
+def tile_bytes(image, rect):
+    """Raw pixels of one tile of a PIL image or document array."""
+    if isinstance(image, Image.Image):
+        return image.crop(rect).tobytes()
+    x0, y0, x1, y1 = rect
+    return np.ascontiguousarray(image[y0:y1, x0:x1])
+
+
+def pack_tile(tile, level=TILE_ZLIB_LEVEL):
+    """Compressed tile; deep samples are split into byte planes first."""
+    if isinstance(tile, np.ndarray):
+        if tile.itemsize > 1:
+            tile = tile.view(np.uint8).reshape(-1, tile.itemsize).T
+        tile = np.ascontiguousarray(tile).tobytes()
+    return zlib.compress(tile, level)
+
+
+def unpack_tile(data, rect, dtype):
+    """Inverse of ``pack_tile``: an (h, w, 4) array."""
+    x0, y0, x1, y1 = rect
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    if dtype.itemsize > 1:
+        raw = np.ascontiguousarray(raw.reshape(dtype.itemsize, -1).T)
+    return raw.view(dtype).reshape(y1 - y0, x1 - x0, 4)
+
+
+def image_info(image):
+    """(width, height, dtype name) of an image; PIL images are 8-bit RGBA."""
+    if isinstance(image, Image.Image):
+        return image.width, image.height, "uint8"
+    return image.shape[1], image.shape[0], str(image.dtype)
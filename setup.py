@@ -21,17 +21,16 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
         "Programming Language :: Python :: 3.11",
         "Topic :: Multimedia :: Graphics :: Editors",
     ],
-    python_requires=">=3.8",
+    python_requires=">=3.9",
     install_requires=[
         "numpy>=1.21.0",
         "opencv-python>=4.5.0",
-        "Pillow>=8.0.0",
+        "Pillow>=10.1.0",
         "PyQt6>=6.0.0",
     ],
     entry_points={
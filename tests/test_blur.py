@@ -0,0 +1,47 @@
+"""Accuracy of the Gaussian blur engine against ``cv2.GaussianBlur``."""
+
+from unittest import mock
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import make_fixture
+from photopy_pro.filters import blur
+
+# Error bounds stated in the blur module docstring, in 8-bit levels.
+MAX_MEAN_ERROR = 1.0
+MAX_ERROR = 8
+
+SIGMAS = {
+    "_blur_direct": (0.5, 1.5, 3.0, blur.DIRECT_MAX_SIGMA),
+    "_blur_box_cascade": (4.5, 8.0, 16.0, blur.BOX_MAX_SIGMA),
+    "_blur_pyramid": (32.0, 64.0, 128.0),
+}
+CASES = [(strategy, sigma) for strategy, sigmas in SIGMAS.items() for sigma in sigmas]
+
+
+@pytest.fixture(scope="module")
+def photo():
+    """1 MP photographic RGB content, as used by the benchmarks."""
+    return np.ascontiguousarray(np.asarray(make_fixture("photo", 1))[..., :3])
+
+
+@pytest.mark.parametrize("strategy, sigma", CASES, ids=[f"{s.strip('_')}-{sigma}" for s, sigma in CASES])
+def test_matches_opencv_gaussian(photo, strategy, sigma):
+    with mock.patch.object(blur, strategy, wraps=getattr(blur, strategy)) as used:
+        out = blur.gaussian_blur(photo, sigma)
+    used.assert_called()
+
+    expected = cv2.GaussianBlur(photo, (0, 0), sigma, borderType=cv2.BORDER_REFLECT_101)
+    error = np.abs(out.astype(np.int16) - expected)
+    assert out.shape == photo.shape
+    assert out.dtype == photo.dtype
+    assert error.mean() < MAX_MEAN_ERROR
+    assert error.max() < MAX_ERROR
+
+
+def test_zero_sigma_copies(photo):
+    out = blur.gaussian_blur(photo, 0)
+    assert out is not photo
+    assert np.array_equal(out, photo)
@@ -0,0 +1,99 @@
+"""8-bit filter kernels against the float implementations they replaced.
+
+The references below are the original float versions. The kernels must
+match them within one level of rounding and reach at most half of their
+traced peak allocation (they measure 3-5x lower).
+"""
+
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from photopy_pro.filters import basic
+
+SIZE = (1000, 750)
+
+
+@pytest.fixture(scope="module")
+def image():
+    """A gradient with noise, so every kernel sees a spread of levels."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:SIZE[1], 0:SIZE[0]]
+    base = np.stack([x * 255 / SIZE[0], y * 255 / SIZE[1], (x + y) * 255 / sum(SIZE)], axis=-1)
+    rgb = np.clip(base + rng.normal(0, 24, base.shape), 0, 255).astype(np.uint8)
+    return Image.fromarray(rgb).convert("RGBA")
+
+
+def reference_brightness_contrast(pil_img, brightness, contrast):
+    arr = np.array(pil_img.convert("RGBA"), dtype=np.float32)
+    arr[..., :3] += brightness * 2.55
+    f = 131 * (contrast + 127) / (127 * (131 - contrast)) if contrast != -127 else 0
+    arr[..., :3] = (arr[..., :3] - 127.5) * f + 127.5
+    arr = np.clip(arr, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr, "RGBA")
+
+
+def reference_saturation(pil_img, saturation):
+    arr = np.array(pil_img.convert("HSV"))
+    arr[:, :, 1] = np.clip(arr[:, :, 1] * (1 + saturation / 100), 0, 255).astype(np.uint8)
+    return Image.fromarray(arr, "HSV").convert("RGBA")
+
+
+def reference_sepia(pil_img):
+    arr = np.array(pil_img.convert("RGB"), dtype=np.float32)
+    r = arr[..., 0] * 0.393 + arr[..., 1] * 0.769 + arr[..., 2] * 0.189
+    g = arr[..., 0] * 0.349 + arr[..., 1] * 0.686 + arr[..., 2] * 0.168
+    b = arr[..., 0] * 0.272 + arr[..., 1] * 0.534 + arr[..., 2] * 0.131
+    arr[..., 0] = np.clip(r, 0, 255)
+    arr[..., 1] = np.clip(g, 0, 255)
+    arr[..., 2] = np.clip(b, 0, 255)
+    return Image.fromarray(arr.astype(np.uint8)).convert("RGBA")
+
+
+def reference_edge_detection(pil_img):
+    gray_arr = np.array(pil_img.convert("L"))
+    sobel_x = cv2.Sobel(gray_arr, cv2.CV_64F, 1, 0, ksize=3)
+    sobel_y = cv2.Sobel(gray_arr, cv2.CV_64F, 0, 1, ksize=3)
+    magnitude = np.sqrt(sobel_x**2 + sobel_y**2)
+    magnitude = magnitude / magnitude.max() * 255 if magnitude.max() > 0 else magnitude
+    magnitude = 255 - magnitude.astype(np.uint8)
+    return Image.fromarray(magnitude).convert("RGBA")
+
+
+CASES = [
+    ("brightness_contrast", basic.apply_brightness_contrast, reference_brightness_contrast, (20, 35)),
+    ("darken", basic.apply_brightness_contrast, reference_brightness_contrast, (-30, -40)),
+    ("saturation", basic.apply_saturation, reference_saturation, (60,)),
+    ("sepia", basic.apply_sepia, reference_sepia, ()),
+    ("edge_detection", basic.edge_detection, reference_edge_detection, ()),
+]
+
+
+def _traced_peak(fn, *args):
+    """Peak bytes allocated while ``fn`` runs, and its result."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        return tracemalloc.get_traced_memory()[1] - start, result
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize("name, kernel, reference, args", CASES, ids=[case[0] for case in CASES])
+def test_output_within_one_level(image, name, kernel, reference, args):
+    out = np.asarray(kernel(image, *args), dtype=np.int16)
+    expected = np.asarray(reference(image, *args), dtype=np.int16)
+    assert out.shape == expected.shape
+    assert np.abs(out - expected).max() <= 1
+
+
+@pytest.mark.parametrize("name, kernel, reference, args", CASES, ids=[case[0] for case in CASES])
+def test_peak_memory_half_of_float_version(image, name, kernel, reference, args):
+    kernel_peak, _ = _traced_peak(kernel, image, *args)
+    reference_peak, _ = _traced_peak(reference, image, *args)
+    assert kernel_peak * 2 <= reference_peak
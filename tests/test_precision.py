@@ -0,0 +1,45 @@
+"""Reading files at their native precision."""
+
+from unittest import mock
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from photopy_pro.utils import precision
+
+
+def _samples(dtype, channels):
+    rng = np.random.default_rng(0)
+    if dtype == np.float32:
+        arr = rng.random((8, 8, channels), dtype=np.float32)
+    else:
+        arr = rng.integers(0, np.iinfo(dtype).max, (8, 8, channels), dtype=dtype)
+    return arr[..., 0] if channels == 1 else arr
+
+
+@pytest.mark.parametrize("name, dtype, channels", [
+    ("rgba.png", np.uint16, 4),
+    ("rgb.png", np.uint16, 3),
+    ("gray.png", np.uint16, 1),
+    ("rgb.tif", np.uint16, 3),
+    ("gray.tif", np.uint16, 1),
+    ("rgb.tif", np.float32, 3),
+    ("gray.tif", np.float32, 1),
+])
+def test_deep_files_keep_their_precision(tmp_path, name, dtype, channels):
+    path = str(tmp_path / name)
+    cv2.imwrite(path, _samples(dtype, channels))
+    arr = precision.read_image(path)
+    assert arr.dtype == dtype
+    assert arr.shape == (8, 8, 4)
+
+
+@pytest.mark.parametrize("name", ["rgb.png", "rgb.tif", "rgb.jpg"])
+def test_8_bit_files_are_not_decoded_by_opencv(tmp_path, name):
+    path = str(tmp_path / name)
+    Image.new("RGB", (8, 8), "red").save(path)
+    with mock.patch.object(precision.cv2, "imread") as imread:
+        assert precision.read_image(path) is None
+    imread.assert_not_called()
@@ -0,0 +1,98 @@
+"""Localhost tests of the render service."""
+
+import asyncio
+import http.client
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import pytest
+from PIL import Image
+
+from photopy_pro.service.server import RenderService
+
+RENDER_TIMEOUT = 2.0
+QUEUE_TIMEOUT = 0.3
+
+
+@pytest.fixture(scope="module")
+def service():
+    """One worker, so two slow renders fill both request slots."""
+    service = RenderService("127.0.0.1", 0, max_workers=1, timeout=RENDER_TIMEOUT, queue_timeout=QUEUE_TIMEOUT)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(service.start(), loop).result()
+    yield service
+    asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def _png(size=(64, 48), color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _request(service, method, path, body=None, operations=None):
+    """Status and body of one request."""
+    if operations is not None:
+        path += "?" + urlencode({"operations": json.dumps(operations)})
+    connection = http.client.HTTPConnection("127.0.0.1", service.port, timeout=30)
+    try:
+        connection.request(method, path, body, {"Content-Type": "image/png"} if body else {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def _slow(service):
+    # Oil painting is a per-pixel Python filter: several seconds at this size.
+    noise = io.BytesIO()
+    Image.effect_noise((200, 200), 50).convert("RGB").save(noise, format="PNG")
+    return _request(service, "POST", "/render", noise.getvalue(), [{"operation": "oil_painting"}])
+
+
+def test_render_returns_the_result(service):
+    status, body = _request(service, "POST", "/render", _png(), [{"operation": "invert"}])
+    assert status == 200
+    result = Image.open(io.BytesIO(body))
+    assert result.size == (64, 48)
+    assert result.convert("RGB").getpixel((0, 0)) == (0, 255, 255)
+
+
+@pytest.mark.parametrize("operations", [
+    [{"operation": "no_such_operation"}],
+    [{"operation": ["invert"]}],
+    [{"operation": "blend", "params": {"layer": ["unhashable"]}}],
+    [{"operation": "brightness_contrast", "params": {"unknown": 1}}],
+])
+def test_invalid_requests_are_rejected(service, operations):
+    status, body = _request(service, "POST", "/render", _png(), operations)
+    assert status == 400
+    assert "error" in json.loads(body)
+
+
+def test_missing_image_is_rejected(service):
+    status, _ = _request(service, "POST", "/render", None, [])
+    assert status == 400
+
+
+def test_full_queue_and_deadline(service):
+    with ThreadPoolExecutor(2) as pool:
+        slow = [pool.submit(_slow, service) for _ in range(2)]
+        time.sleep(QUEUE_TIMEOUT + 0.5)
+        assert _request(service, "POST", "/render", _png(), [{"operation": "invert"}])[0] == 503
+        assert [future.result()[0] for future in slow] == [504, 504]
+
+    # Timed-out renders are killed, so the slots and the worker are free again.
+    status, body = _request(service, "GET", "/health")
+    assert status == 200 and json.loads(body)["in_flight"] == 0
+    start = time.perf_counter()
+    assert _request(service, "POST", "/render", _png(), [{"operation": "invert"}])[0] == 200
+    assert time.perf_counter() - start < RENDER_TIMEOUT
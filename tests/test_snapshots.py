@@ -0,0 +1,25 @@
+"""Garbage collection of the snapshot tile store."""
+
+import os
+
+import numpy as np
+
+from photopy_pro.core.snapshots import SnapshotStore
+
+
+def _tile(value):
+    return np.full((4, 4, 4), value, dtype=np.uint8)
+
+
+def test_collect_garbage_skips_unreadable_manifests(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    for key, value in (("aa01", 1), ("bb02", 2)):
+        store.put(key, _tile(value))
+    store.save_manifest({"name": "kept", "created": 0, "path": None, "images": [{"tiles": ["aa01"]}]})
+    with open(os.path.join(store.manifests_dir, "broken.json"), "w", encoding="utf-8") as fh:
+        fh.write('{"images": [')
+
+    assert store.collect_garbage() == 1
+    assert store.has("aa01")
+    assert not store.has("bb02")
+    assert [snapshot.name for snapshot in store.snapshots()] == ["kept"]